@@ -0,0 +1,208 @@
+import email.utils
+import logging
+import os
+import re
+import time
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dateutil import parser as date_parser
+from cache import search_cache, search_key
+from dedupe import normalize_url, TitleIndex
+from news import convert_relative_date
+from resources import get_session
+from serpapi import serpapi_search
+from telemetry import span
+from ratelimit import http_get
+
+# Search fan-out: one query sent to several engines at once, merged into one result list.
+#
+# Each backend is a function (query, num, secrets) -> list of result dicts shaped like SerpAPI's
+# organic_results (title, link, snippet, date). aggregate_search() runs the chosen backends in
+# parallel and merges whatever has arrived when the deadline hits; slower backends keep running
+# in the background and fill the search cache for the next identical search. Results are
+# deduplicated by normalized URL and near-duplicate title (the first engine listed wins, and a
+# duplicate can still contribute the date its twin lacked), then ranked newest first; results
+# without a usable date follow in the order the engines returned them. Backends are registered
+# by name with register_search_backend(), so tests can swap in local stubs.
+
+SEARCH_DEADLINE_SECONDS = float(os.environ.get("SPOTLIGHT_SEARCH_DEADLINE", 8))
+DEFAULT_ENGINES = [name.strip() for name in os.environ.get("SPOTLIGHT_SEARCH_ENGINES", "google").split(",") if name.strip()]
+# Comma-separated RSS/Atom feed URLs searched by the "rss" backend
+RSS_FEEDS = [url.strip() for url in os.environ.get("SPOTLIGHT_RSS_FEEDS", "").split(",") if url.strip()]
+
+ATOM_NS = "{http://www.w3.org/2005/Atom}"
+QUERY_WORD_PATTERN = re.compile(r"\w+")
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+_backends = {}
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+
+
+# Function to register a search backend under a name
+def register_search_backend(name, backend):
+    _backends[name] = backend
+
+# Function to list the registered backend names
+def search_backends():
+    return list(_backends)
+
+
+# Function to turn a result's date ("3 hours ago", an RSS pubDate, "10/14/2026, 07:00 AM") into YYYY-MM-DD, or None
+def published_date(date_str):
+    if not date_str:
+        return None
+    exact_date = convert_relative_date(date_str)
+    if exact_date:
+        return exact_date
+    try:
+        return email.utils.parsedate_to_datetime(date_str).strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        pass
+    try:
+        return date_parser.parse(date_str.replace(" UTC", "")).strftime("%Y-%m-%d")
+    except (ValueError, OverflowError):
+        return None
+
+# Function to merge per-engine result lists (in engine priority order) into one deduplicated, ranked list
+def merge_results(result_lists):
+    merged = []
+    seen_urls = {}
+    titles = TitleIndex()
+    for engine, items in result_lists:
+        for position, item in enumerate(items):
+            if not item.get("link"):
+                continue
+            key = normalize_url(item["link"])
+            duplicate = seen_urls.get(key)
+            if duplicate is None:
+                duplicate = titles.find(item.get("title", ""))
+            if duplicate is not None:
+                kept = merged[duplicate]
+                if not kept.get("date") and item.get("date"):
+                    kept["date"] = item["date"]
+                seen_urls.setdefault(key, duplicate)
+                continue
+            seen_urls[key] = len(merged)
+            titles.add(item.get("title", ""), len(merged))
+            merged.append({**{name: value for name, value in item.items() if value is not None}, "engine": engine, "_position": position})
+
+    # Newest day first, undated results last; within a day the engines are interleaved by rank
+    # (both sorts are stable, so the second keeps the order of the first among equal days)
+    merged.sort(key=lambda item: item["_position"])
+    merged.sort(key=lambda item: published_date(item.get("date")) or "", reverse=True)
+    for position, item in enumerate(merged, 1):
+        del item["_position"]
+        item["position"] = position
+    return merged
+
+# Function to search several engines in parallel and merge what has arrived by the deadline.
+# Returns a SerpAPI-shaped dict: organic_results plus search_metadata["engines"], which maps each
+# engine to "ok", "timeout" or the error's type. Raises the first error if every engine failed.
+def aggregate_search(query, num, secrets, engines=None, deadline=SEARCH_DEADLINE_SECONDS):
+    engines = [engine for engine in (engines or DEFAULT_ENGINES) if engine in _backends]
+    with span("search_fanout", engines=len(engines), arrived=0, results=0) as attrs:
+        futures = {_executor.submit(_backends[engine], query, num, secrets): engine for engine in engines}
+        end = time.monotonic() + deadline
+        pending = set(futures)
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            _, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+        statuses, result_lists, errors = {}, [], []
+        for future, engine in futures.items():
+            if future in pending:
+                statuses[engine] = "timeout"
+                continue
+            try:
+                result_lists.append((engine, future.result()))
+                statuses[engine] = "ok"
+            except Exception as e:
+                logging.warning(f"Search engine {engine} failed: {type(e).__name__}")
+                statuses[engine] = type(e).__name__
+                errors.append(e)
+        if errors and len(errors) == len(futures):
+            raise errors[0]
+        attrs["arrived"] = len(result_lists)
+        results = merge_results(result_lists)
+        attrs["results"] = len(results)
+    return {"organic_results": results[:num], "search_metadata": {"engines": statuses}}
+
+
+# Backend: Google web results through SerpAPI
+def google_backend(query, num, secrets):
+    result = serpapi_search({"engine": "google", "q": query, "num": num, "api_key": secrets["serpapi_api_key"]})
+    return result.get("organic_results", [])
+
+# Backend: Google News through SerpAPI; top stories come grouped, so their stories are flattened
+def google_news_backend(query, num, secrets):
+    result = serpapi_search({"engine": "google_news", "q": query, "api_key": secrets["serpapi_api_key"]})
+    items = []
+    for news in result.get("news_results", result.get("organic_results", [])):
+        for story in [news] + news.get("stories", []):
+            if story.get("link"):
+                source = story.get("source")
+                items.append({
+                    "title": story.get("title", ""),
+                    "link": story["link"],
+                    "snippet": story.get("snippet") or (source.get("name") if isinstance(source, dict) else source) or "",
+                    "date": story.get("date"),
+                })
+    return items[:num]
+
+# Backend: Bing News through SerpAPI
+def bing_news_backend(query, num, secrets):
+    result = serpapi_search({"engine": "bing_news", "q": query, "count": num, "api_key": secrets["serpapi_api_key"]})
+    return result.get("organic_results", [])[:num]
+
+# Function to fetch and parse one RSS or Atom feed into result dicts, cached like search results
+def load_feed(url):
+    key = search_key("rss", url)
+    items = search_cache.get(key)
+    if items is not None:
+        return items
+    response = http_get(get_session("articles"), url)
+    response.raise_for_status()
+    root = ElementTree.fromstring(response.content)
+    items = []
+    for entry in root.iter("item"):
+        items.append({
+            "title": (entry.findtext("title") or "").strip(),
+            "link": (entry.findtext("link") or "").strip(),
+            "snippet": TAG_PATTERN.sub("", entry.findtext("description") or "").strip(),
+            "date": entry.findtext("pubDate"),
+        })
+    for entry in root.iter(f"{ATOM_NS}entry"):
+        link = entry.find(f"{ATOM_NS}link")
+        items.append({
+            "title": (entry.findtext(f"{ATOM_NS}title") or "").strip(),
+            "link": link.get("href", "") if link is not None else "",
+            "snippet": TAG_PATTERN.sub("", entry.findtext(f"{ATOM_NS}summary") or "").strip(),
+            "date": entry.findtext(f"{ATOM_NS}updated") or entry.findtext(f"{ATOM_NS}published"),
+        })
+    search_cache.set(key, items)
+    return items
+
+# Backend: entries of the configured RSS feeds that mention every word of the query
+def rss_backend(query, num, secrets):
+    words = set(QUERY_WORD_PATTERN.findall(query.lower()))
+    matches = []
+    for url in RSS_FEEDS:
+        try:
+            items = load_feed(url)
+        except Exception as e:
+            logging.warning(f"RSS feed {url} failed: {type(e).__name__}")
+            continue
+        for item in items:
+            text = f"{item['title']} {item['snippet']}".lower()
+            if words and words <= set(QUERY_WORD_PATTERN.findall(text)):
+                matches.append(item)
+    return matches[:num]
+
+
+register_search_backend("google", google_backend)
+register_search_backend("google_news", google_news_backend)
+register_search_backend("bing_news", bing_news_backend)
+if RSS_FEEDS:
+    register_search_backend("rss", rss_backend)
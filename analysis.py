@@ -0,0 +1,326 @@
+import streamlit as st
+import requests
+import logging
+import re
+import html
+from serpapi import serpapi_search
+from resources import get_openai_client
+from jobs import register_job_handler
+from telemetry import timed, span
+from ratelimit import call_with_retry
+from retrieval import collect_passages, build_context, CONTEXT_TOKEN_BUDGET
+from cascade import run_cascade, answer_problems, AUTO_MODEL, CASCADE_MODELS
+from digest import count_tokens
+
+# Answer returned by ask_gpt when the model call fails
+GPT_ERROR_ANSWER = "An error occurred while processing the request."
+
+# Token kinds produced by parse_answer
+TEXT = "text"
+CITATION = "citation"
+LINE_BREAK = "break"
+
+# One alternation so an answer is cleaned and tokenized in a single scan. Runs of ordinary
+# characters are consumed first so the other branches are only tried at special characters;
+# characters no branch matches (a lone "." or "*") are kept as they are.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<plain>[\w\t\r\f\v ,;:!?\]()"-]+)
+  | (?P<citation>\[\d+\])
+  | (?P<newline>\n)
+  | (?P<stars>\*{2,})
+  | (?P<dots_capital>\.+(?=[A-Z]))
+  | (?P<dots>\.{2,})
+  | (?P<entity>&(?:\#\d+|\#[xX][0-9a-fA-F]+|[A-Za-z][A-Za-z0-9]*);?)
+  | (?P<disallowed>[^\w\s.,;:!?*\[\]()"-])
+""", re.VERBOSE)
+CITATION_PATTERN = re.compile(r"\[\d+\]")
+DISALLOWED_PATTERN = re.compile(r'[^\w\s.,;:!?*\[\]()"-]')
+
+# Function to perform a Google search query using SerpAPI
+def search_query(query, api_key):
+    try:
+        params = {
+            "engine": "google",
+            "q": query,
+            "api_key": api_key
+        }
+        return serpapi_search(params)
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error during search: {e}")
+        logging.error(f"Error during search: {e}", exc_info=True)
+        return None
+
+# Function to extract relevant information from the search results
+def extract_relevant_info(search_results):
+    if search_results is None:
+        return "", [], {}
+    
+    snippets = []
+    links = []
+    citations = {}
+    
+    for index, result in enumerate(search_results.get('organic_results', []), 1):
+        snippet = result.get('snippet')
+        link = result.get('link')
+        
+        if snippet and link:
+            snippets.append(snippet)
+            links.append(link)
+            citations[f"[{index}]"] = link
+    
+    context = " ".join(snippets)  # Join all snippets with spaces to keep them readable together
+    return context, links, citations
+
+# Function to build the chat messages for the question and its citations.
+# context, if given, holds the retrieved passages ("[n] text") the model should answer from.
+def build_messages(question, citations, context=None):
+    full_question = f"{question}\n\n"
+    if context:
+        full_question += f"Answer using the following sources. If they do not cover something, say so.\n\n{context}\n\n"
+    full_question += "Please use the following citation format when referencing sources: [1], [2], etc. The citations should correspond to the following references:\n"
+    for citation, link in citations.items():
+        full_question += f"{citation}: {link}\n"
+    
+    return [
+        {"role": "system", "content": "You are a helpful assistant. When providing information, use the given citation format to reference sources."},
+        {"role": "user", "content": full_question}
+    ]
+
+# Function to run one chat completion and return the answer.
+# If on_answer is given the completion is streamed and on_answer is called with the answer so
+# far every time new tokens arrive. stats, if given, receives the prompt and completion tokens.
+def chat_completion(client, model, messages, on_answer=None, stats=None):
+    with span("ask_gpt", model=model, streamed=on_answer is not None) as attrs:
+        if on_answer is None:
+            response = call_with_retry("openai", lambda: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0,
+                max_tokens=4000
+            ), stats=attrs)
+            
+            answer = response.choices[0].message.content
+            usage = response.usage
+        else:
+            stream = call_with_retry("openai", lambda: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=0,
+                max_tokens=4000,
+                stream=True,
+                stream_options={"include_usage": True}
+            ), stats=attrs)
+            
+            answer = ""
+            usage = None
+            for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage  # Sent in a final chunk without choices
+                if chunk.choices and chunk.choices[0].delta.content:
+                    answer += chunk.choices[0].delta.content
+                    on_answer(answer)
+        if usage is not None:
+            attrs["prompt_tokens"] = usage.prompt_tokens
+            attrs["completion_tokens"] = usage.completion_tokens
+            if stats is not None:
+                stats.update(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+    return answer
+
+# Function to query GPT model with the provided question and context.
+# If on_token is given the completion is streamed and on_token is called with the
+# answer so far (introduction included) every time new tokens arrive. With use_cache, an
+# answer to a near-identical question about the same sources is reused from the semantic
+# cache; cache_info, if given, then receives the matched question, similarity and age.
+# full_text says the prompt carries passages of the full articles; such answers are cached
+# apart from snippet-only ones, so neither is served for the other.
+# With model_choice "auto" the answer comes from the model cascade (see cascade.py), which
+# retries on a larger model when the answer lacks valid citations or is too short; routing,
+# if given, then receives the routing decision.
+def ask_gpt(question, context, client, citations, model_choice, messages=None, on_token=None, use_cache=True, cache_info=None,
+            routing=None, full_text=False):
+    try:
+        # Adding the context as an explicit introduction in the answer
+        introduction = f" \n{context}\n\n"
+        if messages is None:
+            messages = build_messages(question, citations)
+        
+        urls = list(citations.values())
+        use_cache = use_cache and bool(urls)
+        cache_model = f"{model_choice}+full_text" if full_text else model_choice
+        if use_cache:
+            # Imported here so numpy is only loaded once an answer is asked for
+            from semantic_cache import answer_cache
+            with span("answer_cache", model=cache_model) as attrs:
+                hit = answer_cache.lookup(question, urls, cache_model)
+                attrs["hit"] = hit is not None
+            if hit is not None:
+                if cache_info is not None:
+                    cache_info.update(question=hit["question"], similarity=hit["similarity"], age=hit["age"])
+                if on_token is not None:
+                    on_token(introduction + hit["answer"])
+                return introduction + hit["answer"]
+        
+        on_answer = (lambda answer: on_token(introduction + answer)) if on_token is not None else None
+        if model_choice == AUTO_MODEL:
+            prompt_tokens = count_tokens("\n".join(message["content"] for message in messages), CASCADE_MODELS[0])
+            answer, decision = run_cascade(
+                "answer", prompt_tokens,
+                lambda model, stats: chat_completion(client, model, messages, on_answer, stats),
+                lambda answer: answer_problems(answer, citations)
+            )
+            if routing is not None:
+                routing.update(decision)
+        else:
+            answer = chat_completion(client, model_choice, messages, on_answer)
+        
+        if use_cache:
+            answer_cache.store(question, urls, cache_model, answer)
+        
+        # Combine the introduction and the generated answer
+        combined_answer = introduction + answer
+        return combined_answer
+    
+    except Exception as e:
+        st.error(f"Error during GPT query: {e}")
+        logging.error(f"Error during GPT query: {e}", exc_info=True)
+        return GPT_ERROR_ANSWER
+
+# Function to parse an answer into a token stream in a single pass.
+# Cleans the text as it goes (collapses runs of asterisks and periods, adds a space after a
+# period followed by a capital, decodes HTML entities, drops unusual characters) and splits
+# it into (TEXT, text), (CITATION, marker) and (LINE_BREAK, "\n") tokens. Only markers that
+# are keys of citations become CITATION tokens, and [1] never matches inside [10].
+def parse_answer(text, citations):
+    tokens = []
+    buffer = []
+    
+    def flush():
+        if buffer:
+            joined = "".join(buffer)
+            if joined:
+                tokens.append((TEXT, joined))
+            buffer.clear()
+    
+    position = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        buffer.append(text[position:match.start()])
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "plain":
+            buffer.append(value)
+        elif kind == "citation" and value in citations:
+            flush()
+            tokens.append((CITATION, value))
+        elif kind == "citation":
+            buffer.append(value)
+        elif kind == "newline":
+            flush()
+            tokens.append((LINE_BREAK, value))
+        elif kind == "stars":
+            buffer.append("*")
+        elif kind == "dots_capital":
+            buffer.append(". ")
+        elif kind == "dots":
+            buffer.append(".")
+        elif kind == "entity":
+            buffer.append(DISALLOWED_PATTERN.sub("", html.unescape(value)))
+        # "disallowed" characters are dropped
+    buffer.append(text[position:])
+    flush()
+    return tokens
+
+# Function to render tokens as Markdown, with citations as links
+def tokens_to_markdown(tokens, citations):
+    return "".join(f"[{value}]({citations[value]})" if kind == CITATION else value for kind, value in tokens)
+
+# Function to clean and format the text
+def clean_text(text):
+    return "".join(value for kind, value in parse_answer(text, {}))
+
+# Function to convert citations to clickable links in Markdown
+def make_citations_clickable(text, citations):
+    return CITATION_PATTERN.sub(lambda m: f"[{m.group()}]({citations[m.group()]})" if m.group() in citations else m.group(), text)
+
+# Function to format the answer in nice Markdown.
+# tokens, if given, is the parse_answer() stream of answer, so it is not parsed twice.
+def format_answer_markdown(answer, citations, tokens=None):
+    if tokens is None:
+        tokens = parse_answer(answer, citations)
+    
+    # Split the answer into introduction and main content at the first blank line
+    split = next((i for i in range(len(tokens) - 1) if tokens[i][0] == LINE_BREAK and tokens[i + 1][0] == LINE_BREAK), None)
+    if split is None:
+        introduction = ""
+        main_content = tokens_to_markdown(tokens, citations)
+    else:
+        introduction = tokens_to_markdown(tokens[:split], citations)
+        main_content = tokens_to_markdown(tokens[split + 2:], citations)
+    
+    # Format the markdown
+    formatted_answer = f"""
+<h2 style='color: #0066cc;'>Introduction</h2>
+
+ {introduction}
+
+<h2 style='color: #0066cc;'>Analysis</h2>
+
+{main_content}
+
+"""
+    return formatted_answer
+
+# Function to run the Analyze pipeline without touching the page: search, extract, prompt, LLM.
+# Stages are timed on timer when one is given; on_token(partial_answer, citations) receives the
+# streamed answer and progress(fraction, message) reports progress for background jobs.
+# use_cache=False bypasses the semantic answer cache; a cached answer is reported under "cache".
+# The prompt carries the passages that best match the question within context_budget tokens,
+# taken from the snippets and, with full_text, from the cited articles (see retrieval.py).
+def run_analysis(query, question, openai_api_key, serpapi_api_key, model_choice, timer=None, on_token=None, progress=None, use_cache=True,
+                 full_text=False, context_budget=CONTEXT_TOKEN_BUDGET):
+    if progress:
+        progress(0.1, "Searching")
+    with timed(timer, "search"):
+        search_results = search_query(query, serpapi_api_key)
+    with timed(timer, "extract"):
+        context, links, citations = extract_relevant_info(search_results)
+    
+    # If no specific question is provided, use a default one
+    if not question:
+        question = f"Provide a comprehensive summary and analysis of the information related to: {query}"
+    
+    if progress:
+        progress(0.2, "Reading the sources")
+    with timed(timer, "retrieve"):
+        passages = collect_passages(search_results, citations, full_text=full_text, model=model_choice)
+        retrieved, retrieval_stats = build_context(f"{query} {question}", passages, context_budget, model_choice)
+    with timed(timer, "prompt"):
+        messages = build_messages(question, citations, retrieved)
+    if progress:
+        progress(0.3, "Asking the model")
+    cache_info = {}
+    routing = {}
+    with timed(timer, "llm"):
+        answer = ask_gpt(question, context, get_openai_client(openai_api_key), citations, model_choice, messages=messages,
+                         on_token=(lambda partial_answer: on_token(partial_answer, citations)) if on_token else None,
+                         use_cache=use_cache, cache_info=cache_info, routing=routing, full_text=full_text)
+    return {"query": query, "question": question, "answer": answer, "citations": citations, "cache": cache_info or None,
+            "retrieval": retrieval_stats, "routing": routing or None}
+
+# Function to raise when an analysis ran without results: search_query and ask_gpt report their
+# errors on the page and return empty results or GPT_ERROR_ANSWER, which off the page would pass for success
+def check_analysis(result):
+    if not result["citations"]:
+        raise RuntimeError("The search returned no usable results")
+    if result["answer"] == GPT_ERROR_ANSWER:
+        raise RuntimeError("The model call failed")
+    return result
+
+# Function to run an Analyze request as a background job
+def analyze_job(params, secrets, progress):
+    return check_analysis(run_analysis(params["query"], params["question"], secrets["openai_api_key"], secrets["serpapi_api_key"],
+                                       params["model_choice"], progress=progress, use_cache=params.get("use_cache", True),
+                                       full_text=params.get("full_text", False)))
+
+
+register_job_handler("analyze", analyze_job)
@@ -1,211 +1,92 @@
 import streamlit as st
-import requests
+import copy
 import time
-from docx import Document as DocxDocument
-from docx.oxml.ns import qn
-from docx.oxml import OxmlElement
-from openai import OpenAI
-import io
 import logging
 import sys
-import re
-import html
 import yaml
 from yaml.loader import SafeLoader
 import streamlit_authenticator as stauth
+from cache import search_cache
+from telemetry import StageTimer, stage_summary, timed, recent_log_stats, render_metrics
+from resources import resource_stats
+from ratelimit import limiter_stats
+from singleflight import singleflight_stats
+from cascade import decision_line, AUTO_MODEL, CASCADE_MODELS
+from jobs import submit_job, show_job_panel, JobLimitError
+
+# analysis (the OpenAI client and the answer cache) and report (python-docx) are imported where they
+# are first needed, so the login form renders without loading them.
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, stream=sys.stdout,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Number of finished analyses kept in the session for re-display and export
+MAX_SESSION_RESULTS = 10
+
 # Set page configuration (this should be at the top of your app)
 st.set_page_config(layout="wide")  # Use wide layout for better readability
 
-# Function to perform a Google search query using SerpAPI
-def search_query(query, api_key):
-    try:
-        params = {
-            "engine": "google",
-            "q": query,
-            "api_key": api_key
-        }
-        response = requests.get("https://serpapi.com/search", params=params)
-        response.raise_for_status()  # Raise an error for bad responses
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error during search: {e}")
-        logging.error(f"Error during search: {e}", exc_info=True)
-        return None
-
-# Function to extract relevant information from the search results
-def extract_relevant_info(search_results):
-    if search_results is None:
-        return "", [], {}
-    
-    snippets = []
-    links = []
-    citations = {}
-    
-    for index, result in enumerate(search_results.get('organic_results', []), 1):
-        snippet = result.get('snippet')
-        link = result.get('link')
-        
-        if snippet and link:
-            snippets.append(snippet)
-            links.append(link)
-            citations[f"[{index}]"] = link
-    
-    context = " ".join(snippets)  # Join all snippets with spaces to keep them readable together
-    return context, links, citations
-
-# Function to query GPT model with the provided question and context
-def ask_gpt(question, context, client, citations, model_choice):
-    try:
-        # Adding the context as an explicit introduction in the answer
-        introduction = f" \n{context}\n\n"
-        full_question = f"{question}\n\nPlease use the following citation format when referencing sources: [1], [2], etc. The citations should correspond to the following references:\n"
-        for citation, link in citations.items():
-            full_question += f"{citation}: {link}\n"
-        
-        messages = [
-            {"role": "system", "content": "You are a helpful assistant. When providing information, use the given citation format to reference sources."},
-            {"role": "user", "content": full_question}
-        ]
-        
-        response = client.chat.completions.create(
-            model=model_choice,
-            messages=messages,
-            temperature=0,
-            max_tokens=4000
-        )
-        
-        answer = response.choices[0].message.content
-        
-        # Combine the introduction and the generated answer
-        combined_answer = introduction + answer
-        return combined_answer
-    
-    except Exception as e:
-        st.error(f"Error during GPT query: {e}")
-        logging.error(f"Error during GPT query: {e}", exc_info=True)
-        return "An error occurred while processing the request."
-
-# Function to add a hyperlink to a paragraph
-def add_hyperlink(paragraph, url, text):
-    # Ensure the URL is valid
-    if not url.startswith(('http://', 'https://')):
-        url = 'http://' + url  # Prepend http:// if no protocol is provided
-
-    # This gets access to the document.xml.rels file and gets a new relationship id value
-    part = paragraph.part
-    r_id = part.relate_to(url, "http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink", is_external=True)
-
-    # Create the w:hyperlink tag and add needed values
-    hyperlink = OxmlElement('w:hyperlink')
-    hyperlink.set(qn('r:id'), r_id)
-
-    # Create a w:r element and a new w:rPr element
-    new_run = OxmlElement('w:r')
-    r_pr = OxmlElement('w:rPr')
-
-    # Join all the xml elements together and add the required text to the w:r element
-    new_run.append(r_pr)
-    new_run.text = text
-    hyperlink.append(new_run)
-
-    # Add the hyperlink to the paragraph
-    paragraph._p.append(hyperlink)
-
-    return hyperlink
-
-# Function to save the response, context, and references to a DOCX file
-def save_to_docx(answer, citations):
-    doc = DocxDocument()
-    
-    # Add answer as a section (Introduction is already integrated in the answer)
-    doc.add_heading("Answer", level=1)
-    
-    # Split the answer into paragraphs
-    paragraphs = answer.split('\n')
+# Function to display an analysis result: formatted answer, references and DOCX download
+def render_analysis(result, key="analysis", placeholder=None, timer=None):
+    from analysis import parse_answer, format_answer_markdown
+    from report import save_to_docx, report_file_name, DOCX_MIME
+    answer = result["answer"]
+    citations = result["citations"]
     
-    for paragraph in paragraphs:
-        p = doc.add_paragraph()
-        # Split the paragraph by citation markers
-        parts = re.split(r'(\[\d+\])', paragraph)
-        for part in parts:
-            if part in citations:
-                # This is a citation, add it as a hyperlink
-                add_hyperlink(p, citations[part], part)
-            else:
-                # This is regular text, add it normally
-                p.add_run(part)
+    # Parse the answer once and format it in nice Markdown
+    with timed(timer, "format"):
+        tokens = parse_answer(answer, citations)
+        formatted_answer = format_answer_markdown(answer, citations, tokens)
     
-    # Add references as a section
-    doc.add_heading("References", level=1)
-    for citation, link in citations.items():
-        p = doc.add_paragraph(f"{citation} ")
-        add_hyperlink(p, link, link)
-    
-    # Save the document to a BytesIO object
-    docx_file = io.BytesIO()
-    doc.save(docx_file)
-    docx_file.seek(0)
-    return docx_file
-
-# Function to clean and format the text
-def clean_text(text):
-    # Remove excessive asterisks and periods
-    text = re.sub(r'\*+', '*', text)
-    text = re.sub(r'\.+', '.', text)
+    # Mark answers served from the semantic cache
+    if result.get("cache"):
+        cache_info = result["cache"]
+        st.info(f"Served from cache: answer to \"{cache_info['question']}\" from {cache_info['age'] / 60:.0f} min ago "
+                f"({cache_info['similarity']:.0%} similar). Untick \"Reuse answers to similar questions\" for a fresh answer.")
     
-    # Add spaces after periods if missing
-    text = re.sub(r'\.(?=[A-Z])', '. ', text)
+    # Display the formatted answer (replacing the last streamed partial, if any)
+    (placeholder or st).markdown(formatted_answer, unsafe_allow_html=True)
     
-    # Decode HTML entities
-    text = html.unescape(text)
+    # Say which model of the cascade wrote the answer, and why it escalated
+    if result.get("routing"):
+        st.caption(decision_line(result["routing"]))
     
-    # Remove any remaining weird characters
-    text = re.sub(r'[^\w\s.,;:!?*\[\]()"-]', '', text)
-    
-    return text
-
-# Function to convert citations to clickable links in Markdown
-def make_citations_clickable(text, citations):
+    # Display references
+    st.markdown("<h2 style='color: #0066cc;'>References</h2>", unsafe_allow_html=True)
     for citation, link in citations.items():
-        text = text.replace(citation, f"[{citation}]({link})")
-    return text
-
-# Function to format the answer in nice Markdown
-def format_answer_markdown(answer, citations):
-    # Clean the text
-    clean_answer = clean_text(answer)
-    
-    # Make citations clickable
-    clickable_answer = make_citations_clickable(clean_answer, citations)
-    
-    # Remove the non-blue "Introduction" header if present
-    clickable_answer = re.sub(r'\*\*Introduction\*\*\n*', '', clickable_answer)
+        st.markdown(f"{citation} [{link}]({link})")
     
-    # Split the answer into introduction and main content
-    parts = clickable_answer.split("\n\n", 1)
-    introduction = parts[0] if len(parts) > 1 else ""
-    main_content = parts[1] if len(parts) > 1 else parts[0]
-    
-    # Format the markdown
-    formatted_answer = f"""
-<h2 style='color: #0066cc;'>Introduction</h2>
-
- {introduction}
-
-<h2 style='color: #0066cc;'>Analysis</h2>
-
-{main_content}
+    # The DOCX is only built when asked for, then offered for download
+    offer_download(f"docx-{key}", hash((answer, tuple(citations.items()))), "Prepare DOCX report",
+                   lambda: save_to_docx(answer, citations, tokens).getvalue(),
+                   report_file_name(result.get("query")), DOCX_MIME, timer)
+
+# Function to build a file with build() when its prepare button is clicked and offer it for download.
+# The built file is kept in the session under key so the download button survives reruns;
+# fingerprint identifies the content, so a file built for an earlier result is not offered.
+def offer_download(key, fingerprint, label, build, file_name, mime, timer=None):
+    prepared = st.session_state.setdefault("prepared_downloads", {})
+    if st.button(label, key=f"prepare-{key}"):
+        with timed(timer, "docx"):
+            prepared[key] = (fingerprint, build())
+    if key in prepared and prepared[key][0] == fingerprint:
+        st.download_button(
+            label=f"Download {file_name}",
+            data=prepared[key][1],
+            file_name=file_name,
+            mime=mime,
+            key=f"download-{key}"
+        )
 
-"""
-    return formatted_answer
+# Function to parse the credentials once per process. Plain-text passwords are hashed here, once,
+# instead of by the authenticator on every rerun; each run gets its own copy to modify.
+@st.cache_resource
+def load_credentials():
+    return stauth.Hasher.hash_passwords(yaml.safe_load(st.secrets["general"]["credentials"]))
 
 # Load credentials and configuration from Streamlit Secrets
-credentials = yaml.safe_load(st.secrets["general"]["credentials"])
+credentials = copy.deepcopy(load_credentials())
 cookie_name = st.secrets["general"]["cookie_name"]
 cookie_key = st.secrets["general"]["cookie_key"]
 cookie_expiry_days = st.secrets["general"]["cookie_expiry_days"]
@@ -219,8 +100,10 @@ authenticator = stauth.Authenticate(
     None  # No preauthorized emails in this example
 )
 
-# Display the login form in the sidebar
-name, authentication_status, username = authenticator.login('main')
+# Display the login form in the sidebar. The outcome is read from the session state, which every
+# streamlit-authenticator version sets; 0.4 no longer returns it from login().
+authenticator.login('main')
+name, authentication_status, username = (st.session_state.get(key) for key in ("name", "authentication_status", "username"))
 
 if authentication_status:
     # Successful login
@@ -272,13 +155,24 @@ if authentication_status:
                 logging.error(f"Missing API key in Streamlit Secrets: {e}")
                 return
 
-            # Initialize OpenAI client
-            client = OpenAI(api_key=openai_api_key)
-
             # Sidebar for settings
             with st.sidebar:
                 st.header("Settings")
-                model_choice = st.selectbox("Select GPT Model", ["gpt-4o-mini", "gpt-4o"])
+                model_choice = st.selectbox("Select GPT Model", [AUTO_MODEL] + CASCADE_MODELS,
+                                            format_func=lambda name: "Auto (cheapest that passes the checks)" if name == AUTO_MODEL else name,
+                                            help="Auto asks the smallest model first and asks a larger one only when the answer lacks valid citations or is too short, or the sources are very long.")
+                cache_stats = search_cache.stats()
+                stream_answer = st.checkbox("Stream answer", value=True, help="Show the answer as it is generated.")
+                run_in_background = st.checkbox("Run in background", value=False, help="Queue the analysis as a job; follow it in the Jobs panel below and come back for the result later.")
+                use_answer_cache = st.checkbox("Reuse answers to similar questions", value=True, help="Serve a recent answer to a near-identical question about the same sources instead of asking the model again. Untick to always get a fresh answer.")
+                full_text = st.checkbox("Read full articles", value=False, help="Also give the model the most relevant passages of the articles themselves, not just the search snippets. Slower, but better grounded.")
+                st.caption(f"Search cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} entries")
+                connection_stats = resource_stats()
+                st.caption(f"HTTP connections opened: {connection_stats['connections_opened']}, clients built: {connection_stats['clients_created'] + connection_stats['chains_created']}")
+                retry_stats = limiter_stats()
+                st.caption(f"Retries: {retry_stats['retries']}, unavailable providers: {', '.join(retry_stats['open_breakers']) or 'none'}")
+                flight_stats = singleflight_stats()
+                st.caption(f"Shared requests: {flight_stats['shared']} of {flight_stats['calls']} joined one already in flight")
 
             # User input for search query (compulsory)
             query = st.text_input("Enter your search query (required):")
@@ -287,51 +181,86 @@ if authentication_status:
             question = st.text_area("Enter your analysis question (optional):")
 
             if st.button("Analyze"):
-                if query:
+                from analysis import run_analysis, format_answer_markdown  # Also registers the "analyze" job handler
+                if query and run_in_background:
+                    try:
+                        job_id = submit_job(
+                            username, "analyze",
+                            {"query": query, "question": question, "model_choice": model_choice, "use_cache": use_answer_cache, "full_text": full_text},
+                            {"openai_api_key": openai_api_key, "serpapi_api_key": serpapi_api_key}
+                        )
+                        st.success(f"Analysis queued as job {job_id}.")
+                    except JobLimitError as e:
+                        st.warning(str(e))
+                elif query:
                     with st.spinner("Searching and analyzing..."):
                         try:
-                            # Perform the search query
-                            search_results = search_query(query, serpapi_api_key)
-                            
-                            # Extract the context, relevant links, and citations from the search results
-                            context, links, citations = extract_relevant_info(search_results)
-                            
-                            # Pause for a moment to ensure all context is retrieved
-                            time.sleep(5)
-                            
-                            # If no specific question is provided, use a default one
-                            if not question:
-                                question = f"Provide a comprehensive summary and analysis of the information related to: {query}"
-                            
-                            # Get the answer from GPT using the context as the introduction
-                            answer = ask_gpt(question, context, client, citations, model_choice)
-                            
-                            # Format the answer in nice Markdown
-                            formatted_answer = format_answer_markdown(answer, citations)
+                            # Each stage runs as soon as the previous one has returned; durations are recorded per stage
+                            timer = StageTimer()
                             
-                            # Display the formatted answer
-                            st.markdown(formatted_answer, unsafe_allow_html=True)
+                            # Render partial answers into a placeholder, at most every 0.1s, with complete citations already linkified
+                            answer_placeholder = st.empty()
+                            last_render = [0.0]
                             
-                            # Display references
-                            st.markdown("<h2 style='color: #0066cc;'>References</h2>", unsafe_allow_html=True)
-                            for citation, link in citations.items():
-                                st.markdown(f"{citation} [{link}]({link})")
+                            def render_partial(partial_answer, citations):
+                                now = time.monotonic()
+                                if now - last_render[0] >= 0.1:
+                                    last_render[0] = now
+                                    answer_placeholder.markdown(format_answer_markdown(partial_answer, citations), unsafe_allow_html=True)
                             
-                            # Save the answer and references to a DOCX file
-                            docx_file = save_to_docx(clean_text(answer), citations)
+                            # Search, extract, build the prompt and get the answer from GPT
+                            result = run_analysis(query, question, openai_api_key, serpapi_api_key, model_choice, timer=timer,
+                                                  on_token=render_partial if stream_answer else None, use_cache=use_answer_cache, full_text=full_text)
                             
-                            # Provide a download button for the DOCX file
-                            st.download_button(
-                                label="Download Analysis as DOCX",
-                                data=docx_file,
-                                file_name="analysis_report.docx",
-                                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                            )
+                            # Format, display and export the answer; keep it for later reruns and exports
+                            render_analysis(result, placeholder=answer_placeholder, timer=timer)
+                            session_results = st.session_state.setdefault("analysis_results", [])
+                            session_results.append(result)
+                            del session_results[:-MAX_SESSION_RESULTS]
+
+                            # Show this run's stage latencies next to the rolling p50 for this process
+                            timer.finish()
+                            summary = stage_summary()
+                            with st.expander("Timings"):
+                                st.table([
+                                    {"Stage": name, "This run (s)": round(seconds, 3), "p50 (s)": round(summary[name]["p50"], 3), "Runs": summary[name]["count"]}
+                                    for name, seconds in timer.durations.items()
+                                ])
                         except Exception as e:
                             st.error(f"An error occurred during analysis: {e}")
                             logging.error(f"Error during analysis: {e}", exc_info=True)
                 else:
                     st.warning("Please enter a search query.")
+            elif st.session_state.get("analysis_results"):
+                # Keep showing the latest answer on reruns (e.g. after preparing its DOCX)
+                render_analysis(st.session_state["analysis_results"][-1])
+
+            # Export several of this session's analyses at once as a zip of DOCX reports
+            session_results = st.session_state.get("analysis_results", [])
+            if len(session_results) > 1:
+                with st.expander("Export reports"):
+                    selected = st.multiselect(
+                        "Analyses to export", range(len(session_results)), default=list(range(len(session_results))),
+                        format_func=lambda i: session_results[i]["query"]
+                    )
+                    if selected:
+                        from report import export_reports_zip, ZIP_MIME
+                        chosen = [session_results[i] for i in selected]
+                        offer_download("zip", tuple(id(result) for result in chosen), "Prepare ZIP of reports",
+                                       lambda: export_reports_zip(chosen).getvalue(), "analysis_reports.zip", ZIP_MIME)
+
+            # Background jobs of this user, with their results on request
+            show_job_panel(username, render_analysis)
+
+            # Latency by stage across all worker processes (from the telemetry log), for admins only
+            if username in st.secrets["general"].get("admins", []):
+                with st.expander("Admin: latency by stage"):
+                    log_stats = recent_log_stats()
+                    st.table([
+                        {"Stage": stage, "Spans": stats["count"], "Errors": stats["errors"], "p50 (s)": round(stats["p50"], 3), "p95 (s)": round(stats["p95"], 3)}
+                        for stage, stats in sorted(log_stats.items())
+                    ])
+                    st.download_button("Download metrics (Prometheus format)", render_metrics(), file_name="metrics.prom", mime="text/plain")
         except Exception as e:
             st.error(f"An unexpected error occurred: {e}")
             logging.error(f"Unexpected error: {e}", exc_info=True)
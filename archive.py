@@ -0,0 +1,178 @@
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from cache import CACHE_DIR
+from dedupe import normalize_url
+from aggregator import published_date, merge_results
+
+# Local full-text archive of the articles that were fetched and summarized.
+#
+# Every summarized article (text, title, link, date and summary, with the word count and model the
+# summary was made for) is kept in a SQLite table with
+# an FTS5 index over title, summary and text, kept in sync by triggers, so earlier coverage can
+# be searched again without a SerpAPI call or a page fetch. Dates are stored both as reported
+# and normalized to YYYY-MM-DD. Articles are inserted in bulk, one transaction per search,
+# keyed by normalized URL so a re-fetched article replaces its entry. Once the archive grows
+# past ARCHIVE_MAX_ENTRIES the least recently archived entries are dropped, together with
+# entries older than ARCHIVE_MAX_AGE_DAYS, and the index is merged; `python archive.py compact`
+# also reclaims the file space.
+
+ARCHIVE_DB = os.path.join(CACHE_DIR, "archive.sqlite3")
+ARCHIVE_ENABLED = os.environ.get("SPOTLIGHT_ARCHIVE", "1") != "0"
+ARCHIVE_MAX_ENTRIES = int(os.environ.get("SPOTLIGHT_ARCHIVE_MAX_ENTRIES", 50000))
+ARCHIVE_MAX_AGE_DAYS = int(os.environ.get("SPOTLIGHT_ARCHIVE_MAX_AGE_DAYS", 365))
+
+# Where the news page gets its results from
+SOURCES = {
+    "Live search": "live",
+    "Archive": "archive",
+    "Archive + live": "mixed",
+}
+
+TERM_PATTERN = re.compile(r"\w+")
+
+_local = threading.local()
+
+
+# Function to get this thread's connection to the archive
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(ARCHIVE_DB), exist_ok=True)
+        conn = sqlite3.connect(ARCHIVE_DB, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        _local.conn = conn
+    return conn
+
+def _init_db():
+    with _connect() as conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            "id INTEGER PRIMARY KEY, url_key TEXT NOT NULL UNIQUE, link TEXT NOT NULL, title TEXT NOT NULL, "
+            "date TEXT, published TEXT, summary TEXT NOT NULL, text TEXT NOT NULL, archived REAL NOT NULL)"
+        )
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(articles)")}
+        for column, kind in (("word_count", "INTEGER"), ("model", "TEXT")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE articles ADD COLUMN {column} {kind}")
+        conn.execute("CREATE INDEX IF NOT EXISTS articles_archived ON articles (archived)")
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5("
+            "title, summary, text, content='articles', content_rowid='id', tokenize='porter unicode61')"
+        )
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN "
+            "INSERT INTO articles_fts (rowid, title, summary, text) VALUES (new.id, new.title, new.summary, new.text); END"
+        )
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN "
+            "INSERT INTO articles_fts (articles_fts, rowid, title, summary, text) VALUES ('delete', old.id, old.title, old.summary, old.text); END"
+        )
+        conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS articles_au AFTER UPDATE ON articles BEGIN "
+            "INSERT INTO articles_fts (articles_fts, rowid, title, summary, text) VALUES ('delete', old.id, old.title, old.summary, old.text); "
+            "INSERT INTO articles_fts (rowid, title, summary, text) VALUES (new.id, new.title, new.summary, new.text); END"
+        )
+
+
+# Function to add or refresh articles in one transaction; each record has title, link, date, summary, text,
+# and the word_count and model the summary was written for
+def archive_articles(records):
+    records = [record for record in records if record.get("text") and record.get("summary")]
+    if not records:
+        return 0
+    now = time.time()
+    with _connect() as conn:
+        conn.executemany(
+            "INSERT INTO articles (url_key, link, title, date, published, summary, text, word_count, model, archived) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (url_key) DO UPDATE SET link = excluded.link, title = excluded.title, date = excluded.date, "
+            "published = excluded.published, summary = excluded.summary, text = excluded.text, word_count = excluded.word_count, "
+            "model = excluded.model, archived = excluded.archived",
+            [(normalize_url(record["link"]), record["link"], record.get("title", ""), record.get("date"),
+              published_date(record.get("date")), record["summary"], record["text"], record.get("word_count"), record.get("model"), now)
+             for record in records]
+        )
+        count = conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+    if count > ARCHIVE_MAX_ENTRIES:
+        compact_archive()
+    return len(records)
+
+# Function to search the archive; returns up to num results shaped like SerpAPI's organic_results,
+# best match first, with the stored summary (and the word count and model it was written for)
+# and the normalized date (when known) as the date
+def search_archive(query, num=10):
+    terms = TERM_PATTERN.findall(query.lower())
+    if not terms:
+        return []
+    match = " OR ".join(f'"{term}"' for term in terms)
+    rows = _connect().execute(
+        "SELECT a.link, a.title, a.date, a.published, a.summary, a.word_count, a.model, "
+        "snippet(articles_fts, 2, '**', '**', ' ... ', 24) AS snippet "
+        "FROM articles_fts JOIN articles a ON a.id = articles_fts.rowid "
+        "WHERE articles_fts MATCH ? ORDER BY bm25(articles_fts, 10.0, 4.0, 1.0) LIMIT ?",
+        (match, num)
+    ).fetchall()
+    return [{
+        "title": row["title"],
+        "link": row["link"],
+        "snippet": " ".join(row["snippet"].split()),
+        "date": row["published"] or row["date"] or "No date available",
+        "summary": row["summary"],
+        "summary_word_count": row["word_count"],
+        "summary_model": row["model"],
+        "archived": True,
+    } for row in rows]
+
+# Function to search the archive, live (live_search() returns a SerpAPI-shaped dict) or both.
+# With "mixed" the archived results win duplicates, so their stored summaries are reused.
+def search_with_archive(query, num, source, live_search):
+    if source == "archive":
+        return {"organic_results": search_archive(query, num)}
+    live = live_search()
+    if source != "mixed":
+        return live
+    results = merge_results([("archive", search_archive(query, num)), ("live", live.get("organic_results", []))])
+    return {**live, "organic_results": results[:num]}
+
+# Function to drop entries older than max_age_days and the least recently archived beyond
+# max_entries, then merge the index; vacuum=True also returns the freed space to the file system
+def compact_archive(max_entries=ARCHIVE_MAX_ENTRIES, max_age_days=ARCHIVE_MAX_AGE_DAYS, vacuum=False):
+    with _connect() as conn:
+        removed = conn.execute("DELETE FROM articles WHERE archived < ?", (time.time() - max_age_days * 86400,)).rowcount
+        removed += conn.execute(
+            "DELETE FROM articles WHERE id IN (SELECT id FROM articles ORDER BY archived DESC LIMIT -1 OFFSET ?)", (max_entries,)
+        ).rowcount
+        conn.execute("INSERT INTO articles_fts (articles_fts) VALUES ('optimize')")
+    if vacuum:
+        _connect().execute("VACUUM")
+        _connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return removed
+
+# Function to report the number of archived articles and the size of the archive file
+def archive_stats():
+    count = _connect().execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+    size = sum(os.path.getsize(path) for path in (ARCHIVE_DB, ARCHIVE_DB + "-wal") if os.path.exists(path))
+    return {"articles": count, "bytes": size}
+
+
+_init_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) >= 3 and sys.argv[1] == "search":
+        started = time.perf_counter()
+        for result in search_archive(" ".join(sys.argv[2:])):
+            print(f"{result['date']}  {result['title']}\n    {result['link']}")
+        print(f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+    elif len(sys.argv) == 2 and sys.argv[1] == "compact":
+        removed = compact_archive(vacuum=True)
+        logging.info(f"Removed {removed} entries; {archive_stats()}")
+    else:
+        raise SystemExit("Usage: python archive.py search <query> | python archive.py compact")
@@ -0,0 +1,203 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Headless batch mode: analyze or summarize many queries without the Streamlit UI.
+#
+#   python batch.py queries.jsonl --out briefing/ --workers 4 --serpapi-rate 2 --openai-rate 5
+#   python batch.py --query "central bank rates" --query "oil prices" --mode summarize_all
+#
+# Each input line is a JSON object with a "query" and optionally "id", "mode" (analyze,
+# summarize or summarize_all), "question", "model", "num_results", "word_count", "use_cache",
+# "full_text" and "engines".
+# Results are appended to <out>/results.jsonl as they finish; that file is also the checkpoint, so
+# rerunning the same command skips queries that already succeeded and retries the rest.
+# With --docx every successful result is also written as <out>/docx/<id>.docx.
+# API keys come from OPENAI_API_KEY / SERPAPI_API_KEY or .streamlit/secrets.toml.
+
+MODES = ("analyze", "summarize", "summarize_all")
+# Task fields that change a task's result, and so its ID (worker counts and answer cache use do not)
+RESULT_FIELDS = ("mode", "query", "question", "model", "num_results", "word_count", "extractor", "full_text", "engines")
+SECRETS_FILE = os.path.join(".streamlit", "secrets.toml")
+# Values like "${OPENAI_API_KEY}" in the secrets file are deployment placeholders, not keys
+PLACEHOLDER_PATTERN = re.compile(r"^\$\{.*\}$")
+
+
+# Function to return an API key value, or None when it is empty or an unfilled placeholder
+def key_value(value):
+    value = (value or "").strip()
+    return value if value and not PLACEHOLDER_PATTERN.match(value) else None
+
+# Function to read the API keys from the environment, falling back to the Streamlit secrets file
+def load_secrets(secrets_file=SECRETS_FILE):
+    secrets = {
+        "openai_api_key": key_value(os.environ.get("OPENAI_API_KEY")),
+        "serpapi_api_key": key_value(os.environ.get("SERPAPI_API_KEY")),
+    }
+    if not all(secrets.values()) and os.path.exists(secrets_file):
+        import toml
+        general = toml.load(secrets_file).get("general", {})
+        secrets["openai_api_key"] = secrets["openai_api_key"] or key_value(general.get("OPENAI_API_KEY"))
+        secrets["serpapi_api_key"] = secrets["serpapi_api_key"] or key_value(general.get("SERPAPI_API_KEY"))
+    missing = [name for name, value in secrets.items() if not value]
+    if missing:
+        raise SystemExit(f"Missing API keys: {', '.join(missing)}")
+    return secrets
+
+# Function to derive a stable ID for a task from the fields that affect its result
+def task_id(task):
+    text = json.dumps([task.get(field) or None for field in RESULT_FIELDS])
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+# Function to read tasks from a JSONL file and/or CLI queries, applying the defaults
+def load_tasks(path, queries, defaults):
+    raw = []
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    raw.append(json.loads(line))
+                except ValueError as e:
+                    raise SystemExit(f"{path}:{number}: invalid JSON: {e}")
+    raw.extend({"query": query} for query in queries)
+    tasks = []
+    for task in raw:
+        if not task.get("query"):
+            raise SystemExit(f"Task without a query: {task}")
+        task = {**defaults, **task}
+        if task["mode"] not in MODES:
+            raise SystemExit(f"Unknown mode {task['mode']!r} for query {task['query']!r}")
+        task.setdefault("id", task_id(task))
+        tasks.append(task)
+    return tasks
+
+# Function to read the IDs of tasks that already succeeded from the results file
+def completed_ids(results_path):
+    done = set()
+    if os.path.exists(results_path):
+        with open(results_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by an interrupted run
+                if entry.get("status") == "done":
+                    done.add(entry["id"])
+    return done
+
+
+# Function to run one task and return its result dict (raises on failure)
+def run_task(task, secrets):
+    if task["mode"] == "analyze":
+        from analysis import run_analysis, check_analysis
+        return check_analysis(run_analysis(task["query"], task.get("question", ""), secrets["openai_api_key"],
+                                           secrets["serpapi_api_key"], task["model"], use_cache=task["use_cache"], full_text=task["full_text"]))
+    from news import run_summarize
+    params = {"query": task["query"], "num_results": task["num_results"], "word_count": task["word_count"],
+              "max_workers": task["max_workers"], "extractor": task["extractor"], "engines": task.get("engines"), "model": task["model"]}
+    return run_summarize(params, secrets, lambda fraction, message=None: None, digest=task["mode"] == "summarize_all")
+
+# Function to turn a summarize result into the {query, answer, citations} shape of an analysis
+def summary_as_analysis(result):
+    succeeded = [article for article in result["articles"] if not article["error"]]
+    citations = {f"[{n}]": article["link"] for n, article in enumerate(succeeded, 1)}
+    if result.get("digest"):
+        answer = result["digest"]
+    else:
+        answer = "\n\n".join(f"{article['title']} [{n}]\n{article['summary']}" for n, article in enumerate(succeeded, 1))
+    return {"query": result["query"], "answer": answer, "citations": citations}
+
+# Function to write a result as <docx_dir>/<id>.docx
+def write_docx(task, result, docx_dir):
+    from report import DocxReport
+    report = DocxReport()
+    report.add_report(result if task["mode"] == "analyze" else summary_as_analysis(result))
+    os.makedirs(docx_dir, exist_ok=True)
+    path = os.path.join(docx_dir, f"{task['id']}.docx")
+    with open(path, "wb") as f:
+        f.write(report.to_bytes().getvalue())
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze or summarize a batch of news queries.")
+    parser.add_argument("tasks", nargs="?", help="JSONL file of queries")
+    parser.add_argument("--query", action="append", default=[], help="Query to run (repeatable)")
+    parser.add_argument("--out", default="batch_output", help="Output directory")
+    parser.add_argument("--mode", choices=MODES, default="analyze", help="Default mode for tasks without one")
+    parser.add_argument("--model", default="auto", help="Default model for answers and article summaries; \"auto\" starts with the smallest model and escalates when its output fails the checks")
+    parser.add_argument("--num-results", type=int, default=5)
+    parser.add_argument("--word-count", type=int, default=100)
+    parser.add_argument("--article-workers", type=int, default=4, help="Articles summarized in parallel per query")
+    parser.add_argument("--extractor", default=None, help="Article extractor backend")
+    parser.add_argument("--engines", help="Comma-separated search engines for summarize tasks, e.g. google,google_news (searched in parallel and merged)")
+    parser.add_argument("--workers", type=int, default=4, help="Queries processed in parallel")
+    parser.add_argument("--serpapi-rate", type=float, help="Max SerpAPI requests per second")
+    parser.add_argument("--openai-rate", type=float, help="Max OpenAI requests per second")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Always ask the model instead of reusing answers to similar questions")
+    parser.add_argument("--full-text", action="store_true", help="Give the model passages of the full articles, not just the search snippets")
+    parser.add_argument("--docx", action="store_true", help="Also write one DOCX report per result")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and run every task again")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from extract import DEFAULT_EXTRACTOR
+    from ratelimit import set_rate
+    defaults = {"mode": args.mode, "model": args.model, "num_results": args.num_results, "word_count": args.word_count,
+                "max_workers": args.article_workers, "extractor": args.extractor or DEFAULT_EXTRACTOR,
+                "use_cache": not args.no_answer_cache, "full_text": args.full_text,
+                "engines": args.engines.split(",") if args.engines else None}
+    tasks = load_tasks(args.tasks, args.query, defaults)
+    if not tasks:
+        raise SystemExit("No queries given")
+    secrets = load_secrets()
+    if args.serpapi_rate:
+        set_rate("serpapi", args.serpapi_rate)
+    if args.openai_rate:
+        set_rate("openai", args.openai_rate)
+
+    os.makedirs(args.out, exist_ok=True)
+    results_path = os.path.join(args.out, "results.jsonl")
+    if args.restart and os.path.exists(results_path):
+        os.remove(results_path)
+    done = completed_ids(results_path)
+    pending = [task for task in tasks if task["id"] not in done]
+    logging.info(f"{len(tasks)} tasks, {len(tasks) - len(pending)} already done, {len(pending)} to run")
+
+    failures = 0
+    with open(results_path, "a", encoding="utf-8") as results_file, ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {executor.submit(run_task, task, secrets): task for task in pending}
+        for number, future in enumerate(as_completed(futures), 1):
+            task = futures[future]
+            entry = {"id": task["id"], "mode": task["mode"], "query": task["query"]}
+            try:
+                entry["result"] = future.result()
+                entry["status"] = "done"
+                if args.docx:
+                    entry["docx"] = write_docx(task, entry["result"], os.path.join(args.out, "docx"))
+            except Exception as e:
+                logging.error(f"Task {task['id']} ({task['query']}) failed: {e}", exc_info=True)
+                entry["status"] = "failed"
+                entry["error"] = str(e)
+                failures += 1
+            # One line per finished task, flushed at once so an interrupted run can resume from here
+            results_file.write(json.dumps(entry) + "\n")
+            results_file.flush()
+            logging.info(f"[{number}/{len(pending)}] {entry['status']}: {task['query']}")
+
+    logging.info(f"Finished: {len(pending) - failures} succeeded, {failures} failed; results in {results_path}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Directory holding the on-disk caches; shared by every Streamlit session and worker process
+CACHE_DIR = os.environ.get("SPOTLIGHT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+
+# News goes stale quickly, so search responses are only reused for a short window
+SEARCH_TTL_SECONDS = int(os.environ.get("SPOTLIGHT_SEARCH_TTL", 15 * 60))
+SEARCH_MAX_ENTRIES = int(os.environ.get("SPOTLIGHT_SEARCH_MAX_ENTRIES", 500))
+
+# Extracted article text is served without touching the network while fresh, then revalidated
+# with the stored ETag / Last-Modified. Summaries are content-addressed, so they never go stale.
+ARTICLE_FRESH_SECONDS = int(os.environ.get("SPOTLIGHT_ARTICLE_FRESH", 6 * 60 * 60))
+ARTICLE_MAX_BYTES = int(os.environ.get("SPOTLIGHT_ARTICLE_MAX_BYTES", 200 * 1024 * 1024))
+SUMMARY_MAX_BYTES = int(os.environ.get("SPOTLIGHT_SUMMARY_MAX_BYTES", 50 * 1024 * 1024))
+
+
+# SQLite-backed key/value cache with a per-entry TTL, LRU eviction and hit/miss counters.
+# Values are stored as JSON. Each thread gets its own connection and the database runs in
+# WAL mode, so the same file can be used safely from several threads and processes.
+class DiskCache:
+    def __init__(self, name, ttl=None, max_entries=1000, max_bytes=None, path=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path or os.path.join(CACHE_DIR, "cache.sqlite3")
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.name} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.name}_last_used ON {self.name} (last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, hits INTEGER NOT NULL, misses INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO cache_stats (name, hits, misses) VALUES (?, 0, 0)", (self.name,))
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, conn, column):
+        conn.execute(f"UPDATE cache_stats SET {column} = {column} + 1 WHERE name = ?", (self.name,))
+
+    # Return the cached value for key, or None if it is missing or expired
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT value, created FROM {self.name} WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                if row is not None:
+                    conn.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+                self._count(conn, "misses")
+                return None
+            conn.execute(f"UPDATE {self.name} SET last_used = ? WHERE key = ?", (now, key))
+            self._count(conn, "hits")
+        return json.loads(row[0])
+
+    # Store value under key and evict the least recently used entries beyond max_entries / max_bytes
+    def set(self, key, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.name} (key, value, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            if self.ttl is not None:
+                conn.execute(f"DELETE FROM {self.name} WHERE created < ?", (now - self.ttl,))
+            conn.execute(
+                f"DELETE FROM {self.name} WHERE key IN ("
+                f"SELECT key FROM {self.name} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            if self.max_bytes is not None:
+                conn.execute(
+                    f"DELETE FROM {self.name} WHERE key IN ("
+                    f"SELECT key FROM (SELECT key, SUM(LENGTH(value)) OVER (ORDER BY last_used DESC) AS running FROM {self.name}) "
+                    "WHERE running > ?)",
+                    (self.max_bytes,)
+                )
+
+    def stats(self):
+        with self._connect() as conn:
+            hits, misses = conn.execute("SELECT hits, misses FROM cache_stats WHERE name = ?", (self.name,)).fetchone()
+            entries = conn.execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+        return {"hits": hits, "misses": misses, "entries": entries}
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.name}")
+            conn.execute("UPDATE cache_stats SET hits = 0, misses = 0 WHERE name = ?", (self.name,))
+
+
+# Function to build the content-addressed key for a summary of text produced by model with prompt
+def summary_key(text, model, prompt):
+    return hashlib.sha256(json.dumps([text, model, prompt]).encode("utf-8")).hexdigest()
+
+
+# Function to build the cache key for a search; queries differing only in case or spacing share an entry
+def search_key(engine, query, num=None):
+    normalized_query = " ".join(query.split()).lower()
+    return json.dumps([engine, normalized_query, int(num) if num is not None else None])
+
+
+search_cache = DiskCache("search_results", ttl=SEARCH_TTL_SECONDS, max_entries=SEARCH_MAX_ENTRIES)
+article_cache = DiskCache("article_text", max_entries=5000, max_bytes=ARTICLE_MAX_BYTES)
+summary_cache = DiskCache("summaries", max_entries=20000, max_bytes=SUMMARY_MAX_BYTES)
@@ -0,0 +1,117 @@
+import logging
+import os
+import re
+import time
+from digest import MODEL_PRICES
+from telemetry import span
+
+# Model cascade: every request goes to the cheapest model first and moves up only when needed.
+#
+# run_cascade() tries the models of CASCADE_MODELS in order, cheapest first, and keeps the
+# first output that passes the request's local checks; the last model's output is kept either
+# way. A request whose largest single prompt (the whole input, or the biggest chunk or reduce
+# step of a map-reduce) is over CASCADE_INPUT_TOKENS goes straight to the last model; a failed call
+# (an error, or an open circuit breaker) moves on to the next model. Checks are functions of
+# the output that return a list of problems:
+#   answer_problems   - no citation markers, markers not among the sources, or too few words
+#   summary_problems  - far fewer words than were asked for
+# Each request logs one "cascade" span with the chosen model, the reasons for escalating and
+# the latency and tokens of every attempt; the attempts also log their own model call spans.
+# Wherever a model is chosen, the name "auto" (AUTO_MODEL) selects the cascade.
+
+AUTO_MODEL = "auto"
+CASCADE_MODELS = [name.strip() for name in os.environ.get("SPOTLIGHT_CASCADE_MODELS", "gpt-4o-mini,gpt-4o").split(",") if name.strip()]
+CASCADE_INPUT_TOKENS = int(os.environ.get("SPOTLIGHT_CASCADE_INPUT_TOKENS", 8000))
+MIN_ANSWER_WORDS = int(os.environ.get("SPOTLIGHT_MIN_ANSWER_WORDS", 40))
+# A summary shorter than this share of the requested word count is escalated
+MIN_SUMMARY_RATIO = float(os.environ.get("SPOTLIGHT_MIN_SUMMARY_RATIO", 0.5))
+
+CITATION_PATTERN = re.compile(r"\[\d+\]")
+
+
+# Function to check an answer: it must cite the sources (when there are any) with known markers and not be too short
+def answer_problems(answer, citations, min_words=MIN_ANSWER_WORDS):
+    problems = []
+    markers = set(CITATION_PATTERN.findall(answer or ""))
+    if citations and not markers:
+        problems.append("no_citations")
+    elif markers - set(citations):
+        problems.append("invalid_citations")
+    if len((answer or "").split()) < min_words:
+        problems.append("too_short")
+    return problems
+
+# Function to check a summary against the requested word count
+def summary_problems(summary, word_count, min_ratio=MIN_SUMMARY_RATIO):
+    if len((summary or "").split()) < word_count * min_ratio:
+        return ["too_short"]
+    return []
+
+# Function to estimate the cost in USD of the attempts' tokens
+def attempts_cost(attempts):
+    total = 0.0
+    for attempt in attempts:
+        prompt_price, completion_price = MODEL_PRICES.get(attempt["model"], (0.0, 0.0))
+        total += (attempt["prompt_tokens"] * prompt_price + attempt["completion_tokens"] * completion_price) / 1_000_000
+    return total
+
+# Function to run a request through the cascade; prompt_tokens is its largest single prompt.
+# call(model, stats) runs the request on one model and returns its output; it may set
+# stats["prompt_tokens"] and stats["completion_tokens"]. check(output) returns a list of
+# problems. on_escalate(), if given, is called before every retry on a larger model (to restart
+# a stream, for example). Returns (output, decision): decision holds the kind of request, the
+# chosen model, whether and why it escalated, each attempt, and the total seconds, tokens and cost.
+def run_cascade(kind, prompt_tokens, call, check, models=None, on_escalate=None):
+    models = models or CASCADE_MODELS
+    reasons = []
+    first = 0
+    if prompt_tokens > CASCADE_INPUT_TOKENS and len(models) > 1:
+        first = len(models) - 1
+        reasons.append("input_too_large")
+    attempts = []
+    output = None
+    started = time.perf_counter()
+    with span("cascade", kind=kind, prompt_tokens=prompt_tokens) as attrs:
+        for position in range(first, len(models)):
+            last = position == len(models) - 1
+            if attempts and on_escalate is not None:
+                on_escalate()
+            attempt = {"model": models[position], "prompt_tokens": 0, "completion_tokens": 0}
+            attempt_started = time.perf_counter()
+            try:
+                output = call(models[position], attempt)
+                problems = check(output)
+            except Exception as e:
+                if last:
+                    raise
+                problems = [f"error:{type(e).__name__}"]
+            attempt["seconds"] = round(time.perf_counter() - attempt_started, 3)
+            attempt["problems"] = problems
+            attempts.append(attempt)
+            if not problems or last:
+                break
+            reasons.extend(problems)
+
+        decision = {
+            "kind": kind,
+            "model": attempts[-1]["model"],
+            "escalated": attempts[-1]["model"] != models[0],
+            "reasons": reasons,
+            "attempts": attempts,
+            "seconds": round(time.perf_counter() - started, 3),
+            "prompt_tokens": sum(attempt["prompt_tokens"] for attempt in attempts),
+            "completion_tokens": sum(attempt["completion_tokens"] for attempt in attempts),
+            "cost": round(attempts_cost(attempts), 6),
+        }
+        attrs.update(model=decision["model"], escalated=decision["escalated"], reasons=reasons, attempts=len(attempts),
+                     completion_tokens=decision["completion_tokens"], cost=decision["cost"])
+    if decision["escalated"]:
+        logging.info(f"{kind} escalated to {decision['model']} ({', '.join(reasons)})")
+    return output, decision
+
+# Function to describe a routing decision in one line for the page
+def decision_line(decision):
+    line = f"Model: {decision['model']}"
+    if decision["escalated"]:
+        line += f", escalated because of {', '.join(reason.replace('_', ' ') for reason in decision['reasons'])}"
+    return line + f" ({decision['seconds']:.1f}s, {decision['prompt_tokens'] + decision['completion_tokens']} tokens, ${decision['cost']:.4f})"
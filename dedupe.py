@@ -0,0 +1,81 @@
+import re
+from collections import defaultdict
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+# Duplicate detection for news results.
+#
+# The same story shows up under several URLs (http/https, www./m./amp. hosts, AMP paths,
+# tracking parameters) and, when syndicated, under slightly different titles ("... - Reuters",
+# "... | AP News"). normalize_url() maps the URL variants to one key; TitleIndex finds titles
+# whose word sets overlap by at least NEAR_DUPLICATE_TITLE (Jaccard) once the publisher
+# suffix is removed, using an inverted index so only titles sharing a word are compared.
+
+NEAR_DUPLICATE_TITLE = 0.8
+
+TRACKING_PARAM_PREFIXES = ("utm_", "mc_", "pk_")
+TRACKING_PARAMS = frozenset({"fbclid", "gclid", "dclid", "msclkid", "ocid", "cmpid", "smid", "ref", "ref_src", "src", "guccounter", "taid", "ito", "at_medium", "at_campaign"})
+HOST_PREFIXES = ("www.", "m.", "amp.", "mobile.")
+
+PUBLISHER_SUFFIX_PATTERN = re.compile(r"\s+[-|–—]\s+[^-|–—]{1,40}$")
+WORD_PATTERN = re.compile(r"\w+")
+TITLE_STOP_WORDS = frozenset("a an and the of to in on for at by with from as is are was be".split())
+
+
+# Function to normalize a URL so variants of the same article compare equal
+def normalize_url(url):
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    path = parts.path.rstrip("/")
+    if path.endswith("/amp"):
+        path = path[:-len("/amp")]
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith(TRACKING_PARAM_PREFIXES) and name.lower() not in TRACKING_PARAMS
+    )
+    return f"{host}{path}" + (f"?{urlencode(query)}" if query else "")
+
+# Function to reduce a title to its set of significant words, without the publisher suffix
+def title_words(title):
+    stripped = PUBLISHER_SUFFIX_PATTERN.sub("", title or "")
+    return frozenset(word for word in WORD_PATTERN.findall(stripped.lower()) if word not in TITLE_STOP_WORDS)
+
+# Function to compute the Jaccard similarity of two word sets
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# Index of titles for near-duplicate lookups
+class TitleIndex:
+    def __init__(self, threshold=NEAR_DUPLICATE_TITLE):
+        self.threshold = threshold
+        self._titles = []
+        self._postings = defaultdict(list)
+
+    # Function to add a title with a value returned by find() when it matches
+    def add(self, title, value=None):
+        words = title_words(title)
+        position = len(self._titles)
+        self._titles.append((words, value))
+        for word in words:
+            self._postings[word].append(position)
+
+    # Function to return the value of the most similar indexed title at or above the threshold, or None
+    def find(self, title):
+        words = title_words(title)
+        candidates = {position for word in words for position in self._postings.get(word, ())}
+        best, best_score = None, self.threshold
+        for position in candidates:
+            indexed_words, value = self._titles[position]
+            score = jaccard(words, indexed_words)
+            if score >= best_score:
+                best, best_score = (value if value is not None else position), score
+        return best
+
+    def __len__(self):
+        return len(self._titles)
@@ -0,0 +1,253 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from resources import get_chat_model
+from ratelimit import call_with_retry
+
+# Token-budgeted map-reduce summarization.
+#
+# Articles that fit ARTICLE_TOKEN_BUDGET are summarized in one call as before. Longer ones are
+# split on paragraph / sentence boundaries into CHUNK_TOKEN_BUDGET chunks that are summarized in
+# parallel and then reduced hierarchically, never sending more than REDUCE_TOKEN_BUDGET tokens
+# in one prompt. The same reduction merges per-article summaries into one cited digest.
+# Tokens are counted locally (tiktoken, or ~4 characters per token without it) and every call
+# is recorded in a TokenUsage, so the UI can show tokens and cost per run.
+
+ARTICLE_TOKEN_BUDGET = int(os.environ.get("SPOTLIGHT_ARTICLE_TOKEN_BUDGET", 12000))
+CHUNK_TOKEN_BUDGET = int(os.environ.get("SPOTLIGHT_CHUNK_TOKEN_BUDGET", 3000))
+REDUCE_TOKEN_BUDGET = int(os.environ.get("SPOTLIGHT_REDUCE_TOKEN_BUDGET", 6000))
+MAP_WORKERS = 4
+
+# USD per million (prompt, completion) tokens
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+MAP_PROMPT = "Summarize the key facts of the following part of a news article in at most {words} words:\n\n{text}"
+REDUCE_PROMPT = "The following are summaries of consecutive parts of one news article. Combine them into a single summary of {words} words:\n\n{text}"
+DIGEST_PROMPT = (
+    "Below are summaries of news articles, each starting with its citation marker. "
+    "Write a single digest of about {words} words that merges overlapping facts, states each fact once, "
+    "and cites every fact with the marker(s) of the articles it comes from, e.g. [1] or [2][3]. "
+    "Only use the markers given below.\n\n{text}"
+)
+UPDATE_DIGEST_PROMPT = (
+    "Below is a news digest followed by summaries of newly published articles, each starting with its citation marker. "
+    "Rewrite the digest in about {words} words so it includes the new facts, states each fact once, keeps the citation "
+    "markers of facts that remain, and cites new facts with the markers of the new articles. "
+    "Only use the markers given below.\n\nCurrent digest:\n{digest}\n\nNew articles:\n\n{text}"
+)
+
+PARAGRAPH_PATTERN = re.compile(r"\n\s*\n")
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+# Function to get the tiktoken encoding for a model, or None if tiktoken is unavailable
+def get_encoding(model):
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoding = tiktoken.get_encoding("o200k_base")
+            except Exception:
+                encoding = None  # Not installed, or its BPE files cannot be downloaded
+            _encodings[model] = encoding
+        return _encodings[model]
+
+# Function to count the tokens of text for a model
+def count_tokens(text, model="gpt-4o-mini"):
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+# Function to split text into pieces of at most budget tokens, preferring paragraph, then sentence boundaries
+def chunk_text(text, budget=CHUNK_TOKEN_BUDGET, model="gpt-4o-mini"):
+    pieces = []
+    for paragraph in PARAGRAPH_PATTERN.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph, model) <= budget:
+            pieces.append(paragraph)
+            continue
+        for sentence in SENTENCE_PATTERN.split(paragraph):
+            # A single sentence over budget is cut by characters as a last resort
+            step = budget * 4
+            pieces.extend(sentence[i:i + step] for i in range(0, len(sentence), step))
+    return pack_texts(pieces, budget, model)
+
+# Function to greedily group texts (in order) into joined chunks of at most budget tokens
+def pack_texts(texts, budget, model="gpt-4o-mini", separator="\n\n"):
+    chunks, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = count_tokens(text, model)
+        if current and current_tokens + tokens > budget:
+            chunks.append(separator.join(current))
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+# Thread-safe token and cost accounting for one run
+class TokenUsage:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.escalations = 0
+        self.by_model = {}
+
+    def add(self, model, prompt_tokens, completion_tokens):
+        with self._lock:
+            self.calls += 1
+            totals = self.by_model.setdefault(model, [0, 0])
+            totals[0] += prompt_tokens
+            totals[1] += completion_tokens
+
+    # Function to count a request the model cascade moved to a larger model
+    def add_escalation(self):
+        with self._lock:
+            self.escalations += 1
+
+    # Function to add the calls and tokens recorded by another TokenUsage
+    def merge(self, other):
+        with self._lock:
+            self.calls += other.calls
+            self.escalations += other.escalations
+            for model, (prompt_tokens, completion_tokens) in other.by_model.items():
+                totals = self.by_model.setdefault(model, [0, 0])
+                totals[0] += prompt_tokens
+                totals[1] += completion_tokens
+
+    @property
+    def prompt_tokens(self):
+        return sum(totals[0] for totals in self.by_model.values())
+
+    @property
+    def completion_tokens(self):
+        return sum(totals[1] for totals in self.by_model.values())
+
+    # Estimated cost in USD; models without a known price count as free
+    def cost(self):
+        total = 0.0
+        for model, (prompt_tokens, completion_tokens) in self.by_model.items():
+            prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+            total += (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+        return total
+
+    def summary_line(self):
+        line = f"LLM calls: {self.calls} · prompt tokens: {self.prompt_tokens:,} · completion tokens: {self.completion_tokens:,} · estimated cost: ${self.cost():.4f}"
+        if self.escalations:
+            line += f" · escalated to a larger model: {self.escalations}"
+        return line
+
+
+# Function to run one prompt through a shared chat model and record its token usage
+def run_llm(prompt, api_key, model, usage=None, callbacks=None):
+    llm = get_chat_model(api_key, model, streaming=bool(callbacks))
+    answer = call_with_retry("openai", lambda: llm.invoke(prompt, config={"callbacks": callbacks} if callbacks else None)).content
+    if usage is not None:
+        usage.add(model, count_tokens(prompt, model), count_tokens(answer, model))
+    return answer
+
+# Function to reduce texts to one with prompt, hierarchically so no prompt exceeds REDUCE_TOKEN_BUDGET.
+# Only the final call gets the callbacks, so streaming shows the finished summary.
+def reduce_texts(texts, prompt, api_key, model, words, usage=None, callbacks=None):
+    level = list(texts)
+    while True:
+        groups = pack_texts(level, REDUCE_TOKEN_BUDGET, model)
+        if len(groups) == 1:
+            return run_llm(prompt.format(words=words, text=groups[0]), api_key, model, usage, callbacks)
+        with ThreadPoolExecutor(max_workers=MAP_WORKERS) as executor:
+            level = list(executor.map(
+                lambda group: run_llm(prompt.format(words=words, text=group), api_key, model, usage),
+                groups
+            ))
+
+# Function to get the size of the largest single prompt sent when text_tokens tokens are summarized:
+# the whole text if it fits in one prompt of single_budget tokens, otherwise a chunk or a reduce
+# group, which never exceed their budgets
+def largest_prompt_tokens(text_tokens, single_budget=ARTICLE_TOKEN_BUDGET):
+    if text_tokens <= single_budget:
+        return text_tokens
+    return max(CHUNK_TOKEN_BUDGET, REDUCE_TOKEN_BUDGET)
+
+# Function to summarize an article that is too long for one prompt: parallel chunk summaries, then reduce
+def summarize_long_text(text, api_key, model, word_count, usage=None, callbacks=None):
+    chunks = chunk_text(text, CHUNK_TOKEN_BUDGET, model)
+    with ThreadPoolExecutor(max_workers=MAP_WORKERS) as executor:
+        partials = list(executor.map(
+            lambda chunk: run_llm(MAP_PROMPT.format(words=word_count, text=chunk), api_key, model, usage),
+            chunks
+        ))
+    return reduce_texts(partials, REDUCE_PROMPT, api_key, model, word_count, usage, callbacks)
+
+# Function to write a digest with model, or through the model cascade (see cascade.py) when model
+# is "auto": write(model, usage) writes it with one model, and the cascade retries on a larger
+# model when the digest comes out far shorter than word_count. prompt_tokens is the largest
+# single prompt; routing, if given, receives the routing decision.
+def write_digest(write, model, prompt_tokens, word_count, usage=None, routing=None):
+    from cascade import run_cascade, summary_problems, AUTO_MODEL
+    if model != AUTO_MODEL:
+        return write(model, usage)
+
+    def call(attempt_model, stats):
+        attempt_usage = TokenUsage()
+        try:
+            return write(attempt_model, attempt_usage)
+        finally:
+            stats.update(prompt_tokens=attempt_usage.prompt_tokens, completion_tokens=attempt_usage.completion_tokens)
+            if usage is not None:
+                usage.merge(attempt_usage)
+
+    digest, decision = run_cascade("digest", prompt_tokens, call, lambda digest: summary_problems(digest, word_count))
+    if usage is not None and decision["escalated"]:
+        usage.add_escalation()
+    if routing is not None:
+        routing.update(decision)
+    return digest
+
+# Function to merge per-article summaries into a single deduplicated digest.
+# cited_summaries is a list of (marker, summary) pairs such as ("[1]", "...").
+def build_digest(cited_summaries, api_key, model, word_count, usage=None, callbacks=None, routing=None):
+    if not cited_summaries:
+        return ""
+    if len(cited_summaries) == 1:
+        marker, summary = cited_summaries[0]
+        return f"{summary} {marker}"
+    texts = [f"{marker} {summary}" for marker, summary in cited_summaries]
+    prompt_tokens = largest_prompt_tokens(sum(count_tokens(text) for text in texts), REDUCE_TOKEN_BUDGET)
+    return write_digest(
+        lambda model, usage: reduce_texts(texts, DIGEST_PROMPT, api_key, model, word_count, usage, callbacks),
+        model, prompt_tokens, word_count, usage, routing
+    )
+
+# Function to fold new (marker, summary) pairs into an existing digest without rebuilding it from
+# every article. New summaries that do not fit next to the digest are first merged into one
+# cited digest of their own, so the update prompt stays within REDUCE_TOKEN_BUDGET.
+def update_digest(digest, cited_summaries, api_key, model, word_count, usage=None, callbacks=None, routing=None):
+    if not digest:
+        return build_digest(cited_summaries, api_key, model, word_count, usage, callbacks, routing)
+    if not cited_summaries:
+        return digest
+    new_text = "\n\n".join(f"{marker} {summary}" for marker, summary in cited_summaries)
+    text_tokens = count_tokens(digest) + count_tokens(new_text)
+
+    def write(model, usage):
+        text = new_text
+        if text_tokens > REDUCE_TOKEN_BUDGET:
+            text = build_digest(cited_summaries, api_key, model, word_count, usage)
+        return run_llm(UPDATE_DIGEST_PROMPT.format(words=word_count, digest=digest, text=text), api_key, model, usage, callbacks)
+
+    return write_digest(write, model, largest_prompt_tokens(text_tokens, REDUCE_TOKEN_BUDGET), word_count, usage, routing)
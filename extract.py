@@ -0,0 +1,182 @@
+import codecs
+import os
+import re
+import time
+from html.parser import HTMLParser
+
+# Pluggable article text extraction.
+#
+# Every backend takes an iterable of decoded HTML chunks and returns the article text, so the
+# byte cap and per-page timeout applied while reading the response hold for all of them.
+#   fast          - built-in streaming parser with boilerplate removal and main-text scoring
+#   unstructured  - unstructured's partition_html, the same output as UnstructuredURLLoader
+
+DEFAULT_EXTRACTOR = os.environ.get("SPOTLIGHT_EXTRACTOR", "fast")
+
+# Per-page limits while downloading an article
+MAX_PAGE_BYTES = int(os.environ.get("SPOTLIGHT_MAX_PAGE_BYTES", 3 * 1024 * 1024))
+PAGE_TIMEOUT_SECONDS = float(os.environ.get("SPOTLIGHT_PAGE_TIMEOUT", 15))
+
+# Tags whose whole subtree is never article text
+# (not form: ASP.NET and similar sites wrap the whole page in one)
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "canvas", "iframe", "button", "select", "nav", "header", "footer", "aside", "figure"}
+# Tags whose text is collected as one block
+BLOCK_TAGS = {"p", "h1", "h2", "h3", "h4", "h5", "h6", "li", "blockquote", "pre", "td", "dd"}
+# Tags that group blocks and compete for the main-text score
+CONTAINER_TAGS = {"div", "article", "main", "section", "body", "td", "ul", "ol"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+# class / id / role tokens of navigation, promos and other boilerplate. Only whole tokens count,
+# so wrappers such as class="layout with-sidebar" or id="aspnetForm" around the article are kept.
+BOILERPLATE_HINTS = frozenset("""
+nav navbar navigation menu footer header sidebar comment comments share sharing social related promo cookie cookies
+cookie-consent consent subscribe newsletter advert advertisement ad ads banner breadcrumb breadcrumbs popup modal
+""".split())
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+# Streaming HTML parser that keeps text blocks and scores their containers as it goes
+class ArticleParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []          # open tags as (tag, container_id or None, skipping)
+        self.skip_depth = 0
+        self.containers = []     # per container: [tag, parent_id, score]
+        self.blocks = []         # (text, container_ids, link_chars, tag)
+        self.block = None        # [tag, parts, link_chars, container_ids] while inside a block
+        self.in_link = 0
+
+    def _container_ids(self):
+        return [entry[1] for entry in self.stack if entry[1] is not None]
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            if tag == "br" and self.block is not None:
+                self.block[1].append("\n")
+            return
+        attrs = dict(attrs)
+        hints = f"{attrs.get('class') or ''} {attrs.get('id') or ''} {attrs.get('role') or ''}".lower().split()
+        skipping = tag in SKIP_TAGS or (tag != "body" and not BOILERPLATE_HINTS.isdisjoint(hints))
+        if self.skip_depth or skipping:
+            self.skip_depth += 1
+            self.stack.append((tag, None, True))
+            return
+        if tag in BLOCK_TAGS and self.block is not None and self.block[0] == "p":
+            self._close_block()
+        container_id = None
+        if tag in CONTAINER_TAGS:
+            parents = self._container_ids()
+            container_id = len(self.containers)
+            self.containers.append([tag, parents[-1] if parents else None, 0.0])
+        self.stack.append((tag, container_id, False))
+        if tag == "a":
+            self.in_link += 1
+        if tag in BLOCK_TAGS and self.block is None:
+            self.block = [tag, [], 0, self._container_ids()]
+
+    def handle_endtag(self, tag):
+        # Pop to the matching open tag; stray end tags are ignored
+        if not any(entry[0] == tag for entry in self.stack):
+            return
+        while self.stack:
+            open_tag, _, skipping = self.stack.pop()
+            if skipping:
+                self.skip_depth -= 1
+            elif open_tag == "a":
+                self.in_link = max(0, self.in_link - 1)
+            if self.block is not None and open_tag == self.block[0]:
+                self._close_block()
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.skip_depth or self.block is None:
+            return
+        self.block[1].append(data)
+        if self.in_link:
+            self.block[2] += len(data.strip())
+
+    def _close_block(self):
+        tag, parts, link_chars, container_ids = self.block
+        self.block = None
+        text = WHITESPACE_PATTERN.sub(" ", "".join(parts)).strip()
+        if not text:
+            return
+        self.blocks.append((text, container_ids, link_chars, tag))
+        # Readability-style scoring: long, comma-rich paragraphs vote for their container
+        # and, at half weight, for the container above it
+        if tag == "p" and len(text) >= 25 and container_ids:
+            score = 1 + text.count(",") + min(len(text) / 100, 3)
+            score *= 1 - min(link_chars / len(text), 1)
+            self.containers[container_ids[-1]][2] += score
+            if len(container_ids) > 1:
+                self.containers[container_ids[-2]][2] += score / 2
+
+    def close(self):
+        super().close()
+        if self.block is not None:
+            self._close_block()
+
+    # Return the text of the best scoring container, skipping link-heavy blocks
+    def article_text(self):
+        best = None
+        for container_id, (tag, _, score) in enumerate(self.containers):
+            if tag in ("article", "main"):
+                score *= 1.25
+            if score > 0 and (best is None or score > best[1]):
+                best = (container_id, score)
+        lines = []
+        for text, container_ids, link_chars, tag in self.blocks:
+            if best is not None and best[0] not in container_ids:
+                continue
+            if link_chars / len(text) > 0.5:
+                continue
+            if best is None and tag not in ("p", "h1", "h2", "h3") and len(text) < 80:
+                continue
+            lines.append(text)
+        return "\n\n".join(lines)
+
+
+# Function to extract article text with the built-in streaming parser
+def extract_fast(chunks):
+    parser = ArticleParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    return parser.article_text()
+
+# Function to extract article text with unstructured (imported lazily; it is slow to import)
+def extract_unstructured(chunks):
+    from unstructured.partition.html import partition_html
+    elements = partition_html(text="".join(chunks))
+    return "\n\n".join(str(element) for element in elements)
+
+
+EXTRACTORS = {
+    "fast": extract_fast,
+    "unstructured": extract_unstructured,
+}
+
+# Function to decode a streamed response into text chunks, stopping at the byte cap or deadline.
+# The number of bytes read is left in stats["bytes"] when a stats dict is given.
+def iter_html_chunks(response, max_bytes=MAX_PAGE_BYTES, timeout=PAGE_TIMEOUT_SECONDS, stats=None):
+    # requests falls back to ISO-8859-1 for text/* without a charset; most news pages are UTF-8
+    content_type = response.headers.get("Content-Type", "").lower()
+    encoding = response.encoding if "charset" in content_type and response.encoding else "utf-8"
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    deadline = time.monotonic() + timeout
+    received = 0
+    for raw in response.iter_content(chunk_size=64 * 1024):
+        received += len(raw)
+        if received > max_bytes:
+            raw = raw[:len(raw) - (received - max_bytes)]
+        if stats is not None:
+            stats["bytes"] = min(received, max_bytes)
+        yield decoder.decode(raw)
+        if received >= max_bytes or time.monotonic() > deadline:
+            break
+    response.close()
+    yield decoder.decode(b"", final=True)
+
+# Function to extract text from a streamed response with the named backend
+def extract_response(response, extractor=DEFAULT_EXTRACTOR, max_bytes=MAX_PAGE_BYTES, timeout=PAGE_TIMEOUT_SECONDS, stats=None):
+    return EXTRACTORS[extractor](iter_html_chunks(response, max_bytes, timeout, stats))
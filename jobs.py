@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from cache import CACHE_DIR
+
+# Local background job runner.
+#
+# Jobs run on an in-process worker pool so a long search/fetch/summarize no longer blocks the
+# Streamlit script thread. Their status, progress and results are persisted in SQLite, so a
+# rerun or a reconnecting browser can pick a job up again by its ID. Handlers are registered
+# per job kind and called as handler(params, secrets, progress); secrets (API keys) are only
+# kept in memory and never written to the database. Each job holds a lease that the process which
+# queued it renews every few seconds while it is alive; an active job whose lease has expired was
+# cut off by a restart or crash and is marked interrupted. Other processes sharing the database
+# (the second page, batch.py, watch.py) leave live jobs alone, and process IDs, which are reused
+# across container restarts, are never relied on.
+
+JOBS_DB = os.path.join(CACHE_DIR, "jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("SPOTLIGHT_JOB_WORKERS", 4))
+MAX_ACTIVE_JOBS_PER_USER = int(os.environ.get("SPOTLIGHT_MAX_JOBS_PER_USER", 2))
+
+# Seconds an active job stays owned by its process without a renewal; renewed every third of that
+JOB_LEASE_SECONDS = float(os.environ.get("SPOTLIGHT_JOB_LEASE_SECONDS", 30))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+# Identifies this process's lifetime; unlike the PID it is never reused after a restart
+BOOT_ID = uuid.uuid4().hex
+
+_handlers = {}
+_local = threading.local()
+_submit_lock = threading.Lock()
+_heartbeat = None
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+
+
+class JobLimitError(Exception):
+    pass
+
+
+# Function to get this thread's connection to the jobs database
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(JOBS_DB), exist_ok=True)
+        conn = sqlite3.connect(JOBS_DB, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        _local.conn = conn
+    return conn
+
+# Function to create the jobs table and mark jobs orphaned by dead processes as interrupted
+def _init_db():
+    with _connect() as conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, user TEXT NOT NULL, kind TEXT NOT NULL, params TEXT NOT NULL, "
+            "status TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0, message TEXT, result TEXT, error TEXT, "
+            "pid INTEGER NOT NULL, created REAL NOT NULL, started REAL, finished REAL)"
+        )
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("boot_id", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_user_created ON jobs (user, created)")
+    _expire_leases()
+
+# Function to mark active jobs whose owning process stopped renewing their lease as interrupted
+def _expire_leases():
+    now = time.time()
+    with _connect() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'interrupted', message = 'The worker process stopped before the job finished.', finished = ? "
+            "WHERE status IN (?, ?) AND (lease_until IS NULL OR lease_until < ?)",
+            (now, *ACTIVE_STATUSES, now)
+        )
+
+# Function run on a daemon thread: renews the leases of this process's active jobs while it lives
+def _renew_leases():
+    while True:
+        try:
+            with _connect() as conn:
+                conn.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE boot_id = ? AND status IN (?, ?)",
+                    (time.time() + JOB_LEASE_SECONDS, BOOT_ID, *ACTIVE_STATUSES)
+                )
+        except sqlite3.Error as e:
+            logging.warning(f"Could not renew job leases: {e}")
+        time.sleep(JOB_LEASE_SECONDS / 3)
+
+def _update(job_id, **fields):
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with _connect() as conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+def _row_to_job(row):
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+
+# Function to register the handler that runs jobs of a kind
+def register_job_handler(kind, handler):
+    _handlers[kind] = handler
+
+# Function to queue a job for user; raises JobLimitError if the user already has too many active jobs
+def submit_job(user, kind, params, secrets=None):
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    global _heartbeat
+    job_id = uuid.uuid4().hex[:12]
+    _expire_leases()
+    with _submit_lock:
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_renew_leases, name="job-leases", daemon=True)
+            _heartbeat.start()
+        with _connect() as conn:
+            active = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE user = ? AND status IN (?, ?)", (user, *ACTIVE_STATUSES)
+            ).fetchone()[0]
+            if active >= MAX_ACTIVE_JOBS_PER_USER:
+                raise JobLimitError(f"You already have {active} jobs running; wait for one to finish.")
+            conn.execute(
+                "INSERT INTO jobs (id, user, kind, params, status, pid, boot_id, lease_until, created) VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, user, kind, json.dumps(params), os.getpid(), BOOT_ID, time.time() + JOB_LEASE_SECONDS, time.time())
+            )
+    _executor.submit(_run_job, job_id, kind, params, secrets or {})
+    return job_id
+
+def _run_job(job_id, kind, params, secrets):
+    _update(job_id, status="running", started=time.time())
+
+    def progress(fraction, message=None):
+        _update(job_id, progress=max(0.0, min(1.0, fraction)), message=message)
+
+    try:
+        result = _handlers[kind](params, secrets, progress)
+        _update(job_id, status="done", progress=1.0, result=json.dumps(result), finished=time.time())
+    except Exception as e:
+        logging.error(f"Job {job_id} ({kind}) failed: {e}", exc_info=True)
+        _update(job_id, status="failed", error=str(e), finished=time.time())
+
+# Function to fetch one job by ID, or None
+def get_job(job_id):
+    row = _connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id.strip(),)).fetchone()
+    return _row_to_job(row) if row is not None else None
+
+# Function to list a user's most recent jobs, newest first
+def list_jobs(user, limit=20):
+    _expire_leases()
+    rows = _connect().execute(
+        "SELECT * FROM jobs WHERE user = ? ORDER BY created DESC LIMIT ?", (user, limit)
+    ).fetchall()
+    return [_row_to_job(row) for row in rows]
+
+
+# Function to show the user's job status panel and, on request, one job's result.
+# The status list refreshes itself every few seconds; render_result(result, key) draws a finished job.
+def show_job_panel(user, render_result):
+    @st.fragment(run_every=3)
+    def job_status():
+        jobs = list_jobs(user, limit=10)
+        if not jobs:
+            return
+        st.markdown("### Jobs")
+        for job in jobs:
+            label = f"`{job['id']}` {job['kind']}: {job['params'].get('query', '')}"
+            if job["status"] in ACTIVE_STATUSES:
+                st.progress(job["progress"], text=f"{label} ({job['message'] or job['status']})")
+            elif job["status"] == "done":
+                st.write(f"{label} (done in {job['finished'] - job['created']:.1f}s)")
+            else:
+                st.write(f"{label} ({job['status']}: {job['error'] or job['message']})")
+
+    job_status()
+    job_id = st.text_input("Open a job by ID", key="open_job_id")
+    if job_id:
+        job = get_job(job_id)
+        if job is None or job["user"] != user:
+            st.warning(f"No job with ID {job_id}.")
+        elif job["status"] == "done":
+            render_result(job["result"], key=job["id"])
+        elif job["status"] in ACTIVE_STATUSES:
+            st.info(f"Job {job['id']} is {job['status']} ({job['progress']:.0%}).")
+        else:
+            st.error(f"Job {job['id']} {job['status']}: {job['error'] or job['message']}")
+
+
+_init_db()
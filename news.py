@@ -0,0 +1,325 @@
+import json
+import logging
+import os
+import queue
+import re
+import time
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
+from cache import article_cache, summary_cache, summary_key, ARTICLE_FRESH_SECONDS
+from extract import extract_response, DEFAULT_EXTRACTOR, PAGE_TIMEOUT_SECONDS
+from resources import get_session, get_summarize_chain
+from digest import count_tokens, summarize_long_text, largest_prompt_tokens, build_digest, TokenUsage, ARTICLE_TOKEN_BUDGET
+from serpapi import serpapi_search
+from jobs import register_job_handler
+from telemetry import span
+from ratelimit import http_get, call_with_retry, CONNECT_TIMEOUT
+from singleflight import flights
+from cascade import run_cascade, summary_problems, decision_line, AUTO_MODEL, CASCADE_MODELS
+
+# Browser-like user agent so news sites serve the full article page
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_5_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"
+
+# Model used by summarize_text when none is given
+SUMMARY_MODEL = "gpt-4o-mini"
+# Model that writes the per-article summaries and digests, or "auto" for the model cascade (see cascade.py)
+ARTICLE_SUMMARY_MODEL = os.environ.get("SPOTLIGHT_SUMMARY_MODEL", AUTO_MODEL)
+
+# Default number of articles fetched and summarized at the same time
+DEFAULT_MAX_WORKERS = 4
+
+# Function to convert relative dates ("3 hours ago", "a day ago") to exact dates
+def convert_relative_date(relative_date_str):
+    today = datetime.today()
+    words = relative_date_str.split()
+    if not words:
+        return None
+    if words[0] in ("a", "an"):
+        amount = 1
+    elif words[0].isdigit():
+        amount = int(words[0])
+    else:
+        return None  # Absolute dates and text such as "Yesterday" are not relative dates
+
+    if 'hour' in relative_date_str:
+        exact_date = today - timedelta(hours=amount)
+    elif 'day' in relative_date_str:
+        exact_date = today - timedelta(days=amount)
+    elif 'week' in relative_date_str:
+        exact_date = today - timedelta(weeks=amount)
+    elif 'month' in relative_date_str:
+        exact_date = today - relativedelta(months=amount)
+    elif 'year' in relative_date_str:
+        exact_date = today - relativedelta(years=amount)
+    else:
+        exact_date = None  # Return None if unable to parse
+
+    return exact_date.strftime("%Y-%m-%d") if exact_date else None
+
+# Function to perform a Google search query using SerpAPI. With engines (e.g. ["google", "google_news"])
+# the query is fanned out to those engines in parallel and the results merged (see aggregator.py).
+# source "archive" searches the local article archive instead, "mixed" merges both (see archive.py).
+def search_news(query, serpapi_api_key, num_results, engines=None, source="live"):
+    if source != "live":
+        from archive import search_with_archive
+        return search_with_archive(query, num_results, source, lambda: search_news(query, serpapi_api_key, num_results, engines))
+    if engines and list(engines) != ["google"]:
+        from aggregator import aggregate_search
+        return aggregate_search(query, num_results, {"serpapi_api_key": serpapi_api_key}, engines)
+    params = {
+        "engine": "google",
+        "q": query,
+        "num": num_results,
+        "api_key": serpapi_api_key
+    }
+    return serpapi_search(params)
+
+# Function to turn [n] markers into Markdown links to the n-th reference
+def link_citations(text, references):
+    def link(match):
+        number = int(match.group(1))
+        return f"[[{number}]]({references[number - 1]})" if 0 < number <= len(references) else match.group(0)
+    return re.sub(r"\[(\d+)\]", link, text)
+
+# Function to download an article and extract its text.
+# The text is cached per URL together with the response's ETag / Last-Modified: while the entry
+# is fresh no request is made at all; after that a conditional GET revalidates it, and a
+# 304 reuses the cached text without re-extracting the page. Each extractor has its own entries.
+def load_article_text(link, extractor=DEFAULT_EXTRACTOR):
+    with span("article_fetch", extractor=extractor, bytes=0) as attrs:
+        cache_key = json.dumps([extractor, link])
+        text = fresh_article_text(cache_key)
+        if text is not None:
+            attrs["cache"] = "fresh"
+            return text
+
+        def fetch():
+            cached = article_cache.get(cache_key)
+            headers = {"User-Agent": USER_AGENT}
+            if cached is not None:
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    headers["If-Modified-Since"] = cached["last_modified"]
+
+            response = http_get(get_session("articles"), link, headers=headers, verify=False, stream=True,
+                                timeout=(CONNECT_TIMEOUT, PAGE_TIMEOUT_SECONDS), stats=attrs)
+            if cached is not None and response.status_code == 304:
+                response.close()
+                attrs["cache"] = "revalidated"
+                cached["fetched"] = time.time()
+                article_cache.set(cache_key, cached)
+                return cached["text"]
+            response.raise_for_status()
+
+            attrs["cache"] = "miss"
+            text = extract_response(response, extractor, stats=attrs)
+            article_cache.set(cache_key, {
+                "text": text,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "fetched": time.time(),
+            })
+            return text
+
+        # Sessions opening the same article at once share one fetch
+        attrs["cache"] = "shared"
+        return flights.do(f"article:{cache_key}", fetch, recheck=lambda: fresh_article_text(cache_key))
+
+# Function to get an article's cached text if it was fetched within ARTICLE_FRESH_SECONDS, or None
+def fresh_article_text(cache_key):
+    cached = article_cache.get(cache_key)
+    if cached is not None and time.time() - cached["fetched"] < ARTICLE_FRESH_SECONDS:
+        return cached["text"]
+    return None
+
+# Function to get the callback class that forwards streamed LLM tokens for one article to a queue
+# drained by the Streamlit thread (defined on first use, so langchain is only imported when summarizing)
+@lru_cache(maxsize=None)
+def token_queue_handler_class():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TokenQueueHandler(BaseCallbackHandler):
+        def __init__(self, tokens, index):
+            self.tokens = tokens
+            self.index = index
+
+        def on_llm_new_token(self, token, **kwargs):
+            self.tokens.put((self.index, token))
+
+        # Function to start the partial summary over (the cascade moved to a larger model)
+        def restart(self):
+            self.tokens.put((self.index, None))
+
+    return TokenQueueHandler
+
+# Function to summarize a single search result; identical (text, model, prompt) reuse the cached summary.
+# When callbacks are given the model is called in streaming mode so they receive each token.
+# Articles over ARTICLE_TOKEN_BUDGET are summarized chunk by chunk (see digest.py).
+# archive, if given, is a list that receives the article's record for the local archive.
+def summarize_article(item, openai_api_key, word_count, callbacks=None, extractor=DEFAULT_EXTRACTOR, usage=None, archive=None,
+                      model=ARTICLE_SUMMARY_MODEL):
+    text = load_article_text(item['link'], extractor)
+    template = f"Write a summary of the following in {word_count} words:\n\n{{text}}"
+    key = summary_key(text, model, template)
+    summary = summary_cache.get(key)
+    if summary is None:
+        # The same article summarized by several sessions at once goes to the model once;
+        # only the session whose call runs sees the streamed tokens
+        def run():
+            summary = summarize_text(item, text, template, openai_api_key, word_count, callbacks, usage, model)
+            summary_cache.set(key, summary)
+            return summary
+
+        summary = flights.do(f"summary:{key}", run, recheck=lambda: summary_cache.get(key))
+    if archive is not None:
+        archive.append({"title": item.get('title', ""), "link": item['link'], "date": item.get('date'), "summary": summary, "text": text,
+                        "word_count": word_count, "model": model})
+    return summary
+
+# Function to summarize an article's text with the model.
+# With model "auto" the summary comes from the model cascade, which retries on a larger model
+# when the summary is far shorter than word_count; routing, if given, then receives the routing
+# decision. stats, if given, receives the tokens used.
+def summarize_text(item, text, template, openai_api_key, word_count, callbacks=None, usage=None, model=SUMMARY_MODEL, stats=None,
+                   routing=None):
+    if model == AUTO_MODEL:
+        summary, decision = run_cascade(
+            "summary", largest_prompt_tokens(count_tokens(text, CASCADE_MODELS[0])),
+            lambda model, stats: summarize_text(item, text, template, openai_api_key, word_count, callbacks, usage, model, stats),
+            lambda summary: summary_problems(summary, word_count),
+            on_escalate=lambda: restart_streams(callbacks)
+        )
+        if usage is not None and decision["escalated"]:
+            usage.add_escalation()
+        if routing is not None:
+            routing.update(decision)
+        return summary
+
+    with span("summarize_chain", model=model) as attrs:
+        text_tokens = count_tokens(text, model)
+        attrs["chunked"] = text_tokens > ARTICLE_TOKEN_BUDGET
+        if not attrs["chunked"]:
+            from langchain_core.documents import Document
+            chain = get_summarize_chain(openai_api_key, model, template, streaming=bool(callbacks))
+            documents = [Document(page_content=text, metadata={"source": item['link']})]
+            summary = call_with_retry("openai", lambda: chain.run(documents, callbacks=callbacks), stats=attrs)
+            attrs["prompt_tokens"] = count_tokens(template.format(text=text), model)
+            attrs["completion_tokens"] = count_tokens(summary, model)
+            if usage is not None:
+                usage.add(model, attrs["prompt_tokens"], attrs["completion_tokens"])
+        else:
+            attrs["prompt_tokens"] = text_tokens
+            summary = summarize_long_text(text, openai_api_key, model, word_count, usage, callbacks)
+            attrs["completion_tokens"] = count_tokens(summary, model)
+        if stats is not None:
+            stats.update(prompt_tokens=attrs["prompt_tokens"], completion_tokens=attrs["completion_tokens"])
+    return summary
+
+# Function to tell streaming callbacks that the text they received so far is being replaced
+def restart_streams(callbacks):
+    for callback in callbacks or []:
+        if hasattr(callback, "restart"):
+            callback.restart()
+
+# Function to summarize search results in parallel.
+# Yields (index, item, text, error, done) tuples; index is the position in `items`, so callers
+# can render into pre-allocated slots and keep the original result order. With stream=True,
+# partial summaries are yielded (done=False) as tokens arrive; every article ends with exactly
+# one done=True tuple carrying the final summary or the error. Worker threads never touch Streamlit.
+# Results from the archive whose summary was written for the same word count and model are
+# yielded first with it; every newly summarized article is added to the archive in one batch at the end.
+def summarize_results(items, openai_api_key, word_count, max_workers=DEFAULT_MAX_WORKERS, stream=False, extractor=DEFAULT_EXTRACTOR, usage=None,
+                      model=ARTICLE_SUMMARY_MODEL):
+    items = list(items)
+    reusable = {index for index, item in enumerate(items)
+                if item.get("summary") and item.get("summary_word_count") == word_count and item.get("summary_model") == model}
+    for index in sorted(reusable):
+        yield index, items[index], items[index]["summary"], None, True
+    to_summarize = [index for index in range(len(items)) if index not in reusable]
+    if not to_summarize:
+        return
+    tokens = queue.Queue()
+    partials = {}
+    archived = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_summarize)))) as executor:
+        futures = {
+            executor.submit(summarize_article, items[index], openai_api_key, word_count,
+                            callbacks=[token_queue_handler_class()(tokens, index)] if stream else None,
+                            extractor=extractor, usage=usage, archive=archived, model=model): index
+            for index in to_summarize
+        }
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+
+            # Drain the streamed tokens and report each article whose partial summary grew
+            changed = set()
+            while True:
+                try:
+                    index, token = tokens.get_nowait()
+                except queue.Empty:
+                    break
+                partials[index] = "" if token is None else partials.get(index, "") + token
+                changed.add(index)
+            finished_indexes = {futures[future] for future in finished}
+            for index in sorted(changed - finished_indexes):
+                yield index, items[index], partials[index], None, False
+
+            for future in finished:
+                index = futures[future]
+                try:
+                    yield index, items[index], future.result(), None, True
+                except Exception as e:
+                    yield index, items[index], None, e, True
+
+    from archive import archive_articles, ARCHIVE_ENABLED
+    if ARCHIVE_ENABLED:
+        try:
+            archive_articles(archived)
+        except Exception as e:
+            logging.error(f"Could not archive articles: {e}", exc_info=True)
+
+# Function to search and summarize without touching the page (background jobs).
+# With digest=True the summaries are merged into one cited digest, as in "Search & Summarize All".
+def run_summarize(params, secrets, progress, digest=False):
+    result_dict = search_news(params["query"], secrets["serpapi_api_key"], params["num_results"], params.get("engines"), params.get("source", "live"))
+    items = result_dict.get("organic_results", [])[:params["num_results"]]
+    usage = TokenUsage()
+    articles = [None] * len(items)
+    finished = 0
+    progress(0.05, f"Summarizing {len(items)} articles")
+    for index, item, summary, error, done in summarize_results(items, secrets["openai_api_key"], params["word_count"],
+                                                               params["max_workers"], extractor=params["extractor"], usage=usage,
+                                                               model=params.get("model", ARTICLE_SUMMARY_MODEL)):
+        raw_date = item.get('date', 'No date available')
+        exact_date = convert_relative_date(raw_date)
+        articles[index] = {
+            "title": item['title'],
+            "link": item['link'],
+            "date": f"{raw_date} ({exact_date})" if exact_date else raw_date,
+            "summary": summary,
+            "error": str(error) if error is not None else None,
+        }
+        finished += 1
+        progress(0.05 + 0.85 * finished / len(items), f"Summarized {finished} of {len(items)} articles")
+
+    result = {"query": params["query"], "articles": articles, "digest": None, "references": [], "routing": None}
+    if digest:
+        succeeded = [article for article in articles if not article["error"]]
+        result["references"] = [article["link"] for article in succeeded]
+        cited_summaries = [(f"[{n}]", article["summary"]) for n, article in enumerate(succeeded, 1)]
+        progress(0.9, "Merging the summaries into one digest")
+        # The digest covers several articles, so it gets twice the per-article length
+        routing = {}
+        result["digest"] = build_digest(cited_summaries, secrets["openai_api_key"], params.get("model", ARTICLE_SUMMARY_MODEL),
+                                        params["word_count"] * 2, usage, routing=routing)
+        result["routing"] = decision_line(routing) if routing else None
+    result["usage"] = usage.summary_line()
+    return result
+
+
+register_job_handler("summarize", run_summarize)
+register_job_handler("summarize_all", lambda params, secrets, progress: run_summarize(params, secrets, progress, digest=True))
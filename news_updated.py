@@ -1,18 +1,31 @@
 import streamlit as st
 import streamlit_authenticator as stauth
-from langchain.prompts import PromptTemplate
-from langchain.chains.summarize import load_summarize_chain
-from langchain_openai import ChatOpenAI
-from langchain_community.document_loaders import UnstructuredURLLoader
+import copy
 import requests
+import time
 import traceback
-from dateutil.relativedelta import relativedelta
-from datetime import datetime, timedelta
 import yaml
 from yaml.loader import SafeLoader
+from news import summarize_results, convert_relative_date, search_news, link_citations, DEFAULT_MAX_WORKERS, ARTICLE_SUMMARY_MODEL
+from cascade import decision_line, AUTO_MODEL, CASCADE_MODELS
+from digest import TokenUsage, build_digest
+from extract import EXTRACTORS, DEFAULT_EXTRACTOR
+from aggregator import search_backends, DEFAULT_ENGINES
+from archive import archive_stats, SOURCES
+from jobs import submit_job, show_job_panel, JobLimitError
+from cache import search_cache
+from resources import resource_stats
+from singleflight import singleflight_stats
+from watch import add_topic, remove_topic, list_topics, start_watch_scheduler, WATCH_INTERVALS
+
+# Function to parse the credentials once per process. Plain-text passwords are hashed here, once,
+# instead of by the authenticator on every rerun; each run gets its own copy to modify.
+@st.cache_resource
+def load_credentials():
+    return stauth.Hasher.hash_passwords(yaml.safe_load(st.secrets["general"]["credentials"]))
 
 # Load credentials and configuration from Streamlit Secrets
-credentials = yaml.safe_load(st.secrets["general"]["credentials"])
+credentials = copy.deepcopy(load_credentials())
 cookie_name = st.secrets["general"]["cookie_name"]
 cookie_key = st.secrets["general"]["cookie_key"]
 cookie_expiry_days = st.secrets["general"]["cookie_expiry_days"]
@@ -26,8 +39,10 @@ authenticator = stauth.Authenticate(
     None  # No preauthorized emails in this example
 )
 
-# Display the login form in the sidebar
-name, authentication_status, username = authenticator.login('main')
+# Display the login form in the sidebar. The outcome is read from the session state, which every
+# streamlit-authenticator version sets; 0.4 no longer returns it from login().
+authenticator.login('main')
+name, authentication_status, username = (st.session_state.get(key) for key in ("name", "authentication_status", "username"))
 
 if authentication_status:
     # Successful login
@@ -66,6 +81,24 @@ if authentication_status:
         st.header("Search Settings")
         num_results = st.number_input("Number of Search Results", min_value=1, max_value=15, value=1)
         word_count = st.slider("Summary Word Count", min_value=100, max_value=300, value=100, step=10)
+        max_workers = st.slider("Parallel Articles", min_value=1, max_value=8, value=DEFAULT_MAX_WORKERS, help="How many articles are fetched and summarized at the same time.")
+        source = SOURCES[st.radio("Search In", list(SOURCES), help="The archive holds every article summarized before and answers instantly; mixing adds live results it does not have yet.")]
+        engines = st.multiselect("Search Engines", search_backends(), default=[engine for engine in DEFAULT_ENGINES if engine in search_backends()], help="Several engines are searched in parallel; duplicate stories are merged and the newest come first.")
+        summary_models = [AUTO_MODEL] + CASCADE_MODELS
+        summary_model = st.selectbox("Summary Model", summary_models, index=summary_models.index(ARTICLE_SUMMARY_MODEL) if ARTICLE_SUMMARY_MODEL in summary_models else 0,
+                                     format_func=lambda name: "Auto (cheapest that passes the checks)" if name == AUTO_MODEL else name,
+                                     help="Auto summarizes with the smallest model and redoes a summary with a larger one only when it comes out far shorter than asked.")
+        extractor = st.selectbox("Article Extractor", list(EXTRACTORS), index=list(EXTRACTORS).index(DEFAULT_EXTRACTOR), help="'fast' is the built-in parser; 'unstructured' is slower but matches the original loader.")
+        run_in_background = st.checkbox("Run in background", value=False, help="Queue summaries as a job; follow it in the Jobs panel below and come back for the result later.")
+        stream_summaries = st.checkbox("Stream summaries", value=True, help="Show summaries word by word as they are generated.")
+        cache_stats = search_cache.stats()
+        st.caption(f"Search cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} entries")
+        stored = archive_stats()
+        st.caption(f"Archive: {stored['articles']} articles, {stored['bytes'] / 1e6:.1f} MB")
+        connection_stats = resource_stats()
+        st.caption(f"HTTP connections opened: {connection_stats['connections_opened']}, clients built: {connection_stats['clients_created'] + connection_stats['chains_created']}")
+        flight_stats = singleflight_stats()
+        st.caption(f"Shared requests: {flight_stats['shared']} of {flight_stats['calls']} joined one already in flight")
 
     # Add a custom header for the main section
     st.markdown("""
@@ -86,44 +119,50 @@ if authentication_status:
     # Function to log errors
     def log_error(e):
         st.error(f"Exception occurred: {str(e)}")
-        st.error(traceback.format_exc())
-
-    # Function to convert relative dates to exact dates
-    def convert_relative_date(relative_date_str):
-        today = datetime.today()
-
-        if 'hour' in relative_date_str:
-            hours_ago = int(relative_date_str.split()[0])
-            exact_date = today - timedelta(hours=hours_ago)
-        elif 'day' in relative_date_str:
-            days_ago = int(relative_date_str.split()[0])
-            exact_date = today - timedelta(days=days_ago)
-        elif 'week' in relative_date_str:
-            weeks_ago = int(relative_date_str.split()[0])
-            exact_date = today - timedelta(weeks=weeks_ago)
-        elif 'month' in relative_date_str:
-            months_ago = int(relative_date_str.split()[0])
-            exact_date = today - relativedelta(months=months_ago)
-        elif 'year' in relative_date_str:
-            years_ago = int(relative_date_str.split()[0])
-            exact_date = today - relativedelta(years=years_ago)
-        else:
-            exact_date = None  # Return None if unable to parse
+        st.error("".join(traceback.format_exception(type(e), e, e.__traceback__)))
+
+    # Function to queue a summarize run as a background job
+    def submit_summarize_job(kind):
+        try:
+            job_id = submit_job(
+                username, kind,
+                {"query": search_query, "num_results": num_results, "word_count": word_count, "max_workers": max_workers, "extractor": extractor, "engines": engines, "source": source,
+                 "model": summary_model},
+                {"openai_api_key": openai_api_key, "serpapi_api_key": serpapi_api_key}
+            )
+            st.success(f"Summaries queued as job {job_id}.")
+        except JobLimitError as e:
+            st.error(str(e))
+
+    # Function to describe how long ago a timestamp was
+    def time_ago(timestamp):
+        minutes = int((time.time() - timestamp) // 60)
+        if minutes < 60:
+            return f"{minutes} min ago"
+        return f"{minutes // 60} h {minutes % 60} min ago"
 
-        return exact_date.strftime("%Y-%m-%d") if exact_date else None
+    # Function to display the result of a background summarize job
+    def render_summaries(result, key=None):
+        if result.get("digest"):
+            st.markdown("### Combined Summary")
+            st.markdown(link_citations(result["digest"], result["references"]))
+            st.markdown("### References")
+            for i, link in enumerate(result["references"], 1):
+                st.write(f"{i}. [Link to article]({link})")
+        else:
+            for article in result["articles"]:
+                if article["error"]:
+                    st.error(f"Failed to summarize article: {article['title']} ({article['error']})")
+                else:
+                    st.success(f"**Title:** {article['title']}\n\n**Link:** {article['link']}\n\n**Date:** {article['date']}\n\n**Summary:** {article['summary']}")
+        if result.get("routing"):
+            st.caption(f"Digest {result['routing']}")
+        st.caption(result["usage"])
 
-    # Function to perform a Google search query using SerpAPI
-    def search_query_serpapi(query, serpapi_api_key, num_results):
+    # Function to perform a Google search query using SerpAPI (or several engines, merged, or the archive)
+    def search_query_serpapi(query, serpapi_api_key, num_results, engines, source):
         try:
-            params = {
-                "engine": "google",
-                "q": query,
-                "num": num_results,
-                "api_key": serpapi_api_key
-            }
-            response = requests.get("https://serpapi.com/search", params=params)
-            response.raise_for_status()  # Raise an error for bad responses
-            return response.json()
+            return search_news(query, serpapi_api_key, num_results, engines, source)
         except requests.exceptions.RequestException as e:
             log_error(e)
             return None
@@ -135,7 +174,7 @@ if authentication_status:
         else:
             try:
                 with st.spinner("Please wait..."):
-                    result_dict = search_query_serpapi(search_query, serpapi_api_key, num_results)
+                    result_dict = search_query_serpapi(search_query, serpapi_api_key, num_results, engines, source)
                     if not result_dict or 'organic_results' not in result_dict:
                         st.error(f"No search results for: {search_query}.")
                     else:
@@ -143,7 +182,8 @@ if authentication_status:
                             raw_date = item.get('date', 'No date available')
                             exact_date = convert_relative_date(raw_date)
                             display_date = f"{raw_date} ({exact_date})" if exact_date else raw_date
-                            st.success(f"**Title:** {item['title']}\n\n**Link:** {item['link']}\n\n**Date:** {display_date}\n\n**Snippet:** {item.get('snippet', 'No snippet available')}")
+                            archived = " (archived)" if item.get("archived") else ""
+                            st.success(f"**Title:** {item['title']}{archived}\n\n**Link:** {item['link']}\n\n**Date:** {display_date}\n\n**Snippet:** {item.get('snippet', 'No snippet available')}")
             except Exception as e:
                 log_error(e)
 
@@ -151,34 +191,35 @@ if authentication_status:
     if col2.button("Search & Summarize"):
         if not search_query.strip():
             st.error("Please provide the missing fields.")
+        elif run_in_background:
+            submit_summarize_job("summarize")
         else:
             try:
                 with st.spinner("Please wait..."):
-                    result_dict = search_query_serpapi(search_query, serpapi_api_key, num_results)
+                    result_dict = search_query_serpapi(search_query, serpapi_api_key, num_results, engines, source)
                     if not result_dict or 'organic_results' not in result_dict:
                         st.error(f"No search results for: {search_query}.")
                     else:
-                        for i, item in zip(range(num_results), result_dict['organic_results']):
-                            try:
-                                loader = UnstructuredURLLoader(
-                                    urls=[item['link']],
-                                    ssl_verify=False,
-                                    headers={
-                                        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_5_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"
-                                    }
-                                )
-                                data = loader.load()
-                                llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", openai_api_key=openai_api_key)
-                                prompt_template = PromptTemplate(template=f"Write a summary of the following in {word_count} words:\n\n{{text}}", input_variables=["text"])
-                                chain = load_summarize_chain(llm, chain_type="stuff", prompt=prompt_template)
-                                summary = chain.run(data)
-                                raw_date = item.get('date', 'No date available')
-                                exact_date = convert_relative_date(raw_date)
-                                display_date = f"{raw_date} ({exact_date})" if exact_date else raw_date
-                                st.success(f"**Title:** {item['title']}\n\n**Link:** {item['link']}\n\n**Date:** {display_date}\n\n**Summary:** {summary}")
-                            except Exception as e:
-                                st.error(f"Failed to summarize article: {item['title']}")
-                                log_error(e)
+                        items = result_dict['organic_results'][:num_results]
+                        usage = TokenUsage()
+                        # One slot per result so summaries render in search order as they finish
+                        placeholders = [st.empty() for _ in items]
+                        for index, item, summary, error, done in summarize_results(items, openai_api_key, word_count, max_workers, stream=stream_summaries, extractor=extractor, usage=usage,
+                                                                                   model=summary_model):
+                            if error is not None:
+                                with placeholders[index].container():
+                                    st.error(f"Failed to summarize article: {item['title']}")
+                                    log_error(error)
+                                continue
+                            raw_date = item.get('date', 'No date available')
+                            exact_date = convert_relative_date(raw_date)
+                            display_date = f"{raw_date} ({exact_date})" if exact_date else raw_date
+                            message = f"**Title:** {item['title']}\n\n**Link:** {item['link']}\n\n**Date:** {display_date}\n\n**Summary:** {summary}"
+                            if done:
+                                placeholders[index].success(message)
+                            else:
+                                placeholders[index].info(message)
+                        st.caption(usage.summary_line())
             except Exception as e:
                 log_error(e)
 
@@ -186,44 +227,93 @@ if authentication_status:
     if col3.button("Search & Summarize All"):
         if not search_query.strip():
             st.error("Please provide the missing fields.")
+        elif run_in_background:
+            submit_summarize_job("summarize_all")
         else:
             try:
                 with st.spinner("Please wait..."):
-                    result_dict = search_query_serpapi(search_query, serpapi_api_key, num_results)
+                    result_dict = search_query_serpapi(search_query, serpapi_api_key, num_results, engines, source)
                     if not result_dict or 'organic_results' not in result_dict:
                         st.error(f"No search results for: {search_query}.")
                     else:
-                        combined_summary = ""
-                        references = []
-                        for i, item in zip(range(num_results), result_dict['organic_results']):
+                        items = result_dict['organic_results'][:num_results]
+                        summaries = [None] * len(items)
+                        completed = [False] * len(items)
+                        usage = TokenUsage()
+
+                        # Display the combined summary, growing it in search order as articles finish
+                        st.markdown("### Combined Summary")
+                        combined_placeholder = st.empty()
+                        for index, item, summary, error, done in summarize_results(items, openai_api_key, word_count, max_workers, stream=stream_summaries, extractor=extractor, usage=usage,
+                                                                                   model=summary_model):
+                            if error is not None:
+                                # Drop any partial text streamed before the failure
+                                summaries[index] = None
+                                st.error(f"Failed to summarize article: {item['title']}")
+                                log_error(error)
+                            else:
+                                summaries[index] = summary
+                                completed[index] = done
+                            combined_summary = "".join(f"{s}\n\n" for s in summaries if s is not None)
+                            combined_placeholder.write(combined_summary)
+
+                        # Replace the concatenated summaries with one deduplicated digest citing [n] = n-th reference
+                        references = [item['link'] for item, done in zip(items, completed) if done]
+                        cited_summaries = [(f"[{n}]", summaries[index]) for n, index in enumerate((i for i, done in enumerate(completed) if done), 1)]
+                        if len(cited_summaries) > 1:
                             try:
-                                loader = UnstructuredURLLoader(
-                                    urls=[item['link']],
-                                    ssl_verify=False,
-                                    headers={
-                                        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 13_5_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36"
-                                    }
-                                )
-                                data = loader.load()
-                                llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", openai_api_key=openai_api_key)
-                                prompt_template = PromptTemplate(template=f"Write a summary of the following in {word_count} words:\n\n{{text}}", input_variables=["text"])
-                                chain = load_summarize_chain(llm, chain_type="stuff", prompt=prompt_template)
-                                summary = chain.run(data)
-                                combined_summary += f"{summary}\n\n"
-                                references.append(item['link'])
+                                with st.spinner("Merging the summaries into one digest..."):
+                                    # The digest covers several articles, so it gets twice the per-article length
+                                    routing = {}
+                                    digest = build_digest(cited_summaries, openai_api_key, summary_model, word_count * 2, usage, routing=routing)
+                                combined_placeholder.markdown(link_citations(digest, references))
+                                if routing:
+                                    st.caption(f"Digest {decision_line(routing)}")
                             except Exception as e:
-                                st.error(f"Failed to summarize article: {item['title']}")
+                                st.error("Failed to merge the summaries; showing them one by one.")
                                 log_error(e)
 
-                        # Display the combined summary and references
-                        st.markdown("### Combined Summary")
-                        st.write(combined_summary)
+                        # Display the references
                         st.markdown("### References")
                         for i, link in enumerate(references, 1):
                             st.write(f"{i}. [Link to article]({link})")
+                        st.caption(usage.summary_line())
             except Exception as e:
                 log_error(e)
 
+    # Saved topics, polled in the background; each poll only summarizes articles not seen before
+    start_watch_scheduler({"openai_api_key": openai_api_key, "serpapi_api_key": serpapi_api_key})
+    with st.expander("Watched topics"):
+        watch_col1, watch_col2 = st.columns([1, 1])
+        interval_label = watch_col1.selectbox("Check every", list(WATCH_INTERVALS), index=1)
+        if watch_col2.button("Watch this query", disabled=not search_query.strip()):
+            add_topic(username, search_query, WATCH_INTERVALS[interval_label],
+                      {"num_results": num_results, "word_count": word_count, "max_workers": max_workers, "extractor": extractor, "engines": engines,
+                       "model": summary_model})
+            st.success(f"Watching \"{search_query}\"; the first check runs shortly.")
+        for topic in list_topics(username):
+            st.markdown(f"#### {topic['query']}")
+            if topic["last_polled"]:
+                st.caption(f"Checked {time_ago(topic['last_polled'])}, {topic['new_items']} new articles; every {topic['interval'] / 60:.0f} min")
+            else:
+                st.caption("Not checked yet")
+            if topic["digest"]:
+                st.markdown(link_citations(topic["digest"], topic["references"]))
+            topic_col1, topic_col2 = st.columns([1, 1])
+            if topic_col1.button("Check now", key=f"poll-{topic['id']}"):
+                try:
+                    job_id = submit_job(username, "watch_poll", {"topic_id": topic["id"], "query": topic["query"]},
+                                        {"openai_api_key": openai_api_key, "serpapi_api_key": serpapi_api_key})
+                    st.success(f"Check queued as job {job_id}.")
+                except JobLimitError as e:
+                    st.error(str(e))
+            if topic_col2.button("Stop watching", key=f"unwatch-{topic['id']}"):
+                remove_topic(username, topic["id"])
+                st.rerun()
+
+    # Background jobs of this user, with their results on request
+    show_job_panel(username, render_summaries)
+
 elif authentication_status == False:
     st.error('Username/password is incorrect')
 
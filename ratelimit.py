@@ -0,0 +1,248 @@
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+
+# Shared client layer for outbound calls: rate limits, timeouts, retries and circuit breakers.
+#
+# Every provider ("serpapi", "openai", and "host:<domain>" for article sites) can get a token
+# bucket that allows `rate` requests per second with bursts of up to `burst`; throttle(provider)
+# blocks until a request may go out. call_with_retry() runs a call under the provider's limit
+# and circuit breaker and retries 429s, 5xx responses, connection errors and timeouts with
+# jittered exponential backoff, waiting for Retry-After instead when the server sends it. After
+# BREAKER_FAILURES consecutive calls failed (each after using up its retries) the breaker opens
+# and calls fail fast with CircuitOpenError for BREAKER_RESET_SECONDS, then a single probe call,
+# made without retries, decides whether it closes again. Limits come from SPOTLIGHT_RATE_<PROVIDER> (requests per second), from
+# SPOTLIGHT_RATE_PER_HOST for article hosts, or from set_rate(), e.g. in the batch CLI.
+
+CONNECT_TIMEOUT = float(os.environ.get("SPOTLIGHT_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.environ.get("SPOTLIGHT_READ_TIMEOUT", 30))
+# OpenAI completions can take a while to start streaming, so they get a longer read timeout
+OPENAI_READ_TIMEOUT = float(os.environ.get("SPOTLIGHT_OPENAI_TIMEOUT", 120))
+MAX_RETRIES = int(os.environ.get("SPOTLIGHT_MAX_RETRIES", 3))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 20
+# A Retry-After longer than this is not waited for; the call fails instead
+RETRY_AFTER_MAX_SECONDS = 60
+BREAKER_FAILURES = int(os.environ.get("SPOTLIGHT_BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS = float(os.environ.get("SPOTLIGHT_BREAKER_RESET", 30))
+HOST_RATE = float(os.environ.get("SPOTLIGHT_RATE_PER_HOST", 2))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Raised without calling the provider while its circuit breaker is open
+class CircuitOpenError(requests.exceptions.RequestException):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Function to take one token, sleeping until it is available; returns the seconds waited
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+# Closed: calls go through. Open: calls fail fast. Half-open: one probe call is let through.
+class CircuitBreaker:
+    def __init__(self, provider, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.provider = provider
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened = 0.0
+        self._lock = threading.Lock()
+
+    # Function to let a call through or raise CircuitOpenError; returns "half_open" for the probe call
+    def before_call(self):
+        with self._lock:
+            if self.state == "closed":
+                return self.state
+            remaining = self._opened + self.reset_seconds - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+                return self.state
+            raise CircuitOpenError(f"{self.provider} is unavailable after repeated failures; retrying in {max(0, remaining):.0f}s")
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self._consecutive = 0
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self.state == "half_open" or self._consecutive >= self.failures:
+                if self.state != "open":
+                    logging.warning(f"Circuit breaker for {self.provider} opened after {self._consecutive} failures")
+                    _stats["breaker_opened"] += 1
+                self.state = "open"
+                self._opened = time.monotonic()
+
+
+_lock = threading.Lock()
+_buckets = {}
+_breakers = {}
+_stats = {"calls": 0, "retries": 0, "failures": 0, "breaker_opened": 0, "throttled_seconds": 0.0}
+
+
+# Function to limit a provider to rate requests per second (None removes the limit)
+def set_rate(provider, rate, burst=None):
+    with _lock:
+        if rate:
+            _buckets[provider] = TokenBucket(rate, burst)
+        else:
+            _buckets.pop(provider, None)
+
+# Function to get the limiter key of an article host, e.g. "host:example.com"
+def host_provider(url):
+    return f"host:{urlparse(url).netloc.lower()}"
+
+# Function to wait until a request to provider is allowed; returns the seconds waited
+def throttle(provider):
+    with _lock:
+        bucket = _buckets.get(provider)
+        if bucket is None and provider.startswith("host:") and HOST_RATE:
+            bucket = _buckets[provider] = TokenBucket(HOST_RATE)
+    waited = bucket.acquire() if bucket is not None else 0.0
+    if waited:
+        with _lock:
+            _stats["throttled_seconds"] += waited
+    return waited
+
+# Function to get the circuit breaker of a provider
+def get_breaker(provider):
+    with _lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(provider)
+        return breaker
+
+# Function to close every circuit breaker, e.g. between benchmark phases
+def reset_breakers():
+    with _lock:
+        _breakers.clear()
+
+# Function to report call, retry and breaker counters and the breakers that are not closed
+def limiter_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["open_breakers"] = sorted(provider for provider, breaker in _breakers.items() if breaker.state != "closed")
+    return stats
+
+
+# Function to get the HTTP status of a requests or openai error, if it carries one
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+# Function to decide whether an error is worth retrying (rate limited, server error, network)
+def is_retryable(error):
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    import openai
+    return isinstance(error, openai.APIConnectionError)  # Includes APITimeoutError
+
+# Function to read the Retry-After header (seconds or an HTTP date) of an error's response
+def retry_after_seconds(error):
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# Function to compute the backoff before retry number attempt (0-based): full jitter up to an exponential cap
+def backoff_delay(attempt):
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+# Function to call fn() under provider's rate limit and circuit breaker, retrying transient failures.
+# The breaker sees one outcome per call, not per attempt, so a single flaky request cannot trip it.
+# stats, if given, collects "throttled" seconds and "retries" (e.g. a span's attributes).
+def call_with_retry(provider, fn, retries=MAX_RETRIES, stats=None):
+    breaker = get_breaker(provider)
+    if breaker.before_call() == "half_open":
+        retries = 0
+    for attempt in range(retries + 1):
+        if attempt:
+            breaker.before_call()  # Another call may have opened the breaker meanwhile
+        waited = throttle(provider)
+        with _lock:
+            _stats["calls"] += 1
+        if stats is not None:
+            stats["throttled"] = stats.get("throttled", 0) + waited
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_retryable(e):
+                breaker.success()  # The provider answered; the request itself was bad
+                raise
+            with _lock:
+                _stats["failures"] += 1
+            delay = retry_after_seconds(e)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            if attempt == retries or delay > RETRY_AFTER_MAX_SECONDS:
+                breaker.failure()
+                raise
+            with _lock:
+                _stats["retries"] += 1
+            if stats is not None:
+                stats["retries"] = stats.get("retries", 0) + 1
+            # The error text is not logged: request URLs can carry API keys
+            logging.warning(f"{provider} call failed ({type(e).__name__} {_status_code(e) or ''}); retry {attempt + 1} of {retries} in {delay:.1f}s")
+            time.sleep(delay)
+        else:
+            breaker.success()
+            return result
+
+# Function to GET url with session under the host's (or provider's) limits, with timeouts and retries.
+# Retryable statuses raise HTTPError after the last attempt; other statuses are left to the caller.
+def http_get(session, url, provider=None, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), stats=None, **kwargs):
+    def attempt():
+        response = session.get(url, timeout=timeout, **kwargs)
+        if response.status_code in RETRY_STATUSES:
+            response.close()
+            raise requests.exceptions.HTTPError(f"{response.status_code} from {url}", response=response)
+        return response
+
+    return call_with_retry(provider or host_provider(url), attempt, stats=stats)
+
+
+for _provider in ("serpapi", "openai"):
+    _rate = os.environ.get(f"SPOTLIGHT_RATE_{_provider.upper()}")
+    if _rate:
+        set_rate(_provider, float(_rate))
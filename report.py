@@ -0,0 +1,136 @@
+import io
+import re
+import zipfile
+from docx import Document as DocxDocument
+from docx.opc.constants import RELATIONSHIP_TYPE
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from analysis import parse_answer, TEXT, CITATION, LINE_BREAK
+from telemetry import span
+
+# DOCX report builder.
+#
+# Builds the answer and references directly as WordprocessingML elements and inserts each
+# section's paragraphs into the body in one step, instead of going through a python-docx proxy
+# per paragraph and per run. Every external URL gets a single hyperlink relationship that is
+# reused for each later occurrence; python-docx would otherwise scan all relationships of the
+# part on every link. Several reports can be exported together as a zip of DOCX files.
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+ZIP_MIME = "application/zip"
+
+SLUG_PATTERN = re.compile(r"[^A-Za-z0-9]+")
+
+
+# Function to build a w:r element holding text
+def _run(text):
+    run = OxmlElement('w:r')
+    t = OxmlElement('w:t')
+    t.set(qn('xml:space'), 'preserve')
+    t.text = text
+    run.append(t)
+    return run
+
+
+class DocxReport:
+    def __init__(self):
+        self.document = DocxDocument()
+        self._relationships = {}
+
+    # Function to get the relationship id of an external URL, created once per URL
+    def relationship_id(self, url):
+        # Ensure the URL is valid
+        if not url.startswith(('http://', 'https://')):
+            url = 'http://' + url  # Prepend http:// if no protocol is provided
+        r_id = self._relationships.get(url)
+        if r_id is None:
+            r_id = self.document.part.relate_to(url, RELATIONSHIP_TYPE.HYPERLINK, is_external=True)
+            self._relationships[url] = r_id
+        return r_id
+
+    # Function to build a w:hyperlink element showing text and pointing at url
+    def hyperlink(self, url, text):
+        hyperlink = OxmlElement('w:hyperlink')
+        hyperlink.set(qn('r:id'), self.relationship_id(url))
+        hyperlink.append(_run(text))
+        return hyperlink
+
+    # Function to insert paragraph elements at the end of the body, before the section properties
+    def _append(self, paragraphs):
+        body = self.document.element.body
+        sect_pr = body.find(qn('w:sectPr'))
+        index = body.index(sect_pr) if sect_pr is not None else len(body)
+        body[index:index] = paragraphs
+
+    # Function to add the answer, one paragraph per line with citations as hyperlinks.
+    # tokens, if given, is the parse_answer() stream of answer, so it is not parsed twice.
+    def add_answer(self, answer, citations, tokens=None, heading="Answer"):
+        if tokens is None:
+            tokens = parse_answer(answer, citations)
+        self.document.add_heading(heading, level=1)
+        paragraphs = [OxmlElement('w:p')]
+        for kind, value in tokens:
+            if kind == LINE_BREAK:
+                paragraphs.append(OxmlElement('w:p'))
+            elif kind == CITATION:
+                paragraphs[-1].append(self.hyperlink(citations[value], value))
+            elif kind == TEXT:
+                paragraphs[-1].append(_run(value))
+        self._append(paragraphs)
+
+    # Function to add the references, one "[n] url" paragraph per citation
+    def add_references(self, citations, heading="References"):
+        self.document.add_heading(heading, level=1)
+        paragraphs = []
+        for citation, link in citations.items():
+            p = OxmlElement('w:p')
+            p.append(_run(f"{citation} "))
+            p.append(self.hyperlink(link, link))
+            paragraphs.append(p)
+        self._append(paragraphs)
+
+    # Function to add a whole analysis result ({query, answer, citations}) with its query as title
+    def add_report(self, result, tokens=None):
+        if result.get("query"):
+            self.document.add_heading(result["query"], level=0)
+        self.add_answer(result["answer"], result["citations"], tokens)
+        self.add_references(result["citations"])
+
+    # Function to serialize the document into a BytesIO positioned at the start
+    def to_bytes(self):
+        with span("save_to_docx", relationships=len(self._relationships)) as attrs:
+            docx_file = io.BytesIO()
+            self.document.save(docx_file)
+            attrs["bytes"] = docx_file.tell()
+        docx_file.seek(0)
+        return docx_file
+
+
+# Function to save the response and references to a DOCX file.
+# tokens, if given, is the parse_answer() stream of answer, so it is not parsed twice.
+def save_to_docx(answer, citations, tokens=None):
+    report = DocxReport()
+    report.add_answer(answer, citations, tokens)
+    report.add_references(citations)
+    return report.to_bytes()
+
+# Function to derive a file name from a query
+def report_file_name(query, extension="docx"):
+    slug = SLUG_PATTERN.sub("-", query or "").strip("-").lower()[:60]
+    return f"{slug or 'analysis_report'}.{extension}"
+
+# Function to export several analysis results as a zip holding one DOCX per result
+def export_reports_zip(results):
+    zip_file = io.BytesIO()
+    used = set()
+    with zipfile.ZipFile(zip_file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for i, result in enumerate(results, 1):
+            name = report_file_name(result.get("query"))
+            if name in used:
+                name = report_file_name(f"{result.get('query')} {i}")
+            used.add(name)
+            report = DocxReport()
+            report.add_report(result)
+            archive.writestr(name, report.to_bytes().getvalue())
+    zip_file.seek(0)
+    return zip_file
@@ -0,0 +1,141 @@
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from ratelimit import CONNECT_TIMEOUT, OPENAI_READ_TIMEOUT
+
+# Process-wide registry of expensive, reusable objects: keep-alive HTTP sessions, OpenAI
+# clients and summarize chains. Streamlit reruns and article worker threads all share them,
+# so connection pools (and their TLS sessions) survive across requests. Clients are keyed by
+# a fingerprint of the API key, so a rotated key transparently gets fresh ones. Connections
+# opened by the sessions and by the OpenAI clients' httpx pools are counted for the sidebar.
+# openai and langchain are only imported when the first client or chain is built, so pages
+# that never call a model do not pay for them.
+
+# Connections kept open per host; should cover the article worker pool
+POOL_SIZE = 16
+
+_lock = threading.RLock()
+_sessions = {}
+_clients = {}
+_models = {}
+_chains = {}
+_stats = {"sessions_created": 0, "clients_created": 0, "chains_created": 0, "openai_connections_opened": 0}
+
+
+# HTTP adapter that counts the connections its pools open. The count lives on the adapter, so
+# it keeps growing when the pool manager evicts a host's pool (beyond POOL_SIZE hosts).
+class CountingHTTPAdapter(HTTPAdapter):
+    def __init__(self, *args, **kwargs):
+        self._connections_opened = 0
+        self._count_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        def counting(pool_class):
+            class CountingPool(pool_class):
+                def _new_conn(self):
+                    connection = super()._new_conn()
+                    with adapter._count_lock:
+                        adapter._connections_opened += 1
+                    return connection
+            return CountingPool
+
+        # A new dict, so the pool classes of other pool managers are left alone
+        self.poolmanager.pool_classes_by_scheme = {"http": counting(HTTPConnectionPool), "https": counting(HTTPSConnectionPool)}
+
+    def connections_opened(self):
+        return self._connections_opened
+
+
+# Function to count a connection set up by an OpenAI client; an httpcore trace callback
+def _trace_openai_connection(event, info):
+    if event == "connection.connect_tcp.complete":
+        with _lock:
+            _stats["openai_connections_opened"] += 1
+
+# Function to build the httpx client of an OpenAI client or chat model, tracing its connection setups
+def openai_http_client():
+    from openai import DefaultHttpxClient
+
+    def trace(request):
+        request.extensions["trace"] = _trace_openai_connection
+
+    return DefaultHttpxClient(event_hooks={"request": [trace]})
+
+# Function to fingerprint an API key so registry keys never hold the secret itself
+def key_fingerprint(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+# Function to get the shared keep-alive session for a purpose ("serpapi", "articles", ...)
+def get_session(name):
+    with _lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = requests.Session()
+            adapter = CountingHTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[name] = session
+            _stats["sessions_created"] += 1
+        return session
+
+# Function to build the timeout of OpenAI calls (an httpx.Timeout, hence built on demand)
+def openai_timeout():
+    from openai import Timeout
+    return Timeout(OPENAI_READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+# Function to get the shared OpenAI client for an API key
+def get_openai_client(api_key):
+    key = key_fingerprint(api_key)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            from openai import OpenAI
+            # Retries are done by ratelimit.call_with_retry, under the shared limits and circuit breaker
+            client = OpenAI(api_key=api_key, max_retries=0, timeout=openai_timeout(), http_client=openai_http_client())
+            _clients[key] = client
+            _stats["clients_created"] += 1
+        return client
+
+# Function to get a shared LangChain chat model; per-call callbacks go in the invoke config
+def get_chat_model(api_key, model, streaming=False):
+    key = (key_fingerprint(api_key), model, streaming)
+    with _lock:
+        llm = _models.get(key)
+        if llm is None:
+            from langchain_openai import ChatOpenAI
+            llm = ChatOpenAI(temperature=0, model=model, openai_api_key=api_key, streaming=streaming, max_retries=0, timeout=openai_timeout(),
+                             http_client=openai_http_client())
+            _models[key] = llm
+            _stats["clients_created"] += 1
+        return llm
+
+# Function to get a shared "stuff" summarize chain for (model, prompt template).
+# Per-call callbacks are passed to chain.run, so one chain serves every article and session.
+def get_summarize_chain(api_key, model, template, streaming=False):
+    key = (key_fingerprint(api_key), model, template, streaming)
+    with _lock:
+        chain = _chains.get(key)
+        if chain is None:
+            from langchain.prompts import PromptTemplate
+            from langchain.chains.summarize import load_summarize_chain
+            llm = get_chat_model(api_key, model, streaming)
+            prompt_template = PromptTemplate(template=template, input_variables=["text"])
+            chain = load_summarize_chain(llm, chain_type="stuff", prompt=prompt_template)
+            _chains[key] = chain
+            _stats["chains_created"] += 1
+        return chain
+
+# Function to report how many resources were built and how many HTTP connections the sessions and OpenAI clients opened
+def resource_stats():
+    with _lock:
+        stats = dict(_stats)
+        adapters = [session.get_adapter("https://") for session in _sessions.values()]
+    stats["session_connections_opened"] = sum(adapter.connections_opened() for adapter in adapters if isinstance(adapter, CountingHTTPAdapter))
+    stats["connections_opened"] = stats["session_connections_opened"] + stats["openai_connections_opened"]
+    return stats
@@ -0,0 +1,105 @@
+import math
+import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from digest import count_tokens, chunk_text
+from telemetry import span
+
+# Retrieval stage of the Analyze flow: the passages the model answers from.
+#
+# Passages are the search snippets and, optionally, the full text of the cited articles split
+# into PASSAGE_TOKEN_BUDGET chunks. Each keeps the citation marker of its source. They are
+# scored against the question (and search query) with BM25 over the candidate passages, and
+# the best are packed greedily into CONTEXT_TOKEN_BUDGET tokens. Every source's snippet gets a
+# small boost so one long article does not crowd out the others. The packed context goes into
+# the prompt, so the model cites what it was actually shown.
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("SPOTLIGHT_CONTEXT_TOKEN_BUDGET", 1500))
+PASSAGE_TOKEN_BUDGET = int(os.environ.get("SPOTLIGHT_PASSAGE_TOKEN_BUDGET", 200))
+ARTICLE_WORKERS = 4
+BM25_K1 = 1.5
+BM25_B = 0.75
+SNIPPET_BOOST = 1.2
+
+TERM_PATTERN = re.compile(r"\w+")
+STOP_WORDS = frozenset("""
+a an and are as at be but by can did do does for from had has have how i in is it its of on or that the their
+there this to was were what when where which who why will with about into than then they them these those
+""".split())
+
+
+# Function to split text into lowercase terms without stop words
+def terms(text):
+    return [term for term in TERM_PATTERN.findall(text.lower()) if term not in STOP_WORDS]
+
+# Function to score passages against a query with Okapi BM25 (statistics from the passages themselves)
+def bm25_scores(query, passages):
+    documents = [Counter(terms(passage["text"])) for passage in passages]
+    if not documents:
+        return []
+    lengths = [sum(document.values()) for document in documents]
+    average_length = sum(lengths) / len(lengths) or 1
+    frequencies = Counter(term for document in documents for term in document)
+    query_terms = set(terms(query))
+    scores = []
+    for document, length in zip(documents, lengths):
+        score = 0.0
+        for term in query_terms:
+            tf = document.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(documents) - frequencies[term] + 0.5) / (frequencies[term] + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+        scores.append(score)
+    return scores
+
+# Function to collect candidate passages: one per snippet and, with full_text, chunks of each cited article
+def collect_passages(search_results, citations, full_text=False, extractor=None, model="gpt-4o-mini"):
+    passages = []
+    by_link = {link: citation for citation, link in citations.items()}
+    for result in (search_results or {}).get("organic_results", []):
+        citation = by_link.get(result.get("link"))
+        if citation and result.get("snippet"):
+            passages.append({"citation": citation, "text": result["snippet"], "kind": "snippet"})
+    if full_text and citations:
+        from news import load_article_text
+        from extract import DEFAULT_EXTRACTOR
+
+        def load(link):
+            try:
+                return load_article_text(link, extractor or DEFAULT_EXTRACTOR)
+            except Exception:
+                return ""  # The snippet still stands in for an article that cannot be fetched
+
+        with ThreadPoolExecutor(max_workers=ARTICLE_WORKERS) as executor:
+            texts = list(executor.map(load, citations.values()))
+        for citation, text in zip(citations, texts):
+            for chunk in chunk_text(text, PASSAGE_TOKEN_BUDGET, model):
+                passages.append({"citation": citation, "text": chunk, "kind": "article"})
+    return passages
+
+# Function to pick the best passages for question within budget tokens.
+# Returns (context, stats): context lists the chosen passages as "[n] text", grouped by source
+# in citation order; stats holds candidate and chosen passage counts and the context's tokens.
+def build_context(question, passages, budget=CONTEXT_TOKEN_BUDGET, model="gpt-4o-mini"):
+    with span("retrieve", candidates=len(passages), passages=0, tokens=0) as attrs:
+        scores = bm25_scores(question, passages)
+        ranked = sorted(
+            range(len(passages)),
+            key=lambda i: scores[i] * (SNIPPET_BOOST if passages[i]["kind"] == "snippet" else 1.0),
+            reverse=True
+        )
+        chosen, used = [], 0
+        for i in ranked:
+            text = f"{passages[i]['citation']} {passages[i]['text']}"
+            tokens = count_tokens(text, model)
+            if used + tokens > budget:
+                continue  # A shorter passage further down may still fit
+            chosen.append((i, text))
+            used += tokens
+        order = {citation: position for position, citation in enumerate(dict.fromkeys(passage["citation"] for passage in passages))}
+        chosen.sort(key=lambda entry: (order[passages[entry[0]]["citation"]], entry[0]))
+        attrs["passages"] = len(chosen)
+        attrs["tokens"] = used
+    return "\n\n".join(text for _, text in chosen), {"candidates": len(passages), "passages": len(chosen), "tokens": used}
@@ -0,0 +1,194 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+import numpy as np
+from cache import CACHE_DIR
+from dedupe import normalize_url
+
+# Semantic cache of model answers for near-duplicate questions.
+#
+# An entry is keyed on a local embedding of the question and its sorted citation URLs: hashed
+# word and character-trigram features of the question, and one feature per normalized URL,
+# each half L2-normalized and weighted so the cosine similarity of two keys is
+# QUESTION_WEIGHT * (question similarity) + (1 - QUESTION_WEIGHT) * (URL set similarity).
+# A lookup is one matrix-vector product over the in-memory embeddings of fresh entries for the
+# same model; the best match at or above the threshold is served. Entries live in SQLite, so
+# other worker processes see them, and are evicted by age and least recent use; an entry another
+# process deleted is dropped from memory when a lookup finds its row gone.
+
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("SPOTLIGHT_ANSWER_CACHE_THRESHOLD", 0.9))
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get("SPOTLIGHT_ANSWER_CACHE_TTL", 60 * 60))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("SPOTLIGHT_ANSWER_CACHE_MAX_ENTRIES", 5000))
+
+EMBEDDING_DIM = 512
+QUESTION_WEIGHT = 0.6
+
+WORD_PATTERN = re.compile(r"\w+")
+# Words that only phrase the request ("summary of", "what's happening with") and say nothing about the topic
+FILLER_WORDS = frozenset("""
+a an and are about any analysis as at be brief by can comprehensive could describe do does for from give has
+have how i in information is it latest me most news of on or overview please provide recent related s
+summarize summary tell that the there this to up update updates what whats happening going with
+""".split())
+
+
+# Function to add hashed features to a vector half (signed feature hashing with crc32, stable across processes)
+def _hash_features(features, weights, dim):
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, weight in zip(features, weights):
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % dim] += weight if h & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+# Function to embed a question and its citation URLs into one unit vector
+def embed(question, urls):
+    words = [word for word in WORD_PATTERN.findall(question.lower()) if word not in FILLER_WORDS]
+    features, weights = [], []
+    for word in words:
+        features.append(f"w:{word}")
+        weights.append(1.0)
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            features.append(f"c:{padded[i:i + 3]}")
+            weights.append(0.25)
+    question_half = _hash_features(features, weights, EMBEDDING_DIM // 2)
+    normalized = sorted({normalize_url(url) for url in urls})
+    url_half = _hash_features([f"u:{url}" for url in normalized], [1.0] * len(normalized), EMBEDDING_DIM // 2)
+    return np.concatenate([np.sqrt(QUESTION_WEIGHT) * question_half, np.sqrt(1 - QUESTION_WEIGHT) * url_half]).astype(np.float32)
+
+
+class SemanticCache:
+    def __init__(self, name, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL_SECONDS,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, path=None):
+        self.name = name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path or os.path.join(CACHE_DIR, "cache.sqlite3")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._created = np.zeros(0, dtype=np.float64)
+        self._models = np.zeros(0, dtype=object)
+        self._matrix = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self._max_id = 0
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.name} ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, model TEXT NOT NULL, question TEXT NOT NULL, answer TEXT NOT NULL, "
+                "embedding BLOB NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.name}_last_used ON {self.name} (last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_stats (name TEXT PRIMARY KEY, hits INTEGER NOT NULL, misses INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO cache_stats (name, hits, misses) VALUES (?, 0, 0)", (self.name,))
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, conn, column):
+        conn.execute(f"UPDATE cache_stats SET {column} = {column} + 1 WHERE name = ?", (self.name,))
+
+    # Function to load entries added since the last sync (by this or another process) into memory
+    def _sync(self, conn):
+        rows = conn.execute(
+            f"SELECT id, model, embedding, created FROM {self.name} WHERE id > ? AND created >= ? ORDER BY id",
+            (self._max_id, time.time() - self.ttl)
+        ).fetchall()
+        if not rows:
+            return
+        with self._lock:
+            self._ids = np.concatenate([self._ids, np.array([row[0] for row in rows], dtype=np.int64)])
+            self._models = np.concatenate([self._models, np.array([row[1] for row in rows], dtype=object)])
+            self._created = np.concatenate([self._created, np.array([row[3] for row in rows], dtype=np.float64)])
+            self._matrix = np.vstack([self._matrix, np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])])
+            self._max_id = int(rows[-1][0])
+
+    # Function to drop entries from memory by ID
+    def _forget(self, ids):
+        with self._lock:
+            keep = ~np.isin(self._ids, ids)
+            self._ids, self._models, self._created, self._matrix = self._ids[keep], self._models[keep], self._created[keep], self._matrix[keep]
+
+    # Function to find the (id, similarity) of the in-memory entry of model closest to query, or None
+    def _best(self, query, model):
+        with self._lock:
+            if not len(self._ids):
+                return None
+            similarities = self._matrix @ query
+            similarities[self._models != model] = -1.0
+            best = int(np.argmax(similarities))
+            return int(self._ids[best]), float(similarities[best])
+
+    # Function to drop expired entries from memory
+    def _prune(self, now):
+        with self._lock:
+            keep = self._created >= now - self.ttl
+            if not keep.all():
+                self._ids, self._models, self._created, self._matrix = self._ids[keep], self._models[keep], self._created[keep], self._matrix[keep]
+
+    # Return {answer, question, similarity, age} for the closest fresh entry of model, or None
+    def lookup(self, question, urls, model):
+        now = time.time()
+        query = embed(question, urls)
+        with self._connect() as conn:
+            self._sync(conn)
+            self._prune(now)
+            row = None
+            while row is None:
+                candidate = self._best(query, model)
+                if candidate is None or candidate[1] < self.threshold:
+                    break
+                row = conn.execute(f"SELECT answer, question, created FROM {self.name} WHERE id = ?", (candidate[0],)).fetchone()
+                if row is None:
+                    self._forget([candidate[0]])  # Evicted or cleared by another process
+            if row is None:
+                self._count(conn, "misses")
+                return None
+            conn.execute(f"UPDATE {self.name} SET last_used = ? WHERE id = ?", (now, candidate[0]))
+            self._count(conn, "hits")
+        return {"answer": row[0], "question": row[1], "similarity": candidate[1], "age": now - row[2]}
+
+    # Store an answer and evict expired and least recently used entries beyond max_entries
+    def store(self, question, urls, model, answer):
+        now = time.time()
+        vector = embed(question, urls)
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT INTO {self.name} (model, question, answer, embedding, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (model, question, answer, vector.tobytes(), now, now)
+            )
+            conn.execute(f"DELETE FROM {self.name} WHERE created < ?", (now - self.ttl,))
+            evicted = conn.execute(
+                f"SELECT id FROM {self.name} ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+            ).fetchall()
+            if evicted:
+                conn.executemany(f"DELETE FROM {self.name} WHERE id = ?", evicted)
+                self._forget([row[0] for row in evicted])
+            self._sync(conn)
+
+    def stats(self):
+        with self._connect() as conn:
+            hits, misses = conn.execute("SELECT hits, misses FROM cache_stats WHERE name = ?", (self.name,)).fetchone()
+            entries = conn.execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+        return {"hits": hits, "misses": misses, "entries": entries}
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.name}")
+            conn.execute("UPDATE cache_stats SET hits = 0, misses = 0 WHERE name = ?", (self.name,))
+        with self._lock:
+            keep = np.zeros(len(self._ids), dtype=bool)
+            self._ids, self._models, self._created, self._matrix = self._ids[keep], self._models[keep], self._created[keep], self._matrix[keep]
+
+
+answer_cache = SemanticCache("answers")
@@ -0,0 +1,32 @@
+import os
+from cache import search_cache, search_key
+from resources import get_session
+from telemetry import span
+from ratelimit import http_get
+from singleflight import flights
+
+# SerpAPI endpoint; point this at a local stub server (see tools/stub_server.py) for testing
+SERPAPI_URL = os.environ.get("SERPAPI_URL", "https://serpapi.com/search")
+
+# Function to run a SerpAPI search, reusing a recent cached response for the same (engine, q, num);
+# engines that size their results with "count" (Bing) are keyed on it the same way.
+# Identical searches running at the same time share one request (see singleflight.py).
+def serpapi_search(params):
+    key = search_key(params.get("engine", "google"), params["q"], params.get("num", params.get("count")))
+    with span("serpapi", engine=params.get("engine", "google"), cache_hit=True, bytes=0) as attrs:
+        result = search_cache.get(key)
+        if result is not None:
+            return result
+        attrs["cache_hit"] = False
+
+        def fetch():
+            response = http_get(get_session("serpapi"), SERPAPI_URL, provider="serpapi", params=params, stats=attrs)
+            attrs["bytes"] = len(response.content)
+            response.raise_for_status()  # Raise an error for bad responses
+            result = response.json()
+            # SerpAPI reports some failures (bad key, quota) as JSON with an "error" field; never cache those
+            if "error" not in result:
+                search_cache.set(key, result)
+            return result
+
+        return flights.do(f"serpapi:{key}", fetch, recheck=lambda: search_cache.get(key))
@@ -0,0 +1,112 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+from cache import CACHE_DIR
+
+# Request coalescing ("single flight") for upstream calls.
+#
+# When several sessions ask for the same thing at once (a breaking story searched by many users),
+# only the first caller of do(key, fn) runs fn; the others wait for it and receive its result or
+# its exception. Keys are built by the callers from the normalized query, URL or prompt. With
+# SPOTLIGHT_SINGLEFLIGHT_LOCKS=1 the leader also holds an exclusive lock file per key, so leaders
+# in other worker processes wait too; after getting the lock each one calls recheck(), which
+# looks in the shared disk caches for the result the other process stored, before calling fn.
+# Lock files need fcntl (Linux, macOS); elsewhere only in-process coalescing is done.
+# SPOTLIGHT_SINGLEFLIGHT=0 turns coalescing off (every caller runs fn), for comparison.
+
+ENABLED = os.environ.get("SPOTLIGHT_SINGLEFLIGHT", "1") != "0"
+LOCK_DIR = os.path.join(CACHE_DIR, "locks")
+CROSS_PROCESS = os.environ.get("SPOTLIGHT_SINGLEFLIGHT_LOCKS", "0") == "1"
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, enabled=ENABLED, cross_process=CROSS_PROCESS, lock_dir=LOCK_DIR):
+        self.enabled = enabled
+        self.cross_process = cross_process and fcntl is not None
+        self.lock_dir = lock_dir
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"calls": 0, "upstream": 0, "shared": 0, "rechecked": 0, "lock_wait_seconds": 0.0}
+
+    # Function to run fn() once for all concurrent callers with the same key and return its result.
+    # recheck(), if given, returns a result stored by another process while we waited, or None.
+    # Waiting callers get their own copy of the result, as they would from the disk caches.
+    def do(self, key, fn, recheck=None):
+        if not self.enabled:
+            with self._lock:
+                self._stats["calls"] += 1
+                self._stats["upstream"] += 1
+            return fn()
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self._stats["shared"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = self._run(key, fn, recheck)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    # Function to call fn under the key's lock file (when enabled), unless recheck() finds a result first.
+    # The recheck also catches callers that missed the cache just before an earlier flight stored it.
+    def _run(self, key, fn, recheck):
+        if not self.cross_process:
+            result = recheck() if recheck is not None else None
+            with self._lock:
+                self._stats["rechecked" if result is not None else "upstream"] += 1
+            return result if result is not None else fn()
+        os.makedirs(self.lock_dir, exist_ok=True)
+        path = os.path.join(self.lock_dir, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".lock")
+        with open(path, "a") as lock_file:
+            started = time.monotonic()
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            waited = time.monotonic() - started
+            try:
+                result = recheck() if recheck is not None else None
+                with self._lock:
+                    self._stats["lock_wait_seconds"] += waited
+                    self._stats["rechecked" if result is not None else "upstream"] += 1
+                return result if result is not None else fn()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+flights = SingleFlight()
+
+
+# Function to report the coalescing counters of this process
+def singleflight_stats():
+    return flights.stats()
@@ -0,0 +1,229 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cache import CACHE_DIR
+
+# Timing spans for the pipeline stages.
+#
+# Every span is appended to a JSON-lines log (one object per span: stage, seconds, status and
+# attributes such as tokens or bytes fetched) and aggregated into Prometheus-style metrics,
+# written to a text file that a node-exporter textfile collector can scrape and, if
+# SPOTLIGHT_METRICS_PORT is set, served on http://127.0.0.1:<port>/metrics.
+
+TELEMETRY_LOG = os.environ.get("SPOTLIGHT_TELEMETRY_LOG", os.path.join(CACHE_DIR, "telemetry.jsonl"))
+METRICS_FILE = os.environ.get("SPOTLIGHT_METRICS_FILE", os.path.join(CACHE_DIR, "metrics.prom"))
+METRICS_PORT = os.environ.get("SPOTLIGHT_METRICS_PORT")
+# The log is rotated to <log>.1 once it grows past this size
+TELEMETRY_LOG_MAX_BYTES = 20 * 1024 * 1024
+METRICS_WRITE_INTERVAL = 5
+
+# Number of recent samples kept per stage for the rolling percentiles
+RECENT_SAMPLES = 200
+# Histogram buckets (seconds) for the stage duration metric
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_recent = defaultdict(lambda: deque(maxlen=RECENT_SAMPLES))
+_metrics = defaultdict(lambda: {"count": 0, "sum": 0.0, "errors": 0, "buckets": [0] * len(BUCKETS), "totals": defaultdict(float)})
+_last_metrics_write = [0.0]
+_metrics_server = [None]
+
+# Function to record one latency sample (in seconds) for a stage
+def record(stage, seconds):
+    with _lock:
+        _recent[stage].append(seconds)
+
+# Function to compute a percentile (0-100) of a list of numbers using nearest-rank
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+# Function to summarize the recent samples of every stage in this process
+def stage_summary():
+    with _lock:
+        samples = {stage: list(values) for stage, values in _recent.items()}
+    return {
+        stage: {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95)}
+        for stage, values in samples.items()
+    }
+
+
+# Function to append one span to the JSON-lines log and fold it into the metrics
+def _emit(stage, seconds, status, attrs):
+    entry = {"ts": round(time.time(), 3), "stage": stage, "seconds": round(seconds, 6), "status": status, "pid": os.getpid()}
+    entry.update(attrs)
+    line = json.dumps(entry, default=str) + "\n"
+    with _lock:
+        metric = _metrics[stage]
+        metric["count"] += 1
+        metric["sum"] += seconds
+        if status != "ok":
+            metric["errors"] += 1
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                metric["buckets"][i] += 1
+        for name, value in attrs.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metric["totals"][name] += value
+        try:
+            os.makedirs(os.path.dirname(TELEMETRY_LOG), exist_ok=True)
+            if os.path.exists(TELEMETRY_LOG) and os.path.getsize(TELEMETRY_LOG) > TELEMETRY_LOG_MAX_BYTES:
+                os.replace(TELEMETRY_LOG, TELEMETRY_LOG + ".1")
+            with open(TELEMETRY_LOG, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logging.error(f"Could not write telemetry log: {e}")
+        write_due = time.monotonic() - _last_metrics_write[0] >= METRICS_WRITE_INTERVAL
+    if write_due:
+        write_metrics()
+
+# Time a block as a named span. The yielded dict collects attributes (tokens, bytes, ...) for the span.
+@contextmanager
+def span(stage, **attrs):
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        record(stage, seconds)
+        _emit(stage, seconds, status, attrs)
+
+
+# Function to render the aggregated metrics in the Prometheus text exposition format
+def render_metrics():
+    lines = [
+        "# HELP spotlight_stage_duration_seconds Time spent in each pipeline stage.",
+        "# TYPE spotlight_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        snapshot = {stage: {**metric, "buckets": list(metric["buckets"]), "totals": dict(metric["totals"])} for stage, metric in _metrics.items()}
+    for stage, metric in sorted(snapshot.items()):
+        for bound, count in zip(BUCKETS, metric["buckets"]):
+            lines.append(f'spotlight_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'spotlight_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {metric["count"]}')
+        lines.append(f'spotlight_stage_duration_seconds_sum{{stage="{stage}"}} {metric["sum"]:.6f}')
+        lines.append(f'spotlight_stage_duration_seconds_count{{stage="{stage}"}} {metric["count"]}')
+    lines.append("# TYPE spotlight_stage_errors_total counter")
+    for stage, metric in sorted(snapshot.items()):
+        lines.append(f'spotlight_stage_errors_total{{stage="{stage}"}} {metric["errors"]}')
+    lines.append("# TYPE spotlight_stage_attribute_total counter")
+    for stage, metric in sorted(snapshot.items()):
+        for name, value in sorted(metric["totals"].items()):
+            lines.append(f'spotlight_stage_attribute_total{{stage="{stage}",attribute="{name}"}} {value:g}')
+    return "\n".join(lines) + "\n"
+
+# Function to write the metrics file atomically
+def write_metrics():
+    _last_metrics_write[0] = time.monotonic()
+    try:
+        os.makedirs(os.path.dirname(METRICS_FILE), exist_ok=True)
+        temporary = f"{METRICS_FILE}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(render_metrics())
+        os.replace(temporary, METRICS_FILE)
+    except OSError as e:
+        logging.error(f"Could not write metrics file: {e}")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# Function to serve /metrics on a background thread (once per process)
+def start_metrics_server(port):
+    with _lock:
+        if _metrics_server[0] is None:
+            try:
+                server = ThreadingHTTPServer(("127.0.0.1", int(port)), MetricsHandler)
+            except OSError as e:
+                # Another worker process on this host already serves the port
+                logging.info(f"Metrics endpoint not started: {e}")
+                return None
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            _metrics_server[0] = server
+        return _metrics_server[0]
+
+# Function to compute p50/p95 per stage from the tail of the JSON-lines log (all processes)
+def recent_log_stats(limit=5000):
+    try:
+        with open(TELEMETRY_LOG, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - limit * 300))
+            lines = f.read().decode("utf-8", errors="replace").splitlines()[-limit:]
+    except OSError:
+        return {}
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue  # The first line may be cut in half by the seek
+        samples[entry["stage"]].append(entry["seconds"])
+        if entry.get("status") != "ok":
+            errors[entry["stage"]] += 1
+    return {
+        stage: {"count": len(values), "errors": errors[stage], "p50": percentile(values, 50), "p95": percentile(values, 95)}
+        for stage, values in samples.items()
+    }
+
+
+# Times the stages of one pipeline run. Durations are kept in stage order for display
+# and every stage is also emitted as a span.
+class StageTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            with span(name) as attrs:
+                yield attrs
+        finally:
+            seconds = time.perf_counter() - start
+            self.durations[name] = seconds
+            logging.info(f"Stage {name} took {seconds:.3f}s")
+
+    # Record the end-to-end time of the run and return it
+    def finish(self):
+        total = time.perf_counter() - self.started
+        self.durations["total"] = total
+        record("total", total)
+        _emit("total", total, "ok", {})
+        return total
+
+
+# Function to time a stage on timer, or as a standalone span when there is no timer
+def timed(timer, name):
+    return timer.stage(name) if timer is not None else span(name)
+
+
+if METRICS_PORT:
+    start_metrics_server(METRICS_PORT)
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the repository root and read their settings (cache directory included)
+# from the environment when they are imported, so both are set up before any test imports them.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SPOTLIGHT_CACHE_DIR", tempfile.mkdtemp(prefix="spotlight-tests-"))
+os.environ.setdefault("SPOTLIGHT_TELEMETRY_LOG", os.path.join(os.environ["SPOTLIGHT_CACHE_DIR"], "telemetry.jsonl"))
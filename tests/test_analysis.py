@@ -0,0 +1,69 @@
+import time
+from types import SimpleNamespace
+from analysis import build_messages, ask_gpt
+
+CITATIONS = {"[1]": "https://example.com/a", "[2]": "https://example.com/b"}
+CITATION_INSTRUCTION = ("Please use the following citation format when referencing sources: [1], [2], etc. "
+                        "The citations should correspond to the following references:\n")
+
+
+def test_messages_with_retrieved_context_keep_the_citation_instructions():
+    messages = build_messages("What happened?", CITATIONS, "[1] Rates held.\n\n[2] Storm hit the coast.")
+    user = messages[-1]["content"]
+    assert user == ("What happened?\n\n"
+                    "Answer using the following sources. If they do not cover something, say so.\n\n"
+                    "[1] Rates held.\n\n[2] Storm hit the coast.\n\n"
+                    + CITATION_INSTRUCTION +
+                    "[1]: https://example.com/a\n[2]: https://example.com/b\n")
+
+
+def test_messages_without_context():
+    user = build_messages("What happened?", CITATIONS)[-1]["content"]
+    assert user == "What happened?\n\n" + CITATION_INSTRUCTION + "[1]: https://example.com/a\n[2]: https://example.com/b\n"
+
+
+# Stand-in for the OpenAI client that counts the completions asked for
+class FakeClient:
+    def __init__(self, answer):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.answer = answer
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.answer))],
+                               usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5))
+
+
+def test_answer_cache_keeps_full_text_and_snippet_answers_apart():
+    from semantic_cache import answer_cache
+    answer_cache.clear()
+    client = FakeClient("Rates were held [1] and a storm hit the coast [2].")
+    question = "What did the central bank decide this week?"
+
+    ask_gpt(question, "", client, CITATIONS, "gpt-4o-mini", use_cache=True, full_text=False)
+    cache_info = {}
+    ask_gpt(question, "", client, CITATIONS, "gpt-4o-mini", use_cache=True, cache_info=cache_info, full_text=False)
+    assert client.calls == 1 and cache_info  # Same mode: served from the cache
+
+    cache_info = {}
+    ask_gpt(question, "", client, CITATIONS, "gpt-4o-mini", use_cache=True, cache_info=cache_info, full_text=True)
+    assert client.calls == 2 and not cache_info  # Full articles asked for: the snippet answer is not reused
+
+    ask_gpt(question, "", client, CITATIONS, "gpt-4o-mini", use_cache=True, cache_info=cache_info, full_text=True)
+    assert client.calls == 2 and cache_info
+
+
+def test_failed_analyze_job_is_recorded_as_failed(monkeypatch):
+    import analysis
+    import jobs
+    results = {"organic_results": [{"title": "Rates", "snippet": "Rates were held.", "link": CITATIONS["[1]"]}]}
+    monkeypatch.setattr(analysis, "search_query", lambda query, api_key: results)
+    monkeypatch.setattr(analysis, "ask_gpt", lambda *args, **kwargs: analysis.GPT_ERROR_ANSWER)
+    job_id = jobs.submit_job("failing", "analyze", {"query": "rates", "question": "", "model_choice": "gpt-4o-mini", "use_cache": False},
+                             {"openai_api_key": "test", "serpapi_api_key": "test"})
+    deadline = time.time() + 10
+    while jobs.get_job(job_id)["status"] in jobs.ACTIVE_STATUSES and time.time() < deadline:
+        time.sleep(0.05)
+    job = jobs.get_job(job_id)
+    assert job["status"] == "failed" and job["error"] == "The model call failed"
@@ -0,0 +1,66 @@
+import archive
+from archive import archive_articles, search_archive, search_with_archive
+
+
+def article(link, title, text, summary="A short summary.", date="2 hours ago"):
+    return {"link": link, "title": title, "text": text, "summary": summary, "date": date}
+
+
+def setup_function():
+    archive.compact_archive(max_entries=0)
+
+
+def test_archived_articles_are_found_again_best_match_first():
+    archive_articles([
+        article("https://example.com/ferry", "Harbour approves ferry terminal", "The harbour authority approved a new terminal."),
+        article("https://example.com/rates", "Central bank holds interest rates", "Policy makers kept rates unchanged."),
+        article("https://example.com/markets", "Markets wrap", "Shares rose after the central bank held interest rates."),
+    ])
+    results = search_archive("interest rate")
+    assert [result["link"] for result in results] == ["https://example.com/rates", "https://example.com/markets"]
+    assert results[0]["archived"] and results[0]["summary"] == "A short summary."
+    assert search_archive("volcano") == []
+    assert search_archive("   ") == []
+
+
+def test_rearchiving_a_url_variant_replaces_the_entry():
+    archive_articles([article("https://example.com/rates", "Central bank holds interest rates", "Rates held.", summary="First summary.")])
+    archive_articles([article("https://www.example.com/rates/?utm_source=feed", "Central bank holds interest rates", "Rates held.",
+                              summary="Second summary.")])
+    results = search_archive("central bank")
+    assert len(results) == 1 and results[0]["summary"] == "Second summary."
+    assert archive.archive_stats()["articles"] == 1
+
+
+def test_articles_without_text_or_summary_are_not_archived():
+    assert archive_articles([article("https://example.com/empty", "Empty", ""), {**article("https://example.com/x", "X", "Text"), "summary": None}]) == 0
+
+
+def test_mixed_source_prefers_archived_duplicates():
+    archive_articles([article("https://example.com/rates", "Central bank holds interest rates", "Policy makers kept rates unchanged.")])
+    live = {"organic_results": [{"link": "https://www.example.com/rates", "title": "Central bank holds interest rates", "snippet": "Live"},
+                                {"link": "https://example.com/storm", "title": "Storm hits the coast", "snippet": "Live"}]}
+    results = search_with_archive("interest rates", 5, "mixed", lambda: live)["organic_results"]
+    assert [result.get("archived", False) for result in results] == [True, False]
+    assert search_with_archive("interest rates", 5, "live", lambda: live) is live
+
+
+def test_archived_summaries_are_reused_only_for_the_same_word_count_and_model(monkeypatch):
+    import news
+    archive_articles([{**article("https://example.com/rates", "Central bank holds interest rates", "Policy makers kept rates unchanged.",
+                                summary="Fifty word summary."), "word_count": 50, "model": "gpt-4o-mini"}])
+    summarized = []
+
+    def fake_summarize_article(item, openai_api_key, word_count, archive=None, model=None, **kwargs):
+        summarized.append((word_count, model))
+        return f"New {word_count} word summary."
+
+    monkeypatch.setattr(news, "summarize_article", fake_summarize_article)
+    items = search_archive("interest rates")
+    assert items[0]["summary_word_count"] == 50 and items[0]["summary_model"] == "gpt-4o-mini"
+
+    assert [entry[2] for entry in news.summarize_results(items, "test", 50, model="gpt-4o-mini")] == ["Fifty word summary."]
+    assert summarized == []
+    assert [entry[2] for entry in news.summarize_results(items, "test", 300, model="gpt-4o-mini")] == ["New 300 word summary."]
+    assert [entry[2] for entry in news.summarize_results(items, "test", 50, model="gpt-4o")] == ["New 50 word summary."]
+    assert summarized == [(300, "gpt-4o-mini"), (50, "gpt-4o")]
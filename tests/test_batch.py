@@ -0,0 +1,34 @@
+import json
+import pytest
+from batch import load_secrets, load_tasks, task_id
+
+
+def test_placeholder_keys_in_the_secrets_file_count_as_missing(tmp_path, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setenv("SERPAPI_API_KEY", "")
+    secrets_file = tmp_path / "secrets.toml"
+    secrets_file.write_text('[general]\nOPENAI_API_KEY = "${OPENAI_API_KEY}"\nSERPAPI_API_KEY = ""\n')
+    with pytest.raises(SystemExit, match="Missing API keys: openai_api_key, serpapi_api_key"):
+        load_secrets(str(secrets_file))
+
+
+def test_keys_come_from_the_environment_before_the_secrets_file(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-env")
+    monkeypatch.setenv("SERPAPI_API_KEY", "${SERPAPI_API_KEY}")
+    secrets_file = tmp_path / "secrets.toml"
+    secrets_file.write_text('[general]\nOPENAI_API_KEY = "sk-file"\nSERPAPI_API_KEY = "serp-file"\n')
+    assert load_secrets(str(secrets_file)) == {"openai_api_key": "sk-env", "serpapi_api_key": "serp-file"}
+
+
+def test_tasks_differing_in_any_result_field_get_their_own_id(tmp_path):
+    defaults = {"mode": "summarize", "model": "auto", "num_results": 5, "word_count": 100, "max_workers": 4, "extractor": "fast",
+                "use_cache": True, "full_text": False, "engines": None}
+    lines = [{"query": "rates"}, {"query": "rates", "model": "gpt-4o"}, {"query": "rates", "num_results": 10},
+             {"query": "rates", "word_count": 300}, {"query": "rates", "engines": ["google", "bing_news"]},
+             {"query": "rates", "full_text": True}, {"query": "rates", "mode": "analyze"}]
+    path = tmp_path / "queries.jsonl"
+    path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+    ids = [task["id"] for task in load_tasks(str(path), [], defaults)]
+    assert len(set(ids)) == len(lines)
+    # Settings that only change how a task runs keep its ID
+    assert task_id({**defaults, "query": "rates", "max_workers": 8, "use_cache": False}) == ids[0]
@@ -0,0 +1,39 @@
+import time
+from cache import DiskCache, search_key
+
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    cache = DiskCache("search_results", ttl=0.1, path=str(tmp_path / "cache.sqlite3"))
+    cache.set("rates", {"organic_results": [1, 2]})
+    assert cache.get("rates") == {"organic_results": [1, 2]}
+    time.sleep(0.2)
+    assert cache.get("rates") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 0}
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = DiskCache("search_results", max_entries=2, path=str(tmp_path / "cache.sqlite3"))
+    cache.set("a", 1)
+    time.sleep(0.01)
+    cache.set("b", 2)
+    time.sleep(0.01)
+    assert cache.get("a") == 1  # a is now more recently used than b
+    time.sleep(0.01)
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_entries_beyond_the_byte_budget_are_evicted(tmp_path):
+    cache = DiskCache("article_text", max_entries=100, max_bytes=250, path=str(tmp_path / "cache.sqlite3"))
+    for key in ("a", "b", "c"):
+        cache.set(key, "x" * 100)
+        time.sleep(0.01)
+    assert cache.get("a") is None
+    assert cache.get("b") is not None and cache.get("c") is not None
+
+
+def test_search_keys_ignore_case_and_spacing():
+    assert search_key("google", "  Interest   Rates ", 10) == search_key("google", "interest rates", "10")
+    assert search_key("google", "interest rates", 10) != search_key("google", "interest rates", 5)
+    assert search_key("google", "interest rates") != search_key("bing_news", "interest rates")
@@ -0,0 +1,35 @@
+from cascade import run_cascade, summary_problems, CASCADE_MODELS, CASCADE_INPUT_TOKENS
+from digest import largest_prompt_tokens, ARTICLE_TOKEN_BUDGET
+
+
+def run(prompt_tokens, outputs):
+    tried = []
+
+    def call(model, stats):
+        tried.append(model)
+        return outputs[model]
+
+    output, decision = run_cascade("summary", prompt_tokens, call, lambda summary: summary_problems(summary, 10))
+    return output, decision, tried
+
+
+def test_small_model_output_that_passes_is_kept():
+    output, decision, tried = run(100, {model: "word " * 10 for model in CASCADE_MODELS})
+    assert tried == CASCADE_MODELS[:1] and not decision["escalated"]
+
+
+def test_short_output_escalates():
+    outputs = {model: "word " * 10 for model in CASCADE_MODELS}
+    outputs[CASCADE_MODELS[0]] = "word"
+    output, decision, tried = run(100, outputs)
+    assert tried == CASCADE_MODELS and decision["reasons"] == ["too_short"]
+
+
+def test_large_single_prompt_goes_to_the_largest_model():
+    output, decision, tried = run(CASCADE_INPUT_TOKENS + 1, {model: "word " * 10 for model in CASCADE_MODELS})
+    assert tried == CASCADE_MODELS[-1:] and decision["reasons"] == ["input_too_large"]
+
+
+def test_chunked_article_is_judged_by_its_largest_chunk():
+    assert largest_prompt_tokens(ARTICLE_TOKEN_BUDGET * 5) <= CASCADE_INPUT_TOKENS
+    assert largest_prompt_tokens(500) == 500
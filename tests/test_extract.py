@@ -0,0 +1,22 @@
+import os
+from extract import extract_fast
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "fixtures", "html")
+PARAGRAPH = "<p>The harbour authority approved plans for a new ferry terminal, ending two years of consultation with residents.</p>"
+
+
+def test_article_inside_page_wide_form_and_sidebar_layout_is_kept():
+    html = (f'<body><form id="aspnetForm"><div class="layout with-sidebar"><div id="main-header-wrapper">{PARAGRAPH * 3}'
+            '<div class="share"><p>Share this story with your friends on every network you use.</p></div></div></div></form></body>')
+    text = extract_fast([html])
+    assert text.count("harbour authority") == 3
+    assert "Share this story" not in text
+
+
+def test_fixture_pages_match_their_references():
+    for name in sorted(os.listdir(FIXTURES)):
+        if name.endswith(".html"):
+            with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+                text = extract_fast([f.read()])
+            with open(os.path.join(FIXTURES, name[:-len(".html")] + ".txt"), encoding="utf-8") as f:
+                assert text.split() == f.read().split(), name
@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+import time
+import jobs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def insert_job(job_id, user, status, boot_id, lease_until):
+    with jobs._connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, user, kind, params, status, pid, boot_id, lease_until, created) VALUES (?, ?, 'test', '{}', ?, ?, ?, ?, ?)",
+            (job_id, user, status, os.getpid(), boot_id, lease_until, time.time())
+        )
+
+
+def test_jobs_whose_lease_expired_are_interrupted():
+    insert_job("orphan-running", "restarted", "running", "earlier-boot", time.time() - 1)
+    insert_job("orphan-queued", "restarted", "queued", None, None)
+    insert_job("current", "restarted", "running", jobs.BOOT_ID, time.time() + 60)
+    jobs._init_db()
+    assert jobs.get_job("orphan-running")["status"] == "interrupted"
+    assert jobs.get_job("orphan-queued")["status"] == "interrupted"
+    assert jobs.get_job("current")["status"] == "running"
+
+
+def test_importing_jobs_in_another_process_leaves_live_jobs_running():
+    insert_job("live", "shared-db", "running", "app-process", time.time() + 60)
+    subprocess.run([sys.executable, "-c", "import jobs"], cwd=ROOT, env=dict(os.environ, PYTHONWARNINGS="ignore"), check=True)
+    assert jobs.get_job("live")["status"] == "running"
@@ -0,0 +1,59 @@
+import time
+import pytest
+import requests
+import ratelimit
+from ratelimit import CircuitBreaker, CircuitOpenError, http_get
+from tools.stub_server import start_stub_server
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(ratelimit, "backoff_delay", lambda attempt: 0.0)
+    server = start_stub_server()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}/search?q=rates"
+    server.shutdown()
+
+
+def test_rate_limited_request_waits_for_retry_after_and_retries(stub):
+    server, url = stub
+    server.fail_first, server.retry_after = 1, 0.2
+    started = time.perf_counter()
+    response = http_get(requests.Session(), url, provider="test-retry-after")
+    assert response.status_code == 200
+    assert server.faults_injected == 1 and server.request_count == 2
+    assert time.perf_counter() - started >= 0.2
+    assert ratelimit.get_breaker("test-retry-after").state == "closed"
+
+
+def test_breaker_counts_calls_not_attempts_and_probes_when_half_open(stub):
+    server, url = stub
+    server.fail_rate, server.fail_status = 1.0, 503
+    ratelimit._breakers["test-breaker"] = breaker = CircuitBreaker("test-breaker", failures=2, reset_seconds=0.2)
+    session = requests.Session()
+
+    # Three failed attempts of one call are a single failure
+    with pytest.raises(requests.exceptions.HTTPError):
+        http_get(session, url, provider="test-breaker")
+    assert server.request_count == ratelimit.MAX_RETRIES + 1
+    assert breaker.state == "closed"
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        http_get(session, url, provider="test-breaker")
+    assert breaker.state == "open"
+    requests_made = server.request_count
+    with pytest.raises(CircuitOpenError):
+        http_get(session, url, provider="test-breaker")
+    assert server.request_count == requests_made
+
+    # After the reset time one probe goes out, without retries; its failure opens the breaker again
+    time.sleep(0.25)
+    with pytest.raises(requests.exceptions.HTTPError):
+        http_get(session, url, provider="test-breaker")
+    assert server.request_count == requests_made + 1
+    assert breaker.state == "open"
+
+    # A successful probe closes it
+    server.fail_rate = 0.0
+    time.sleep(0.25)
+    assert http_get(session, url, provider="test-breaker").status_code == 200
+    assert breaker.state == "closed"
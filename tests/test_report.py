@@ -0,0 +1,46 @@
+import zipfile
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE
+from report import DocxReport, export_reports_zip, report_file_name, save_to_docx
+
+CITATIONS = {"[1]": "https://example.com/a", "[2]": "example.com/b"}
+ANSWER = "Rates were held [1].\nA storm hit the coast [2], as [1] also reported."
+
+
+def hyperlink_targets(document):
+    return sorted(rel.target_ref for rel in document.part.rels.values() if rel.reltype == RELATIONSHIP_TYPE.HYPERLINK)
+
+
+def test_each_url_gets_one_relationship_however_often_it_is_linked():
+    document = Document(save_to_docx(ANSWER, CITATIONS))
+    assert hyperlink_targets(document) == ["http://example.com/b", "https://example.com/a"]
+    body = [paragraph.text for paragraph in document.paragraphs]
+    assert "Rates were held [1]." in body
+    assert "A storm hit the coast [2], as [1] also reported." in body
+    assert "[1] https://example.com/a" in body and "[2] example.com/b" in body
+
+
+def test_relationship_ids_are_reused():
+    report = DocxReport()
+    assert report.relationship_id("https://example.com/a") == report.relationship_id("https://example.com/a")
+    assert report.relationship_id("example.com/b") == report.relationship_id("http://example.com/b")
+    assert report.relationship_id("https://example.com/a") != report.relationship_id("example.com/b")
+
+
+def test_reports_are_zipped_one_docx_per_result_with_distinct_names():
+    results = [
+        {"query": "Interest rates", "answer": ANSWER, "citations": CITATIONS},
+        {"query": "Interest rates", "answer": "Rates were cut [1].", "citations": {"[1]": "https://example.com/c"}},
+        {"query": "", "answer": "Nothing new [1].", "citations": {"[1]": "https://example.com/d"}},
+    ]
+    with zipfile.ZipFile(export_reports_zip(results)) as archive:
+        names = archive.namelist()
+        assert names == ["interest-rates.docx", "interest-rates-2.docx", "analysis_report.docx"]
+        document = Document(archive.open("interest-rates-2.docx"))
+    assert document.paragraphs[0].text == "Interest rates"
+    assert hyperlink_targets(document) == ["https://example.com/c"]
+
+
+def test_report_file_names_are_slugs():
+    assert report_file_name("  What's new in AI? ") == "what-s-new-in-ai.docx"
+    assert report_file_name(None, "zip") == "analysis_report.zip"
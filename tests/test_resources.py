@@ -0,0 +1,58 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from resources import CountingHTTPAdapter
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def test_connections_opened_keeps_counting_after_pools_are_evicted():
+    servers = [start_server() for _ in range(2)]
+    session = requests.Session()
+    adapter = CountingHTTPAdapter(pool_connections=1, pool_maxsize=1)
+    session.mount("http://", adapter)
+    try:
+        # One pool at a time: going back to the first host evicts the second host's pool and opens a new connection
+        for _, url in servers + servers[:1]:
+            session.get(url).raise_for_status()
+        session.get(servers[0][1]).raise_for_status()
+        assert adapter.connections_opened() == 3
+    finally:
+        session.close()
+        for server, _ in servers:
+            server.shutdown()
+
+
+def test_openai_client_connections_are_counted(monkeypatch):
+    from resources import get_openai_client, resource_stats
+    from tools.stub_server import start_stub_server
+    server = start_stub_server()
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    try:
+        before = resource_stats()
+        client = get_openai_client("test-connection-count")
+        for _ in range(3):
+            client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "Hello"}])
+        after = resource_stats()
+        # The stub speaks HTTP/1.0, so every completion opens a connection of its own
+        assert after["openai_connections_opened"] - before["openai_connections_opened"] == 3
+        assert after["connections_opened"] - before["connections_opened"] == 3
+    finally:
+        server.shutdown()
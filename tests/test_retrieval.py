@@ -0,0 +1,32 @@
+from retrieval import bm25_scores, build_context, terms
+
+PASSAGES = [
+    {"citation": "[1]", "text": "The football club signed a new striker before the season.", "kind": "snippet"},
+    {"citation": "[2]", "text": "The central bank held interest rates and said rates may fall next year.", "kind": "snippet"},
+    {"citation": "[3]", "text": "Interest in the new phone was high at launch.", "kind": "snippet"},
+    {"citation": "[2]", "text": "Bank officials said inflation had eased, leaving room to cut interest rates.", "kind": "article"},
+]
+
+
+def test_terms_drop_stop_words_and_case():
+    assert terms("What did the Central Bank decide?") == ["central", "bank", "decide"]
+
+
+def test_bm25_ranks_passages_matching_more_and_rarer_query_terms_first():
+    scores = bm25_scores("central bank interest rates", PASSAGES)
+    ranking = sorted(range(len(PASSAGES)), key=lambda i: scores[i], reverse=True)
+    assert ranking == [1, 3, 2, 0]
+    assert scores[0] == 0.0
+
+
+def test_bm25_without_passages():
+    assert bm25_scores("rates", []) == []
+
+
+def test_context_keeps_the_best_passages_within_budget_in_citation_order():
+    context, stats = build_context("central bank interest rates", PASSAGES, budget=40)
+    assert context.split("\n\n") == [
+        "[2] The central bank held interest rates and said rates may fall next year.",
+        "[2] Bank officials said inflation had eased, leaving room to cut interest rates.",
+    ]
+    assert stats["candidates"] == 4 and stats["passages"] == 2 and 0 < stats["tokens"] <= 40
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import time
+from semantic_cache import SemanticCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+URLS = ["https://example.com/a", "https://example.com/b"]
+QUESTION = "What did the central bank decide about interest rates?"
+
+
+def test_near_duplicates_hit_and_other_questions_sources_or_models_miss(tmp_path):
+    cache = SemanticCache("answers", path=str(tmp_path / "cache.sqlite3"))
+    cache.store(QUESTION, URLS, "gpt-4o-mini", "Rates were held [1].")
+
+    hit = cache.lookup("what did the Central Bank decide about interest rates", ["https://www.example.com/a/", "https://example.com/b?utm_source=feed"], "gpt-4o-mini")
+    assert hit["answer"] == "Rates were held [1]." and hit["similarity"] > 0.99
+    assert cache.lookup(QUESTION, ["https://example.com/c", "https://example.com/d"], "gpt-4o-mini") is None
+    assert cache.lookup("How did the storm affect the coast?", URLS, "gpt-4o-mini") is None
+    assert cache.lookup(QUESTION, URLS, "gpt-4o") is None
+    assert cache.stats() == {"hits": 1, "misses": 3, "entries": 1}
+
+
+def test_rephrased_question_is_served_only_above_the_threshold(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SemanticCache("answers", path=path).store(QUESTION, URLS, "gpt-4o-mini", "Rates were held [1].")
+    rephrased = "Tell me what the central bank decided about interest rates"
+    assert SemanticCache("answers", threshold=0.9, path=path).lookup(rephrased, URLS, "gpt-4o-mini") is None
+    assert SemanticCache("answers", threshold=0.8, path=path).lookup(rephrased, URLS, "gpt-4o-mini") is not None
+
+
+def test_expired_entries_are_not_served(tmp_path):
+    cache = SemanticCache("answers", ttl=0.1, path=str(tmp_path / "cache.sqlite3"))
+    cache.store(QUESTION, URLS, "gpt-4o-mini", "Rates were held [1].")
+    assert cache.lookup(QUESTION, URLS, "gpt-4o-mini") is not None
+    time.sleep(0.2)
+    assert cache.lookup(QUESTION, URLS, "gpt-4o-mini") is None
+
+
+def run_in_other_process(path, statement):
+    code = f"from semantic_cache import SemanticCache\ncache = SemanticCache('answers', path={path!r})\n{statement}"
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=dict(os.environ, PYTHONWARNINGS="ignore"), check=True)
+
+
+def test_entries_stored_or_cleared_by_another_process_are_seen(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SemanticCache("answers", path=path)
+    assert cache.lookup(QUESTION, URLS, "gpt-4o-mini") is None
+
+    run_in_other_process(path, f"cache.store({QUESTION!r}, {URLS!r}, 'gpt-4o-mini', 'Rates were held [1].')")
+    assert cache.lookup(QUESTION, URLS, "gpt-4o-mini")["answer"] == "Rates were held [1]."
+
+    # The entry is still in this process's embeddings, but the row is gone
+    run_in_other_process(path, "cache.clear()")
+    assert cache.lookup(QUESTION, URLS, "gpt-4o-mini") is None
+
+    run_in_other_process(path, f"cache.store({QUESTION!r}, {URLS!r}, 'gpt-4o-mini', 'Rates were cut [2].')")
+    assert cache.lookup(QUESTION, URLS, "gpt-4o-mini")["answer"] == "Rates were cut [2]."
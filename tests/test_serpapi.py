@@ -0,0 +1,20 @@
+from types import SimpleNamespace
+import serpapi
+from cache import search_cache
+
+
+def test_bing_results_of_different_sizes_are_cached_apart(monkeypatch):
+    requested = []
+
+    def fake_get(session, url, provider=None, params=None, stats=None):
+        requested.append(params["count"])
+        results = [{"title": f"Story {n}", "link": f"https://example.com/{n}"} for n in range(params["count"])]
+        return SimpleNamespace(content=b"{}", raise_for_status=lambda: None, json=lambda: {"organic_results": results})
+
+    monkeypatch.setattr(serpapi, "http_get", fake_get)
+    search_cache.clear()
+    query = {"engine": "bing_news", "q": "harbour ferry terminal", "api_key": "test"}
+    assert len(serpapi.serpapi_search(dict(query, count=1))["organic_results"]) == 1
+    assert len(serpapi.serpapi_search(dict(query, count=15))["organic_results"]) == 15
+    assert len(serpapi.serpapi_search(dict(query, count=15))["organic_results"]) == 15
+    assert requested == [1, 15]
@@ -0,0 +1,77 @@
+import threading
+import time
+import pytest
+import serpapi
+from cache import search_cache
+from singleflight import SingleFlight
+from tools.stub_server import start_stub_server
+
+SESSIONS = 12
+
+
+# Function to run fn in SESSIONS threads released at the same moment; returns their results or errors
+def run_sessions(fn):
+    barrier = threading.Barrier(SESSIONS)
+    outcomes = [None] * SESSIONS
+
+    def session(index):
+        barrier.wait()
+        try:
+            outcomes[index] = fn()
+        except Exception as e:
+            outcomes[index] = e
+
+    threads = [threading.Thread(target=session, args=(index,)) for index in range(SESSIONS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    flight = SingleFlight(enabled=True, cross_process=False)
+    upstream = []
+
+    def fetch():
+        upstream.append(1)
+        time.sleep(0.2)
+        return {"organic_results": [{"link": "https://example.com/a"}]}
+
+    results = run_sessions(lambda: flight.do("serpapi:rates", fetch))
+    assert len(upstream) == 1
+    assert all(result == {"organic_results": [{"link": "https://example.com/a"}]} for result in results)
+    assert len({id(result) for result in results}) == SESSIONS  # Every session gets its own copy
+    assert flight.stats()["shared"] == SESSIONS - 1
+
+
+def test_waiting_callers_receive_the_leaders_error():
+    flight = SingleFlight(enabled=True, cross_process=False)
+
+    def fail():
+        time.sleep(0.2)
+        raise ConnectionError("upstream down")
+
+    outcomes = run_sessions(lambda: flight.do("serpapi:rates", fail))
+    assert all(isinstance(outcome, ConnectionError) for outcome in outcomes)
+    assert flight.stats()["upstream"] == 1
+
+
+def test_simultaneous_sessions_send_one_search_to_the_stub(monkeypatch):
+    server = start_stub_server(delay=0.3)
+    monkeypatch.setattr(serpapi, "SERPAPI_URL", f"http://127.0.0.1:{server.server_address[1]}/search")
+    search_cache.clear()
+    try:
+        results = run_sessions(lambda: serpapi.serpapi_search({"engine": "google", "q": "Breaking  Story", "num": 5, "api_key": "test"}))
+        assert not [result for result in results if isinstance(result, Exception)]
+        assert server.path_counts == {"/search": 1}
+        assert len({str(result) for result in results}) == 1
+    finally:
+        server.shutdown()
+
+
+@pytest.mark.parametrize("enabled, expected", [(False, SESSIONS), (True, 1)])
+def test_coalescing_can_be_turned_off(enabled, expected):
+    flight = SingleFlight(enabled=enabled, cross_process=False)
+    run_sessions(lambda: flight.do("key", lambda: time.sleep(0.1)))
+    assert flight.stats()["upstream"] == expected
@@ -0,0 +1,19 @@
+from telemetry import percentile
+
+
+def test_percentile_with_an_odd_number_of_samples():
+    values = [5, 1, 4, 2, 3]
+    assert percentile(values, 50) == 3
+    assert percentile(values, 95) == 5
+    assert percentile(values, 0) == 1
+
+
+def test_percentile_with_an_even_number_of_samples():
+    values = [40, 10, 30, 20]
+    assert percentile(values, 50) == 20
+    assert percentile(values, 75) == 30
+    assert percentile(values, 100) == 40
+
+
+def test_percentile_of_no_samples():
+    assert percentile([], 50) is None
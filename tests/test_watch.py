@@ -0,0 +1,47 @@
+import time
+import watch
+from dedupe import TitleIndex, normalize_url, title_words
+
+
+def test_url_variants_of_one_article_normalize_alike():
+    key = normalize_url("https://example.com/news/rates-held")
+    assert normalize_url("http://www.example.com/news/rates-held/") == key
+    assert normalize_url("https://amp.example.com/news/rates-held/amp?utm_source=feed&fbclid=abc") == key
+    assert normalize_url("https://m.example.com/news/rates-held?page=2") != key
+    assert normalize_url("https://example.com/a?b=2&a=1") == normalize_url("https://example.com/a?a=1&b=2")
+
+
+def test_syndicated_titles_are_near_duplicates():
+    index = TitleIndex()
+    index.add("Central bank holds interest rates steady - Reuters", "reuters")
+    assert title_words("Central bank holds interest rates steady | AP News") == {"central", "bank", "holds", "interest", "rates", "steady"}
+    assert index.find("Central bank holds interest rates steady | AP News") == "reuters"
+    assert index.find("Central bank cuts interest rates") is None
+    assert len(index) == 1
+
+
+def add_seen(topic_id, link, title):
+    with watch._connect() as conn:
+        conn.execute(
+            "INSERT INTO seen (topic_id, url_key, link, title, date, summary, first_seen) VALUES (?, ?, ?, ?, NULL, 'summary', ?)",
+            (topic_id, normalize_url(link), link, title, time.time())
+        )
+
+
+def test_diff_results_skips_seen_urls_syndicated_titles_and_repeats_within_a_batch():
+    topic_id = watch.add_topic("watcher", "interest rates", 3600, {"num_results": 10})
+    add_seen(topic_id, "https://example.com/rates-held", "Central bank holds interest rates steady - Reuters")
+    items = [
+        {"link": "https://www.example.com/rates-held/?utm_source=feed", "title": "Rates story"},
+        {"link": "https://news.example.org/story/1", "title": "Central bank holds interest rates steady | AP News"},
+        {"link": "https://example.com/storm", "title": "Storm hits the coast"},
+        {"link": "https://m.example.com/storm", "title": "Storm hits the coast - Example"},
+        {"link": "https://example.com/ferry", "title": "Harbour approves new ferry terminal"},
+    ]
+    new_items, skipped = watch.diff_results(topic_id, items)
+    assert [item["link"] for item in new_items] == ["https://example.com/storm", "https://example.com/ferry"]
+    assert skipped == 3
+
+    # Seen entries belong to their topic only
+    other_topic = watch.add_topic("watcher", "rates", 3600, {"num_results": 10})
+    assert watch.diff_results(other_topic, items[:1]) == (items[:1], 0)
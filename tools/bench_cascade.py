@@ -0,0 +1,105 @@
+import argparse
+import os
+import sys
+import tempfile
+
+# Offline check of the model cascade's escalation policy (cascade.py).
+#
+#   python -m tools.bench_cascade
+#
+# Runs answers (ask_gpt with model "auto"), article summaries (summarize_text) and digests
+# (build_digest and update_digest) against tools/stub_server.py, giving the smallest model a different reply in each
+# scenario, and checks which models were tried and why. Prints the routing decision of every
+# scenario (models, reasons, latency, tokens, estimated cost) and exits with status 1 when a
+# decision differs from the expected one.
+
+API_KEY = "offline-benchmark"
+CITATIONS = {f"[{n}]": f"https://example.com/story/{n}" for n in range(1, 6)}
+GOOD_ANSWER = (
+    "Policy makers kept rates unchanged [1] while severe weather disrupted coastal areas [2]. "
+    "In technology, a new data centre chip was announced [3], and the city approved a transit expansion [4]. "
+    "Researchers also reported progress on battery recycling [5]. Taken together, the coverage points to steady "
+    "policy, local disruption and continued investment in infrastructure and clean energy."
+)
+ARTICLE = "The central bank kept its main rate unchanged on Tuesday. " * 40
+# Longer than one prompt may be, so it is summarized chunk by chunk, and each chunk is small
+LONG_ARTICLE = "The central bank kept its main rate unchanged on Tuesday. " * 1500
+
+
+# Function to list the scenarios: (name, kind, reply of the smallest model, expected models, expected reasons, options)
+def scenarios(small, large):
+    return [
+        ("answer passes", "answer", None, [small], [], {}),
+        ("answer without citations", "answer", GOOD_ANSWER.replace(" [", " (").replace("]", ")"), [small, large], ["no_citations"], {}),
+        ("answer cites unknown source", "answer", GOOD_ANSWER.replace("[5]", "[9]"), [small, large], ["invalid_citations"], {}),
+        ("answer too short", "answer", "Rates were unchanged [1].", [small, large], ["too_short"], {}),
+        ("input too large", "answer", None, [large], ["input_too_large"], {"padding": True}),
+        ("summary passes", "summary", None, [small], [], {}),
+        ("summary too short", "summary", "Rates were unchanged.", [small, large], ["too_short"], {}),
+        ("long article in chunks", "summary", None, [small], [], {"text": LONG_ARTICLE}),
+        ("digest passes", "digest", None, [small], [], {}),
+        ("digest too short", "digest", "Rates held [1].", [small, large], ["too_short"], {}),
+        ("digest update too short", "digest", "Rates held [1].", [small, large], ["too_short"], {"previous": GOOD_ANSWER}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the model cascade's escalation decisions against the stub server.")
+    parser.add_argument("--word-count", type=int, default=100, help="Words asked for in the summary scenarios")
+    args = parser.parse_args()
+
+    from tools.stub_server import start_stub_server
+    server = start_stub_server(answer=GOOD_ANSWER)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # Point the real code paths at the stub before they are imported
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+    os.environ["SPOTLIGHT_CACHE_DIR"] = tempfile.mkdtemp(prefix="spotlight-cascade-")
+
+    from cascade import CASCADE_MODELS, CASCADE_INPUT_TOKENS, AUTO_MODEL, decision_line
+    from analysis import ask_gpt, build_messages
+    from resources import get_openai_client
+    from news import summarize_text
+    from digest import TokenUsage, build_digest, update_digest
+
+    small, large = CASCADE_MODELS[0], CASCADE_MODELS[-1]
+    failures = []
+    print(f"{'scenario':<30}{'models':<22}{'reasons':<22}{'s':>6}{'tokens':>8}{'cost $':>10}")
+    for name, kind, small_reply, expected_models, expected_reasons, options in scenarios(small, large):
+        server.model_answers = {small: small_reply} if small_reply else {}
+        decision = {}
+        if kind == "answer":
+            question = "Summarize the news about interest rates."
+            if options.get("padding"):
+                question += " Background:" + " rates" * (CASCADE_INPUT_TOKENS + 100)
+            ask_gpt(question, "", get_openai_client(API_KEY), CITATIONS, AUTO_MODEL,
+                    messages=build_messages(question, CITATIONS), use_cache=False, routing=decision)
+        elif kind == "digest":
+            cited_summaries = [(citation, GOOD_ANSWER) for citation in CITATIONS]
+            if options.get("previous"):
+                update_digest(options["previous"], cited_summaries, API_KEY, AUTO_MODEL, args.word_count, TokenUsage(), routing=decision)
+            else:
+                build_digest(cited_summaries, API_KEY, AUTO_MODEL, args.word_count, TokenUsage(), routing=decision)
+        else:
+            template = f"Write a summary of the following in {args.word_count} words:\n\n{{text}}"
+            summarize_text({"link": CITATIONS["[1]"]}, options.get("text", ARTICLE), template, API_KEY, args.word_count, usage=TokenUsage(),
+                           model=AUTO_MODEL, routing=decision)
+
+        models = [attempt["model"] for attempt in decision.get("attempts", [])]
+        ok = models == expected_models and decision.get("reasons") == expected_reasons
+        if not ok:
+            failures.append(name)
+        print(f"{name:<30}{' > '.join(models):<22}{', '.join(decision.get('reasons', [])) or '-':<22}"
+              f"{decision.get('seconds', 0):>6.2f}{decision.get('prompt_tokens', 0) + decision.get('completion_tokens', 0):>8}"
+              f"{decision.get('cost', 0):>10.5f}  {'ok' if ok else 'EXPECTED ' + ' > '.join(expected_models)}")
+        if decision:
+            print(f"  {decision_line(decision)}")
+    server.shutdown()
+
+    if failures:
+        print(f"Unexpected decisions: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+# Concurrency benchmark of request coalescing (singleflight.py).
+#
+#   python -m tools.bench_coalesce --sessions 20 --processes 2
+#
+# Simulates a breaking story: --sessions sessions in each of --processes worker processes run
+# the same search and summarize it at the same moment, against tools/stub_server.py serving
+# the recorded fixtures with --delay seconds of latency per response. Caches start empty. Each
+# mode runs with a fresh cache directory and reports how many requests reached the stub per
+# endpoint, the slowest session, and the coalescing counters summed over the workers:
+#   off            - SPOTLIGHT_SINGLEFLIGHT=0, every session goes upstream on a cache miss
+#   in-process     - sessions in one process share one request per key
+#   cross-process  - SPOTLIGHT_SINGLEFLIGHT_LOCKS=1, processes also wait on per-key lock files
+#                    and pick up the result the first one stored in the shared caches
+
+QUERY = "sample news"
+API_KEY = "offline-benchmark"
+MODES = {
+    "off": {"SPOTLIGHT_SINGLEFLIGHT": "0"},
+    "in-process": {"SPOTLIGHT_SINGLEFLIGHT": "1", "SPOTLIGHT_SINGLEFLIGHT_LOCKS": "0"},
+    "cross-process": {"SPOTLIGHT_SINGLEFLIGHT": "1", "SPOTLIGHT_SINGLEFLIGHT_LOCKS": "1"},
+}
+ENDPOINTS = ("/search", "/articles", "/v1/chat/completions")
+
+
+# Function run in each worker process: all sessions search and summarize at once; prints JSON stats
+def worker(sessions, num_results, start_at):
+    from news import search_news, summarize_results
+    from singleflight import singleflight_stats
+
+    barrier = threading.Barrier(sessions)
+    latencies, errors = [], []
+
+    def session():
+        barrier.wait()
+        started = time.perf_counter()
+        try:
+            items = search_news(QUERY, API_KEY, num_results)["organic_results"][:num_results]
+            for _, _, _, error, done in summarize_results(items, API_KEY, 100):
+                if done and error is not None:
+                    errors.append(type(error).__name__)
+        except Exception as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+    # Line the processes up too, so their sessions overlap
+    time.sleep(max(0.0, start_at - time.time()))
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(json.dumps({"slowest": max(latencies), "errors": errors, "singleflight": singleflight_stats()}))
+
+# Function to read the stub's per-endpoint request counts
+def stub_counts(base_url):
+    with urllib.request.urlopen(f"{base_url}/stats") as response:
+        return json.load(response)["by_path"]
+
+# Function to run one mode: fresh caches, all worker processes at once; returns its measurements
+def run_mode(mode, args, base_url):
+    env = dict(
+        os.environ, **MODES[mode],
+        SERPAPI_URL=f"{base_url}/search",
+        OPENAI_BASE_URL=f"{base_url}/v1",
+        SPOTLIGHT_CACHE_DIR=tempfile.mkdtemp(prefix="spotlight-coalesce-"),
+        SPOTLIGHT_RATE_PER_HOST="0",
+        SPOTLIGHT_ARCHIVE="0",
+        PYTHONWARNINGS="ignore",
+    )
+    before = stub_counts(base_url)
+    # Leave time for the workers' imports before they start together
+    start_at = time.time() + 3.0
+    command = [sys.executable, "-m", "tools.bench_coalesce", "--worker",
+               "--sessions", str(args.sessions), "--num-results", str(args.num_results), "--start-at", str(start_at)]
+    workers = [subprocess.Popen(command, stdout=subprocess.PIPE, text=True, env=env) for _ in range(args.processes)]
+    reports = []
+    for process in workers:
+        stdout, _ = process.communicate()
+        if process.returncode != 0:
+            raise SystemExit(f"Worker failed in mode {mode}")
+        reports.append(json.loads(stdout.strip().splitlines()[-1]))
+    after = stub_counts(base_url)
+
+    stats = {}
+    for report in reports:
+        for name, value in report["singleflight"].items():
+            stats[name] = stats.get(name, 0) + value
+    return {
+        "requests": {path: after.get(path, 0) - before.get(path, 0) for path in ENDPOINTS},
+        "slowest": max(report["slowest"] for report in reports),
+        "errors": [error for report in reports for error in report["errors"]],
+        "singleflight": stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count upstream requests for concurrent identical sessions, with and without coalescing.")
+    parser.add_argument("--fixtures", default=os.path.join("bench", "fixtures"))
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent sessions per process")
+    parser.add_argument("--processes", type=int, default=2, help="Worker processes sharing the cache directory")
+    parser.add_argument("--num-results", type=int, default=5)
+    parser.add_argument("--delay", type=float, default=0.2, help="Seconds the stub waits before every response")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--start-at", type=float, default=0.0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.sessions, args.num_results, args.start_at)
+        return
+
+    from tools.bench_pipeline import start_fixture_server
+    server, base_url = start_fixture_server(args.fixtures)
+    server.delay = args.delay
+
+    print(f"{args.processes} process(es) x {args.sessions} sessions, {args.num_results} results each, {args.delay:.2f}s upstream latency")
+    print(f"{'mode':<15}{'search':>8}{'articles':>10}{'llm':>6}{'slowest s':>11}  coalescing")
+    for mode in args.modes.split(","):
+        result = run_mode(mode, args, base_url)
+        requests, stats = result["requests"], result["singleflight"]
+        print(f"{mode:<15}{requests['/search']:>8}{requests['/articles']:>10}{requests['/v1/chat/completions']:>6}"
+              f"{result['slowest']:>11.2f}  {stats.get('calls', 0)} calls, {stats.get('upstream', 0)} upstream, "
+              f"{stats.get('shared', 0)} shared, {stats.get('rechecked', 0)} found cached on recheck, "
+              f"{stats.get('lock_wait_seconds', 0.0):.2f}s lock wait")
+        if result["errors"]:
+            print(f"  errors: {', '.join(sorted(set(result['errors'])))}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
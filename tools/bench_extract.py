@@ -0,0 +1,106 @@
+import argparse
+import glob
+import os
+import re
+import time
+from collections import Counter
+from extract import EXTRACTORS
+
+# Compare the article extractors on a saved corpus of HTML pages.
+#
+#   python -m tools.bench_extract --save urls.txt --corpus bench/html   # download pages once
+#   python -m tools.bench_extract --corpus bench/html                   # benchmark
+#
+# For every page.html an optional page.txt holds the reference article text. Quality is the
+# word-level F1 against that reference; without one, the unstructured output is used instead.
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+# Function to download the URLs listed in a file into the corpus directory
+def save_corpus(urls_file, corpus):
+    from resources import get_session
+    from news import USER_AGENT
+    os.makedirs(corpus, exist_ok=True)
+    with open(urls_file, encoding="utf-8") as f:
+        urls = [line.strip() for line in f if line.strip()]
+    saved = 0
+    for i, url in enumerate(urls, 1):
+        try:
+            response = get_session("articles").get(url, headers={"User-Agent": USER_AGENT}, timeout=30)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"skip {url}: {e}")
+            continue
+        with open(os.path.join(corpus, f"page{i:03d}.html"), "wb") as f:
+            f.write(response.content)
+        saved += 1
+    print(f"saved {saved} of {len(urls)} pages to {corpus}")
+
+# Function to compute the word-level F1 of extracted text against reference text
+def word_f1(extracted, reference):
+    got = Counter(WORD_PATTERN.findall(extracted.lower()))
+    want = Counter(WORD_PATTERN.findall(reference.lower()))
+    overlap = sum((got & want).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(got.values())
+    recall = overlap / sum(want.values())
+    return 2 * precision * recall / (precision + recall)
+
+# Function to run one extractor over the corpus; returns per-page text and total seconds
+def run_extractor(name, pages):
+    extractor = EXTRACTORS[name]
+    outputs = {}
+    start = time.perf_counter()
+    for path, html in pages.items():
+        try:
+            outputs[path] = extractor([html])
+        except Exception as e:
+            print(f"{name}: failed on {path}: {e}")
+            outputs[path] = ""
+    return outputs, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark article extractors on saved HTML pages.")
+    parser.add_argument("--corpus", default="bench/fixtures/html", help="Directory of .html files (with optional .txt references)")
+    parser.add_argument("--save", help="File of URLs to download into the corpus first")
+    parser.add_argument("--extractors", default=",".join(EXTRACTORS), help="Comma separated backends to compare")
+    args = parser.parse_args()
+
+    if args.save:
+        save_corpus(args.save, args.corpus)
+
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(args.corpus, "*.html"))):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            pages[path] = f.read()
+    if not pages:
+        raise SystemExit(f"No .html files in {args.corpus}")
+    total_mb = sum(len(html.encode("utf-8")) for html in pages.values()) / (1024 * 1024)
+
+    results = {}
+    for name in args.extractors.split(","):
+        results[name] = run_extractor(name, pages)
+
+    references = {}
+    for path in pages:
+        reference_path = path[:-len(".html")] + ".txt"
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as f:
+                references[path] = f.read()
+        elif "unstructured" in results:
+            references[path] = results["unstructured"][0][path]
+
+    print(f"{len(pages)} pages, {total_mb:.2f} MB")
+    print(f"{'extractor':<14}{'seconds':>10}{'pages/s':>10}{'MB/s':>10}{'avg chars':>12}{'F1':>8}")
+    for name, (outputs, seconds) in results.items():
+        scores = [word_f1(outputs[path], reference) for path, reference in references.items()]
+        f1 = f"{sum(scores) / len(scores):.3f}" if scores else "n/a"
+        avg_chars = sum(len(text) for text in outputs.values()) / len(outputs)
+        print(f"{name:<14}{seconds:>10.3f}{len(pages) / seconds:>10.1f}{total_mb / seconds:>10.2f}{avg_chars:>12.0f}{f1:>8}")
+
+
+if __name__ == "__main__":
+    main()
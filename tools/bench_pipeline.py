@@ -0,0 +1,166 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Offline end-to-end benchmark of the Analyze flow (app.py) and the three news_updated.py buttons.
+#
+#   python -m tools.bench_pipeline                      # compare against bench/baseline.json
+#   python -m tools.bench_pipeline --update-baseline    # record a new baseline
+#
+# Recorded organic_results, saved article HTML and canned LLM replies are served by
+# tools/stub_server.py, and SERPAPI_URL / OPENAI_BASE_URL point the real code at it. Caches
+# live in a temporary directory and are cleared before every iteration unless --warm is given.
+# Exits with status 1 when a flow's p50 latency or throughput regresses past --tolerance.
+
+FIXTURES = os.path.join("bench", "fixtures")
+BASELINE = os.path.join("bench", "baseline.json")
+QUERY = "sample news"
+API_KEY = "offline-benchmark"
+
+
+# Function to load the fixtures and start the stub server with article links pointing at it
+def start_fixture_server(fixtures):
+    from tools.stub_server import start_stub_server
+    with open(os.path.join(fixtures, "organic_results.json"), encoding="utf-8") as f:
+        recorded = json.load(f)
+    with open(os.path.join(fixtures, "llm_responses.json"), encoding="utf-8") as f:
+        answer = json.load(f)["answer"]
+    html_dir = os.path.join(fixtures, "html")
+    pages = sorted(os.path.basename(path) for path in glob.glob(os.path.join(html_dir, "*.html")))
+    server = start_stub_server(fixture=recorded, answer=answer, html_dir=html_dir)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    for result, page in zip(recorded["organic_results"], pages):
+        result["link"] = f"{base_url}/articles/{page}"
+    return server, base_url
+
+# Function to run a flow repeatedly and measure latency, throughput and peak traced memory
+def run_flow(flow, iterations, before_each):
+    from telemetry import percentile
+    latencies = []
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        before_each()
+        start = time.perf_counter()
+        flow()
+        latencies.append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "iterations": iterations,
+        "throughput": iterations / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "max": max(latencies),
+        "peak_mb": peak / (1024 * 1024),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the search, summarize and analyze flows.")
+    parser.add_argument("--fixtures", default=FIXTURES)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--num-results", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--flows", default="analyze,search,summarize,summarize_all")
+    parser.add_argument("--warm", action="store_true", help="Keep caches between iterations")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression before failing")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    server, base_url = start_fixture_server(args.fixtures)
+
+    # Point the real code paths at the stub before they are imported
+    os.environ["SERPAPI_URL"] = f"{base_url}/search"
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+    os.environ["SPOTLIGHT_CACHE_DIR"] = tempfile.mkdtemp(prefix="spotlight-bench-")
+    # Every article is served by the stub, so the per-host politeness limit would only measure itself
+    os.environ["SPOTLIGHT_RATE_PER_HOST"] = "0"
+
+    from cache import search_cache, article_cache, summary_cache
+    from semantic_cache import answer_cache
+    from analysis import run_analysis, format_answer_markdown, parse_answer
+    from cascade import AUTO_MODEL
+    from report import save_to_docx
+    from news import search_news, convert_relative_date, summarize_results, SUMMARY_MODEL
+    from digest import build_digest
+
+    def clear_caches():
+        if not args.warm:
+            for cache in (search_cache, article_cache, summary_cache, answer_cache):
+                cache.clear()
+
+    # The Analyze button's path: run_analysis with the app's default model, then render and export
+    def analyze():
+        result = run_analysis(QUERY, "", API_KEY, API_KEY, AUTO_MODEL)
+        tokens = parse_answer(result["answer"], result["citations"])
+        format_answer_markdown(result["answer"], result["citations"], tokens)
+        save_to_docx(result["answer"], result["citations"], tokens)
+
+    def search():
+        result_dict = search_news(QUERY, API_KEY, args.num_results)
+        for item in result_dict["organic_results"][:args.num_results]:
+            convert_relative_date(item.get("date", "No date available"))
+
+    def summarize(digest=False):
+        items = search_news(QUERY, API_KEY, args.num_results)["organic_results"][:args.num_results]
+        summaries = {}
+        for index, item, summary, error, done in summarize_results(items, API_KEY, 100, args.workers):
+            if error is not None:
+                raise error
+            summaries[index] = summary
+        if digest:
+            cited_summaries = [(f"[{n}]", summaries[index]) for n, index in enumerate(sorted(summaries), 1)]
+            build_digest(cited_summaries, API_KEY, SUMMARY_MODEL, 200)
+
+    flows = {
+        "analyze": analyze,
+        "search": search,
+        "summarize": summarize,
+        "summarize_all": lambda: summarize(digest=True),
+    }
+
+    results = {}
+    for name in args.flows.split(","):
+        results[name] = run_flow(flows[name], args.iterations, clear_caches)
+    server.shutdown()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'flow':<15}{'runs/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'peak MB':>9}  vs baseline")
+    for name, result in results.items():
+        comparison = ""
+        if name in baseline:
+            previous = baseline[name]
+            p50_change = result["p50"] / previous["p50"] - 1
+            throughput_change = result["throughput"] / previous["throughput"] - 1
+            comparison = f"p50 {p50_change:+.0%}, throughput {throughput_change:+.0%}"
+            if p50_change > args.tolerance or throughput_change < -args.tolerance:
+                regressions.append(name)
+                comparison += "  REGRESSION"
+        print(f"{name:<15}{result['throughput']:>9.2f}{result['p50'] * 1000:>9.1f}{result['p95'] * 1000:>9.1f}"
+              f"{result['max'] * 1000:>9.1f}{result['peak_mb']:>9.2f}  {comparison}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
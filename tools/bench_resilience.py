@@ -0,0 +1,89 @@
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Exercise the retry, backoff and circuit breaker layer (ratelimit.py) against the stub server.
+#
+#   python -m tools.bench_resilience --requests 40 --fail-rate 0.3
+#
+# Three phases, each with concurrent SerpAPI searches and OpenAI completions:
+#   flaky - the stub answers a share of requests with 429 and Retry-After; every call should succeed
+#   slow  - the stub answers slower than the read timeout; calls time out, retry, then the breaker opens
+#   down  - the stub is stopped; after a few connection errors the breaker fails calls fast
+
+
+# Function to run calls concurrently; returns per-call (seconds, error or None)
+def run_calls(calls, workers):
+    def timed_call(call):
+        start = time.perf_counter()
+        try:
+            call()
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(timed_call, calls))
+
+# Function to print one phase's outcome
+def report(phase, outcomes, before, after):
+    latencies = sorted(seconds for seconds, _ in outcomes)
+    errors = {}
+    for _, error in outcomes:
+        if error is not None:
+            errors[type(error).__name__] = errors.get(type(error).__name__, 0) + 1
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{phase:<6} calls {len(outcomes):>4}  ok {len(outcomes) - sum(errors.values()):>4}  "
+          f"retries {after['retries'] - before['retries']:>4}  breaker opened {after['breaker_opened'] - before['breaker_opened']:>2}  "
+          f"p50 {p50 * 1000:>7.1f} ms  p95 {p95 * 1000:>7.1f} ms  errors {errors or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise retries and circuit breakers against the stub server.")
+    parser.add_argument("--requests", type=int, default=40, help="Calls per provider and phase")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--fail-rate", type=float, default=0.3)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--read-timeout", type=float, default=0.5, help="Read timeout used for the slow phase")
+    args = parser.parse_args()
+
+    # Short timeouts and breaker reset so the slow and down phases finish quickly
+    os.environ["SPOTLIGHT_CACHE_DIR"] = tempfile.mkdtemp(prefix="spotlight-resilience-")
+    os.environ["SPOTLIGHT_READ_TIMEOUT"] = str(args.read_timeout)
+    os.environ["SPOTLIGHT_OPENAI_TIMEOUT"] = str(args.read_timeout)
+    os.environ["SPOTLIGHT_MAX_RETRIES"] = "4"
+    from tools.stub_server import start_stub_server
+    server = start_stub_server(fail_rate=args.fail_rate, retry_after=args.retry_after)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["SERPAPI_URL"] = f"{base_url}/search"
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+
+    from serpapi import serpapi_search
+    from resources import get_openai_client
+    from ratelimit import call_with_retry, limiter_stats, reset_breakers
+    client = get_openai_client("offline-benchmark")
+
+    def calls(phase):
+        searches = [lambda i=i: serpapi_search({"engine": "google", "q": f"{phase} query {i}", "num": 5}) for i in range(args.requests)]
+        completions = [lambda: call_with_retry("openai", lambda: client.chat.completions.create(
+            model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])) for _ in range(args.requests)]
+        return searches + completions
+
+    for phase in ("flaky", "slow", "down"):
+        if phase == "slow":
+            server.fail_rate = 0.0
+            server.delay = args.read_timeout * 2
+        elif phase == "down":
+            server.shutdown()
+            server.server_close()
+        reset_breakers()
+        before = limiter_stats()
+        outcomes = run_calls(calls(phase), args.workers)
+        report(phase, outcomes, before, limiter_stats())
+
+
+if __name__ == "__main__":
+    main()
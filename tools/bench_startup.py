@@ -0,0 +1,98 @@
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Cold-start benchmark of the Streamlit entry points (app.py and news_updated.py).
+#
+#   python -m tools.bench_startup --repeat 3
+#
+# Every measurement runs in a fresh interpreter, like the first request after a scale-out:
+#   import  - time to import the entry point's top-level modules
+#   first   - time until the first script run (the login form) has rendered, imports included,
+#             using Streamlit's AppTest with throwaway secrets
+#   rerun   - the same script run again in that process, as on every widget interaction
+# It also lists the heavy dependencies that were loaded by the time the login form rendered;
+# they should only be imported once a search, summarize or export action runs.
+
+ENTRY_POINTS = ("app.py", "news_updated.py")
+HEAVY_MODULES = ("langchain", "langchain_core", "langchain_community", "langchain_openai", "openai", "unstructured", "docx", "tiktoken")
+
+CREDENTIALS = """
+usernames:
+  bench:
+    email: bench@example.com
+    name: Bench User
+    password: not-a-real-password
+"""
+
+RENDER_SCRIPT = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+app.secrets["general"] = json.loads(sys.argv[2])
+started = time.perf_counter()
+app.run()
+first = time.perf_counter() - started
+started = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - started
+heavy = sorted(name for name in json.loads(sys.argv[3]) if name in sys.modules)
+errors = [element.value for element in app.exception]
+print(json.dumps({"first": first, "rerun": rerun, "heavy": heavy, "errors": errors}))
+"""
+
+
+# Function to list the module-level import statements of a script, as source lines
+def top_level_imports(path):
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+# Function to run a Python snippet in a fresh interpreter and return its last output line as JSON
+def run_fresh(args, env):
+    completed = subprocess.run([sys.executable, *args], capture_output=True, text=True, env=env, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+# Function to time the top-level imports of an entry point in a fresh interpreter
+def import_seconds(path, env):
+    script = "import json, time\nstarted = time.perf_counter()\n" + "\n".join(top_level_imports(path)) + \
+             "\nprint(json.dumps(time.perf_counter() - started))"
+    return run_fresh(["-c", script], env)
+
+# Function to compute a median
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time to first render of the entry points.")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per measurement; the median is reported")
+    parser.add_argument("entry_points", nargs="*", default=list(ENTRY_POINTS))
+    args = parser.parse_args()
+
+    # Caches, the job store and the watch database go to a throwaway directory
+    env = dict(os.environ, SPOTLIGHT_CACHE_DIR=tempfile.mkdtemp(prefix="spotlight-startup-"))
+    secrets = json.dumps({
+        "credentials": CREDENTIALS, "cookie_name": "bench", "cookie_key": "bench-key", "cookie_expiry_days": 1,
+        "OPENAI_API_KEY": "offline-benchmark", "SERPAPI_API_KEY": "offline-benchmark", "admins": [],
+    })
+
+    print(f"{'entry point':<18} {'import (s)':>10} {'first render (s)':>17} {'rerun (s)':>10}  heavy modules at first render")
+    for path in args.entry_points:
+        imports = [import_seconds(path, env) for _ in range(args.repeat)]
+        renders = [run_fresh(["-c", RENDER_SCRIPT, path, secrets, json.dumps(HEAVY_MODULES)], env) for _ in range(args.repeat)]
+        errors = renders[-1]["errors"]
+        print(f"{path:<18} {median(imports):>10.3f} {median([r['first'] for r in renders]):>17.3f} "
+              f"{median([r['rerun'] for r in renders]):>10.3f}  {', '.join(renders[-1]['heavy']) or '-'}")
+        if errors:
+            print(f"  script errors: {errors}")
+
+
+if __name__ == "__main__":
+    main()
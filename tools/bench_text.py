@@ -0,0 +1,93 @@
+import argparse
+import html
+import random
+import re
+import time
+from analysis import parse_answer, format_answer_markdown, clean_text
+
+# Microbenchmark of the answer post-processing (cleaning, citation links, Markdown layout).
+#
+#   python -m tools.bench_text --paragraphs 400 --citations 40
+#
+# Compares the single-pass tokenizer in analysis.py with a copy of the previous multi-pass
+# implementation on a generated answer and checks that both produce the same cleaned text.
+
+WORDS = "markets rallied after the central bank held rates steady while analysts expected further cuts".split()
+
+
+# Previous implementation: one regex pass per cleaning rule, one str.replace per citation
+def legacy_clean_text(text):
+    text = re.sub(r'\*+', '*', text)
+    text = re.sub(r'\.+', '.', text)
+    text = re.sub(r'\.(?=[A-Z])', '. ', text)
+    text = html.unescape(text)
+    text = re.sub(r'[^\w\s.,;:!?*\[\]()"-]', '', text)
+    return text
+
+def legacy_format_answer_markdown(answer, citations):
+    answer = legacy_clean_text(answer)
+    answer = re.sub(r'^\*\*Introduction\*\*\s*', '', answer, flags=re.MULTILINE)
+    parts = answer.split('\n\n', 1)
+    introduction = parts[0] if len(parts) > 1 else ""
+    main_content = parts[1] if len(parts) > 1 else parts[0]
+    for citation, link in citations.items():
+        introduction = introduction.replace(citation, f"[{citation}]({link})")
+        main_content = main_content.replace(citation, f"[{citation}]({link})")
+    return introduction, main_content
+
+# Function to generate an answer with paragraphs, citation markers and the usual LLM noise
+def make_answer(paragraphs, citations, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            words = rng.choices(WORDS, k=rng.randint(8, 20))
+            sentence = " ".join(words).capitalize()
+            if rng.random() < 0.2:
+                sentence = f"**{sentence}**"
+            if rng.random() < 0.2:
+                sentence += " &amp; more"
+            sentences.append(sentence + rng.choice([".", "..", "."]) + f" [{rng.randint(1, citations)}]")
+        lines.append("".join(sentences))
+    return "\n\n".join(lines)
+
+# Function to time fn over repeats and return the best run in milliseconds
+def best_ms(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark answer post-processing.")
+    parser.add_argument("--paragraphs", type=int, default=400)
+    parser.add_argument("--citations", type=int, default=40)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    answer = make_answer(args.paragraphs, args.citations)
+    citations = {f"[{i}]": f"https://example.com/article/{i}" for i in range(1, args.citations + 1)}
+
+    if clean_text(answer) != legacy_clean_text(answer):
+        raise SystemExit("clean_text differs from the previous implementation")
+
+    legacy = best_ms(lambda: legacy_format_answer_markdown(answer, citations), args.repeats)
+    tokenized = best_ms(lambda: format_answer_markdown(answer, citations), args.repeats)
+    reused = best_ms(lambda: format_answer_markdown(answer, citations, parse_answer(answer, citations)), args.repeats)
+    parse = best_ms(lambda: parse_answer(answer, citations), args.repeats)
+
+    print(f"answer: {len(answer):,} characters, {len(citations)} citations")
+    print(f"{'implementation':<30}{'best ms':>10}")
+    print(f"{'legacy multi-pass':<30}{legacy:>10.2f}")
+    print(f"{'single-pass tokenizer':<30}{tokenized:>10.2f}")
+    print(f"{'  parse only':<30}{parse:>10.2f}")
+    print(f"{'  render from parsed tokens':<30}{max(0.0, reused - parse):>10.2f}")
+    print(f"speedup: {legacy / tokenized:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
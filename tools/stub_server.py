@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-in for SerpAPI and the OpenAI chat completions API.
+#
+#   python -m tools.stub_server --port 8765
+#   SERPAPI_URL=http://127.0.0.1:8765/search OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run news_updated.py
+#
+# /search answers with canned organic_results (from --fixture, or generated from the
+# query). /articles/<file> serves saved article HTML from --html-dir. /v1/chat/completions answers with a canned reply, either in one response or as
+# server-sent event chunks when the request sets "stream": true; --model-answers gives some
+# models their own reply, so the model cascade's escalation can be exercised. Every request
+# is counted, in total and per endpoint (GET /stats), so cache hits can be observed from outside. To
+# exercise retries and circuit breakers, the server can delay every response and fail the
+# first --fail-first requests and then a random --fail-rate share of them with --fail-status
+# (429 by default), optionally with Retry-After.
+
+# Reply used by the fake chat completions endpoint
+DEFAULT_ANSWER = "Coverage is led by the first report [1], with further detail in [2] and follow-ups in [3]."
+
+
+# Function to generate deterministic organic results for a query
+def fake_organic_results(query, num):
+    return [
+        {
+            "position": i,
+            "title": f"{query} - story {i}",
+            "link": f"https://example.com/{'-'.join(query.split())}/{i}",
+            "snippet": f"Snippet {i} about {query}.",
+            "date": f"{i} hours ago",
+        }
+        for i in range(1, num + 1)
+    ]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Function to apply the configured delay and, if this request is chosen to fail, send the failure
+    def _inject_fault(self):
+        server = self.server
+        if server.delay:
+            time.sleep(server.delay)
+        with server.lock:
+            if server.fail_first > 0:
+                server.fail_first -= 1
+                fail = True
+            else:
+                fail = server.random.random() < server.fail_rate
+            if fail:
+                server.faults_injected += 1
+        if not fail:
+            return False
+        data = json.dumps({"error": {"message": "Injected failure", "type": "stub_error"}}).encode("utf-8")
+        self.send_response(server.fail_status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if server.retry_after is not None:
+            self.send_header("Retry-After", str(server.retry_after))
+        self.end_headers()
+        self.wfile.write(data)
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self._count(url.path)
+        if url.path != "/stats" and self._inject_fault():
+            return
+        if url.path == "/search":
+            if self.server.fixture is not None:
+                body = self.server.fixture
+            else:
+                body = {"organic_results": fake_organic_results(params.get("q", ""), int(params.get("num", 10)))}
+            self._send_json(200, body)
+        elif url.path.startswith("/articles/") and self.server.html_dir:
+            path = os.path.join(self.server.html_dir, os.path.basename(url.path))
+            if not os.path.isfile(path):
+                self._send_json(404, {"error": "not found"})
+                return
+            with open(path, "rb") as f:
+                data = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif url.path == "/stats":
+            with self.server.lock:
+                by_path = dict(self.server.path_counts)
+            self._send_json(200, {"requests": self.server.request_count, "faults": self.server.faults_injected, "by_path": by_path})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self._count(url.path)
+        if url.path != "/v1/chat/completions":
+            self._send_json(404, {"error": "not found"})
+            return
+        if self._inject_fault():
+            return
+        model = request.get("model", "stub")
+        answer = self.server.model_answers.get(model, self.server.answer)
+        # Words stand in for tokens in the reported usage
+        prompt_words = sum(len(str(message.get("content", "")).split()) for message in request.get("messages", []))
+        if not request.get("stream"):
+            time.sleep(self.server.token_delay * len(answer.split()))
+            self._send_json(200, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_words, "completion_tokens": len(answer.split()),
+                          "total_tokens": prompt_words + len(answer.split())},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        words = answer.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.server.token_delay)
+            self._send_event(model, {"content": word if i == 0 else " " + word}, None)
+        self._send_event(model, {}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    # Function to count a request, in total and per endpoint (/articles/<file> counts as /articles)
+    def _count(self, path):
+        if path.startswith("/articles/"):
+            path = "/articles"
+        with self.server.lock:
+            self.server.request_count += 1
+            self.server.path_counts[path] = self.server.path_counts.get(path, 0) + 1
+
+    def _send_event(self, model, delta, finish_reason):
+        chunk = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Clients that gave up on a delayed response (timeouts) are expected; don't print their tracebacks
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+# Function to start the stub server on a background thread; returns the server (use server.shutdown() to stop)
+def start_stub_server(port=0, fixture=None, answer=DEFAULT_ANSWER, token_delay=0.0, html_dir=None,
+                      delay=0.0, fail_rate=0.0, fail_first=0, fail_status=429, retry_after=None, seed=0, model_answers=None):
+    server = StubServer(("127.0.0.1", port), StubHandler)
+    server.html_dir = html_dir
+    server.lock = threading.Lock()
+    server.request_count = 0
+    server.path_counts = {}
+    server.fixture = fixture
+    server.answer = answer
+    server.model_answers = dict(model_answers or {})
+    server.token_delay = token_delay
+    server.delay = delay
+    server.fail_rate = fail_rate
+    server.fail_first = fail_first
+    server.fail_status = fail_status
+    server.retry_after = retry_after
+    server.random = random.Random(seed)
+    server.faults_injected = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local SerpAPI / OpenAI stub server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixture", help="JSON file returned verbatim for every /search request")
+    parser.add_argument("--answer", default=DEFAULT_ANSWER, help="Reply returned by /v1/chat/completions")
+    parser.add_argument("--model-answers", help="JSON file mapping model names to their own reply")
+    parser.add_argument("--token-delay", type=float, default=0.05, help="Seconds between streamed words")
+    parser.add_argument("--html-dir", help="Directory of saved article pages served under /articles/")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds added before every response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with --fail-status")
+    parser.add_argument("--fail-first", type=int, default=0, help="Number of first requests that fail")
+    parser.add_argument("--fail-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds sent with injected failures")
+    args = parser.parse_args()
+    fixture = None
+    if args.fixture:
+        with open(args.fixture, encoding="utf-8") as f:
+            fixture = json.load(f)
+    model_answers = None
+    if args.model_answers:
+        with open(args.model_answers, encoding="utf-8") as f:
+            model_answers = json.load(f)
+    server = start_stub_server(args.port, fixture, args.answer, args.token_delay, args.html_dir,
+                               args.delay, args.fail_rate, args.fail_first, args.fail_status, args.retry_after,
+                               model_answers=model_answers)
+    print(f"Stub listening on http://127.0.0.1:{server.server_address[1]} (/search, /articles/, /v1/chat/completions)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from cache import CACHE_DIR
+from dedupe import normalize_url, TitleIndex
+from digest import TokenUsage, update_digest
+from jobs import register_job_handler, submit_job, JobLimitError
+from news import search_news, summarize_results, convert_relative_date, ARTICLE_SUMMARY_MODEL
+from cascade import decision_line
+
+# Watched topics: saved queries that are polled on a schedule.
+#
+# Every poll searches the topic again and diffs the results against the topic's seen-URL
+# index, skipping links whose normalized URL was seen before and titles that are near
+# duplicates of seen ones (the same story syndicated under another URL). Only the new articles
+# are fetched and summarized, and they are folded into the topic's rolling digest instead of
+# rebuilding it. A scheduler thread (one per process) queues due polls as "watch_poll" jobs,
+# so they show up in the jobs panel; `python watch.py` polls due topics once, e.g. from cron.
+
+WATCH_DB = os.path.join(CACHE_DIR, "watch.sqlite3")
+SCHEDULER_TICK_SECONDS = 30
+# Number of most recently seen titles compared against new ones for near duplicates
+TITLE_WINDOW = 2000
+
+# Poll intervals offered in the UI
+WATCH_INTERVALS = {
+    "15 minutes": 15 * 60,
+    "hour": 60 * 60,
+    "3 hours": 3 * 60 * 60,
+    "day": 24 * 60 * 60,
+}
+
+_local = threading.local()
+_topic_locks = defaultdict(threading.Lock)
+_topic_locks_lock = threading.Lock()
+_scheduler = [None]
+_scheduler_lock = threading.Lock()
+
+
+# Function to get this thread's connection to the watch database
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(WATCH_DB), exist_ok=True)
+        conn = sqlite3.connect(WATCH_DB, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.row_factory = sqlite3.Row
+        _local.conn = conn
+    return conn
+
+def _init_db():
+    with _connect() as conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS topics ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT NOT NULL, query TEXT NOT NULL, params TEXT NOT NULL, "
+            "interval REAL NOT NULL, created REAL NOT NULL, last_polled REAL, next_poll REAL NOT NULL, "
+            "digest TEXT, refs TEXT NOT NULL DEFAULT '[]', new_items INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS topics_next_poll ON topics (next_poll)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            "topic_id INTEGER NOT NULL, url_key TEXT NOT NULL, link TEXT NOT NULL, title TEXT NOT NULL, "
+            "date TEXT, summary TEXT, first_seen REAL NOT NULL, PRIMARY KEY (topic_id, url_key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS seen_topic_first_seen ON seen (topic_id, first_seen)")
+
+def _row_to_topic(row):
+    topic = dict(row)
+    topic["params"] = json.loads(topic["params"])
+    topic["references"] = json.loads(topic.pop("refs"))
+    return topic
+
+def _topic_lock(topic_id):
+    with _topic_locks_lock:
+        return _topic_locks[topic_id]
+
+
+# Function to save a topic for user; params holds num_results, word_count, max_workers, extractor and engines
+def add_topic(user, query, interval, params):
+    now = time.time()
+    with _connect() as conn:
+        cursor = conn.execute(
+            "INSERT INTO topics (user, query, params, interval, created, next_poll) VALUES (?, ?, ?, ?, ?, ?)",
+            (user, query, json.dumps(params), interval, now, now)
+        )
+    return cursor.lastrowid
+
+# Function to delete one of user's topics and its seen index
+def remove_topic(user, topic_id):
+    with _connect() as conn:
+        if conn.execute("DELETE FROM topics WHERE id = ? AND user = ?", (topic_id, user)).rowcount:
+            conn.execute("DELETE FROM seen WHERE topic_id = ?", (topic_id,))
+
+# Function to fetch one topic by ID, or None
+def get_topic(topic_id):
+    row = _connect().execute("SELECT * FROM topics WHERE id = ?", (topic_id,)).fetchone()
+    return _row_to_topic(row) if row is not None else None
+
+# Function to list a user's topics, oldest first
+def list_topics(user):
+    rows = _connect().execute("SELECT * FROM topics WHERE user = ? ORDER BY created", (user,)).fetchall()
+    return [_row_to_topic(row) for row in rows]
+
+
+# Function to split search results into new items and the number skipped as already seen
+def diff_results(topic_id, items):
+    conn = _connect()
+    seen_keys = {row[0] for row in conn.execute("SELECT url_key FROM seen WHERE topic_id = ?", (topic_id,))}
+    titles = TitleIndex()
+    for row in conn.execute("SELECT title FROM seen WHERE topic_id = ? ORDER BY first_seen DESC LIMIT ?", (topic_id, TITLE_WINDOW)):
+        titles.add(row[0])
+    new_items, skipped = [], 0
+    for item in items:
+        key = normalize_url(item["link"])
+        if key in seen_keys or titles.find(item.get("title", "")) is not None:
+            skipped += 1
+            continue
+        # Also catches duplicates within the same batch of results
+        seen_keys.add(key)
+        titles.add(item.get("title", ""))
+        new_items.append(item)
+    return new_items, skipped
+
+# Function to poll a topic: search, summarize only unseen articles and update the rolling digest.
+# Returns a result shaped like news.run_summarize's, with only the new articles.
+def poll_topic(topic_id, secrets, progress=None):
+    progress = progress or (lambda fraction, message=None: None)
+    with _topic_lock(topic_id):
+        topic = get_topic(topic_id)
+        if topic is None:
+            raise ValueError(f"No watched topic with ID {topic_id}")
+        params = topic["params"]
+        progress(0.05, "Searching")
+        result_dict = search_news(topic["query"], secrets["serpapi_api_key"], params["num_results"], params.get("engines"))
+        items = result_dict.get("organic_results", [])[:params["num_results"]]
+        new_items, skipped = diff_results(topic_id, items)
+
+        usage = TokenUsage()
+        articles = [None] * len(new_items)
+        finished = 0
+        progress(0.1, f"{len(new_items)} new articles, {skipped} already seen")
+        for index, item, summary, error, done in summarize_results(new_items, secrets["openai_api_key"], params["word_count"],
+                                                                   params["max_workers"], extractor=params["extractor"], usage=usage,
+                                                                   model=params.get("model", ARTICLE_SUMMARY_MODEL)):
+            raw_date = item.get('date', 'No date available')
+            exact_date = convert_relative_date(raw_date)
+            articles[index] = {
+                "title": item['title'],
+                "link": item['link'],
+                "date": f"{raw_date} ({exact_date})" if exact_date else raw_date,
+                "summary": summary,
+                "error": str(error) if error is not None else None,
+            }
+            finished += 1
+            progress(0.1 + 0.8 * finished / len(new_items), f"Summarized {finished} of {len(new_items)} new articles")
+
+        # Failed articles are not marked as seen, so the next poll tries them again
+        succeeded = [article for article in articles if not article["error"]]
+        references = topic["references"]
+        cited_summaries = [(f"[{len(references) + n}]", article["summary"]) for n, article in enumerate(succeeded, 1)]
+        digest = topic["digest"]
+        routing = {}
+        if cited_summaries:
+            progress(0.9, "Updating the digest")
+            # The digest covers several articles, so it gets twice the per-article length
+            digest = update_digest(digest, cited_summaries, secrets["openai_api_key"], params.get("model", ARTICLE_SUMMARY_MODEL),
+                                   params["word_count"] * 2, usage, routing=routing)
+            references = references + [article["link"] for article in succeeded]
+
+        now = time.time()
+        with _connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO seen (topic_id, url_key, link, title, date, summary, first_seen) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(topic_id, normalize_url(article["link"]), article["link"], article["title"], article["date"], article["summary"], now)
+                 for article in succeeded]
+            )
+            conn.execute(
+                "UPDATE topics SET digest = ?, refs = ?, new_items = ?, last_polled = ?, next_poll = ? WHERE id = ?",
+                (digest, json.dumps(references), len(succeeded), now, now + topic["interval"], topic_id)
+            )
+    return {"query": topic["query"], "articles": articles, "digest": digest, "references": references,
+            "skipped": skipped, "usage": usage.summary_line(), "routing": decision_line(routing) if routing else None}
+
+# Function to claim every due topic and hand it to poll(topic); returns the number claimed.
+# The claim moves next_poll forward first, so two processes never poll the same topic at once.
+def claim_due_topics(poll):
+    now = time.time()
+    claimed = 0
+    for row in _connect().execute("SELECT * FROM topics WHERE next_poll <= ?", (now,)).fetchall():
+        with _connect() as conn:
+            if not conn.execute("UPDATE topics SET next_poll = ? WHERE id = ? AND next_poll <= ?",
+                                (now + row["interval"], row["id"], now)).rowcount:
+                continue
+        claimed += 1
+        poll(_row_to_topic(row))
+    return claimed
+
+# Function to queue polls of due topics as background jobs
+def submit_due_topics(secrets):
+    def submit(topic):
+        try:
+            submit_job(topic["user"], "watch_poll", {"topic_id": topic["id"], "query": topic["query"]}, secrets)
+        except JobLimitError:
+            # The user is busy; try again on a later tick
+            with _connect() as conn:
+                conn.execute("UPDATE topics SET next_poll = ? WHERE id = ?", (time.time() + SCHEDULER_TICK_SECONDS, topic["id"]))
+
+    return claim_due_topics(submit)
+
+# Function to start the scheduler thread of this process (once); secrets are the API keys used for polls
+def start_watch_scheduler(secrets):
+    def loop():
+        while True:
+            try:
+                submit_due_topics(secrets)
+            except Exception as e:
+                logging.error(f"Watch scheduler failed: {e}", exc_info=True)
+            time.sleep(SCHEDULER_TICK_SECONDS)
+
+    with _scheduler_lock:
+        if _scheduler[0] is None:
+            _scheduler[0] = threading.Thread(target=loop, name="watch-scheduler", daemon=True)
+            _scheduler[0].start()
+
+
+register_job_handler("watch_poll", lambda params, secrets, progress: poll_topic(params["topic_id"], secrets, progress))
+_init_db()
+
+
+if __name__ == "__main__":
+    from batch import load_secrets
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    secrets = load_secrets()
+
+    def poll_now(topic):
+        try:
+            result = poll_topic(topic["id"], secrets)
+            logging.info(f"Topic {topic['id']} ({topic['query']}): {len(result['articles'])} new, {result['skipped']} already seen")
+        except Exception as e:
+            logging.error(f"Topic {topic['id']} ({topic['query']}) failed: {e}", exc_info=True)
+
+    logging.info(f"Polled {claim_due_topics(poll_now)} due topics")